@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark the SGT and SGACL name resolution of egress matrix cells in
+`ise_trustsec_export.create_trustsec_egress_policies_by_name()` against the
+previous per-row `.loc` lookups.
+
+Examples:
+    bench_egress_policies_by_name.py
+    bench_egress_policies_by_name.py --cells 1000 10000 100000
+    bench_egress_policies_by_name.py --no-legacy --cells 1000000
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+import uuid
+import pandas as pd
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ise_trustsec_export import create_trustsec_egress_policies_by_name
+
+SGACL_COUNT = 50
+MULTI_SGACL_RATIO = 0.2     # ratio of cells with 2-3 SGACLs
+
+
+def legacy_egress_policies_by_name (df_sgts, df_sgacls, matrix) :
+    """
+    The previous name resolution with a `.loc` lookup per row and per SGACL.
+    """
+    df = pd.DataFrame(matrix)
+    df['SrcSGT'] = df['sourceSgtId'].map(lambda id: df_sgts.loc[id,'name'])
+    df['DstSGT'] = df['destinationSgtId'].map(lambda id: df_sgts.loc[id,'name'])
+    df['SGACLs'] = df['sgacls'].map(lambda l: [ df_sgacls.loc[id,'name'] for id in l ])
+    return df
+
+
+def synthetic_trustsec (cells:int, sgt_count:int=None, seed:int=0) :
+    """
+    Returns (df_sgts, df_sgacls, matrix) with `cells` random egress cells between `sgt_count` SGTs.
+    @cells : the number of egress cells
+    @sgt_count : the number of SGTs. Default: the fewest SGTs for the cells
+    @seed : the random seed for repeatable data
+    """
+    rng = random.Random(seed)
+    sgt_count = sgt_count or math.isqrt(cells - 1) + 1
+    df_sgts = pd.DataFrame([ {'id':str(uuid.UUID(int=rng.getrandbits(128))), 'name':f"SGT_{i}", 'value':i+3, 'description':f"SGT {i}"} for i in range(sgt_count) ]).set_index('id')
+    df_sgacls = pd.DataFrame([ {'id':str(uuid.UUID(int=rng.getrandbits(128))), 'name':f"SGACL_{i}"} for i in range(SGACL_COUNT) ]).set_index('id')
+    sgt_ids = df_sgts.index.tolist()
+    sgacl_ids = df_sgacls.index.tolist()
+    matrix = []
+    for i in sorted(rng.sample(range(sgt_count * sgt_count), cells)) :
+        (src, dst) = (sgt_ids[i // sgt_count], sgt_ids[i % sgt_count])
+        matrix.append({
+            'id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'name': f"{src[:8]}-{dst[:8]}",
+            'description': '',
+            'sourceSgtId': src,
+            'destinationSgtId': dst,
+            'matrixCellStatus': 'ENABLED',
+            'defaultRule': 'NONE',
+            'sgacls': rng.sample(sgacl_ids, rng.choice([2,3]) if rng.random() < MULTI_SGACL_RATIO else 1),
+        })
+    return (df_sgts, df_sgacls, matrix)
+
+
+def timed (func, *args) :
+    """
+    Returns the seconds to run `func(*args)` once.
+    """
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    """
+    Entrypoint for local script.
+    """
+    argp = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument('-c', '--cells', type=int, nargs='+', default=[100, 1000, 10000, 100000], help='egress cell counts')
+    argp.add_argument('--no-legacy', action='store_true', default=False, help='skip the legacy per-row lookups')
+    args = argp.parse_args()
+
+    rows = []
+    for cells in args.cells :
+        (df_sgts, df_sgacls, matrix) = synthetic_trustsec(cells)
+        row = {'cells':cells, 'sgts':len(df_sgts), 'vectorized (s)':timed(create_trustsec_egress_policies_by_name, df_sgts, df_sgacls, matrix)}
+        if not args.no_legacy :
+            row['legacy (s)'] = timed(legacy_egress_policies_by_name, df_sgts, df_sgacls, matrix)
+            row['speedup'] = row['legacy (s)'] / row['vectorized (s)']
+        rows.append(row)
+    print(tabulate(rows, headers='keys', tablefmt='simple_grid', floatfmt='.3f'))
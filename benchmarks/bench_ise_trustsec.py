@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+
+End-to-end benchmark of the ISE TrustSec export, import, sync, and clear
+against the local mock ISE ERS server in `mock_ise_ers.py`.
+
+Each scenario runs against a fresh mock seeded by `generate_trustsec.py` with
+a synthetic matrix of `size` egress cells. The import and sync scenarios load the workbook written
+by the export of the same size into an ISE with only the reserved objects.
+The wall-clock time, requests, throughput, retries, and rejected requests of
+every run are shown and saved as JSON to compare across versions.
+
+Examples:
+    bench_ise_trustsec.py
+    bench_ise_trustsec.py --sizes 100 1000 --scenarios export clear
+    bench_ise_trustsec.py --latency 0.02 --jitter 0.01 --connections 10 --adaptive
+    bench_ise_trustsec.py --rate-limit 200 --max-connections 20 --bulk
+    bench_ise_trustsec.py --label my_change --output my_change.json
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from tabulate import tabulate
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+import excel_trustsec_matrix_to_ise
+import ise_trustsec_clear
+import ise_trustsec_export
+from ise_ers import ISEERS, RETRY_ATTEMPTS, TCP_CONNECTIONS
+from mock_ise_ers import MockISE, MOCK_HOST
+from generate_trustsec import generate_trustsec
+
+BENCH_SIZES = [100, 1000, 10000, 100000]    # egress cells
+BENCH_SCENARIOS = ['export', 'import', 'sync', 'clear']
+BENCH_PORT = 9061
+BENCH_OUTPUT = 'bench_ise_trustsec.json'
+BENCH_FILENAME = 'bench'    # export filename prefix in the work directory
+
+
+def seed_mock (mock, cells:int, seed:int=0) -> dict :
+    """
+    Add a synthetic matrix with `cells` egress cells to the mock and return the object counts.
+    """
+    fixtures = generate_trustsec(math.isqrt(cells - 1) + 1, cells=cells, seed=seed)
+    mock.load_fixtures(fixtures)
+    return { 'sgts':mock.count('sgt'), 'sgacls':mock.count('sgacl'), 'cells':mock.count('egressmatrixcell') }
+
+
+async def run_scenario (scenario:str, size:int, workdir:str, args) -> dict :
+    """
+    Run one scenario against a fresh mock ISE and return its result dict.
+    @scenario : one of BENCH_SCENARIOS
+    @size : the number of egress cells
+    @workdir : the directory for the exported and imported workbook
+    @args : the benchmark options
+    """
+    mock = MockISE(latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit, max_connections=args.max_connections)
+    counts = seed_mock(mock, size) if scenario in ['export', 'clear'] else { k:0 for k in ['sgts', 'sgacls', 'cells'] }
+    workbook = os.path.join(workdir, f"{BENCH_FILENAME}_matrix.xlsx")
+
+    ise_trustsec_export.DATA_DIR = workdir + os.sep
+    ise_trustsec_export.args = argparse.Namespace(verbose=0, sort='name', filename=BENCH_FILENAME, constant_memory=False, formats=ise_trustsec_export.OUTPUT_FORMATS_DEFAULT,
+                                                  output='auto', window=ise_trustsec_export.OUTPUT_WINDOW, window_from=None)
+    excel_trustsec_matrix_to_ise.args = argparse.Namespace(verbose=0, bulk=args.bulk, sync=(scenario == 'sync'))
+    scenarios = {
+        'export' : lambda ise: ise_trustsec_export.ise_trustsec_export(ise),
+        'import' : lambda ise: excel_trustsec_matrix_to_ise.excel_trustsec_matrix_to_ise(ise, *excel_trustsec_matrix_to_ise.read_workbook(workbook)),
+        'sync'   : lambda ise: excel_trustsec_matrix_to_ise.sync_trustsec_matrix_to_ise(ise, workbook),
+        'clear'  : lambda ise: ise_trustsec_clear.ise_trustsec_clear(ise, bulk=args.bulk),
+    }
+
+    runner = await mock.start(MOCK_HOST, args.port)
+    ise = ISEERS(MOCK_HOST, 'admin', 'admin', base_url=f"http://{MOCK_HOST}:{args.port}",
+                 connections=args.connections, adaptive=args.adaptive, retries=args.retries)
+    try :
+        async with ise :
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull) :
+                start = time.perf_counter()
+                await scenarios[scenario](ise)
+                seconds = time.perf_counter() - start
+    finally :
+        await runner.cleanup()
+
+    if scenario in ['import', 'sync'] :
+        counts = { 'sgts':mock.count('sgt'), 'sgacls':mock.count('sgacl'), 'cells':mock.count('egressmatrixcell') }
+    verified = {
+        'export' : os.path.exists(workbook),
+        'import' : counts['cells'] == size,
+        'sync'   : counts['cells'] == size,
+        'clear'  : sum(mock.count(resource) for resource in ['sgt', 'sgacl', 'egressmatrixcell']) == 0,
+    }[scenario]
+    requests = sum(mock.requests.values())
+    objects = sum(counts.values())
+    return {
+        'scenario'   : scenario,
+        'size'       : size,
+        **counts,
+        'seconds'    : round(seconds, 3),
+        'requests'   : requests,
+        'requests/s' : round(requests / seconds, 1),
+        'objects/s'  : round(objects / seconds, 1),
+        'retries'    : ise.retried,
+        'rejected'   : sum(mock.rejected.values()),
+        'in_flight'  : mock.high_water,
+        'verified'   : verified,
+    }
+
+
+def git_version () -> str :
+    """
+    Returns the `git describe` of the repository or '' when unavailable.
+    """
+    try :
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_DIR, capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError) :
+        return ''
+
+
+async def main () :
+    """
+    Entrypoint for local script.
+    """
+    argp = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument('-s', '--sizes', type=int, nargs='+', default=BENCH_SIZES, help='egress cell counts')
+    argp.add_argument('-S', '--scenarios', nargs='+', choices=BENCH_SCENARIOS, default=BENCH_SCENARIOS, help='scenarios to run')
+    argp.add_argument('-a', '--adaptive', action='store_true', default=False, help='adapt the ISE request concurrency')
+    argp.add_argument('-b', '--bulk', action='store_true', default=False, help='use the ISE ERS Bulk API for import and clear')
+    argp.add_argument('-c', '--connections', type=int, default=TCP_CONNECTIONS, help='ISE client connections')
+    argp.add_argument('-r', '--retries', type=int, default=RETRY_ATTEMPTS, help='retries for transient ISE errors')
+    argp.add_argument('-l', '--latency', type=float, default=0, help='mock ISE seconds to delay every response')
+    argp.add_argument('-j', '--jitter', type=float, default=0, help='mock ISE maximum random seconds added to the latency')
+    argp.add_argument('--rate-limit', type=float, default=None, help='mock ISE maximum requests per second')
+    argp.add_argument('--max-connections', type=int, default=None, help='mock ISE maximum concurrent requests')
+    argp.add_argument('-p', '--port', type=int, default=BENCH_PORT, help='mock ISE port')
+    argp.add_argument('--label', default='', help='a label for this run in the results')
+    argp.add_argument('-o', '--output', default=BENCH_OUTPUT, help='JSON results filename')
+    args = argp.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir :
+        for size in args.sizes :
+            if set(args.scenarios) & {'import', 'sync'} and 'export' not in args.scenarios :
+                await run_scenario('export', size, workdir, args)  # the workbook to import
+            for scenario in [ s for s in BENCH_SCENARIOS if s in args.scenarios ] :
+                result = await run_scenario(scenario, size, workdir, args)
+                print(f"{'✔' if result['verified'] else '❌'} {scenario} {size}: {result['seconds']}s", file=sys.stderr)
+                results.append(result)
+
+    print(tabulate(results, headers='keys', tablefmt='simple_grid', floatfmt='.3f'))
+    report = {
+        'benchmark' : 'bench_ise_trustsec',
+        'label'     : args.label,
+        'version'   : git_version(),
+        'time'      : datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python'    : platform.python_version(),
+        'platform'  : platform.platform(),
+        'options'   : { k:v for k,v in vars(args).items() if k != 'output' },
+        'results'   : results,
+    }
+    with open(args.output, 'w') as fh :
+        json.dump(report, fh, indent=2)
+    print(f"ⓘ Results: {args.output}")
+
+
+if __name__ == '__main__':
+    """
+    Entrypoint for local script.
+    """
+    asyncio.run(main())
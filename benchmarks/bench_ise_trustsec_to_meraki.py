@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+
+End-to-end benchmark of the ISE to Meraki Adaptive Policy sync with action
+batches against the local mock ISE in `mock_ise_ers.py` and the local mock
+Dashboard in `mock_meraki_dashboard.py`.
+
+Each run syncs a synthetic matrix of `size` egress cells from `generate_trustsec.py`
+into new organizations with only the default groups and then syncs again to
+verify that nothing is left to change. Batch sizes are compared with the
+automatic size from `action_batch_size()` as `auto`. The wall-clock time,
+Dashboard requests, action batches, and `429` responses of every run are shown
+and saved as JSON to compare across versions.
+
+Examples:
+    bench_ise_trustsec_to_meraki.py
+    bench_ise_trustsec_to_meraki.py --sizes 100 1000 --batch-sizes 0 20 100
+    bench_ise_trustsec_to_meraki.py --orgs 3 --batch-latency 0.005 --org-rate 10
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import math
+import os
+import platform
+import sys
+import time
+from tabulate import tabulate
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_DIR)
+import ise_trustsec_to_meraki
+from ise_ers import ISEERS
+from meraki_dashboard import ACTION_BATCH_CONCURRENCY, MERAKI_ORG_RATE, OrgRateLimiter, dashboard_from_env
+from mock_ise_ers import MockISE, MOCK_HOST
+from mock_meraki_dashboard import MockDashboard, MOCK_BASE_PATH, MOCK_ORG_RATE
+from bench_ise_trustsec import git_version
+from generate_trustsec import generate_trustsec
+
+BENCH_SIZES = [100, 1000, 10000]    # egress cells
+BENCH_BATCH_SIZES = [0, 20, 100]    # actions per batch; 0 is automatic
+BENCH_ISE_PORT = 9062
+BENCH_MERAKI_PORT = 9083
+BENCH_OUTPUT = 'bench_ise_trustsec_to_meraki.json'
+
+
+async def run_sync (size:int, batch_size:int, args) -> dict :
+    """
+    Sync a synthetic matrix into fresh mock organizations twice and return the result dict.
+    @size : the number of egress cells
+    @batch_size : the maximum actions per batch or 0 for the automatic size
+    @args : the benchmark options
+    """
+    ise_mock = MockISE()
+    ise_mock.load_fixtures(generate_trustsec(math.isqrt(size - 1) + 1, cells=size))
+    dashboard_mock = MockDashboard(latency=args.latency, org_rate=args.org_rate, batch_latency=args.batch_latency)
+    orgs = [ {'id':dashboard_mock.add_organization(f"bench_{i}"), 'name':f"bench_{i}"} for i in range(args.orgs) ]
+    ise_trustsec_to_meraki.args = argparse.Namespace(dry_run=False, batch_size=batch_size or None, batches=args.batches, verbose=0)
+
+    runners = [ await ise_mock.start(MOCK_HOST, args.ise_port), await dashboard_mock.start(MOCK_HOST, args.meraki_port) ]
+    try :
+        async with ISEERS(MOCK_HOST, 'admin', 'admin', base_url=f"http://{MOCK_HOST}:{args.ise_port}") as ise, \
+                   dashboard_from_env({'MERAKI_DASHBOARD_API_KEY':'0' * 40, 'MERAKI_BASE_URL':f"http://{MOCK_HOST}:{args.meraki_port}{MOCK_BASE_PATH}"}) as dashboard :
+            limiter = OrgRateLimiter(args.rate)
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull) :
+                start = time.perf_counter()
+                failed = await ise_trustsec_to_meraki.ise_trustsec_to_meraki(ise, dashboard, limiter, orgs)
+                seconds = time.perf_counter() - start
+                (requests, batches) = (sum(dashboard_mock.requests.values()), len(dashboard_mock.batches))
+                (actions, rejected, running) = (sum(dashboard_mock.batch_actions.values()), sum(dashboard_mock.rejected.values()), dashboard_mock.batch_high_water)
+                dashboard_mock.reset_stats()
+                failed += await ise_trustsec_to_meraki.ise_trustsec_to_meraki(ise, dashboard, limiter, orgs)
+                changes = sum(dashboard_mock.batch_actions.values())
+    finally :
+        for runner in runners :
+            await runner.cleanup()
+
+    policies = sum(len(dashboard_mock.adaptive_policy[org['id']]['policies']) for org in orgs)
+    return {
+        'size'       : size,
+        'orgs'       : args.orgs,
+        'batch size' : batch_size or 'auto',
+        'seconds'    : round(seconds, 3),
+        'requests'   : requests,
+        'batches'    : batches,
+        'actions'    : actions,
+        'actions/s'  : round(actions / seconds, 1),
+        'rejected'   : rejected,
+        'running'    : running,
+        'failed'     : failed,
+        'verified'   : failed == 0 and changes == 0 and policies > 0,
+    }
+
+
+async def main () :
+    """
+    Entrypoint for local script.
+    """
+    argp = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument('-s', '--sizes', type=int, nargs='+', default=BENCH_SIZES, help='egress cell counts')
+    argp.add_argument('-B', '--batch-sizes', type=int, nargs='+', default=BENCH_BATCH_SIZES, help='actions per batch; 0 is automatic')
+    argp.add_argument('--batches', type=int, default=ACTION_BATCH_CONCURRENCY, help='maximum running action batches per organization')
+    argp.add_argument('-O', '--orgs', type=int, default=1, help='organizations synced concurrently')
+    argp.add_argument('--rate', type=float, default=MERAKI_ORG_RATE, help='client requests per second per organization')
+    argp.add_argument('-l', '--latency', type=float, default=0, help='mock Dashboard seconds to delay every response')
+    argp.add_argument('--org-rate', type=float, default=MOCK_ORG_RATE, help='mock Dashboard requests per second per organization before 429')
+    argp.add_argument('--batch-latency', type=float, default=0.001, help='mock Dashboard seconds to run each action')
+    argp.add_argument('--ise-port', type=int, default=BENCH_ISE_PORT, help='mock ISE port')
+    argp.add_argument('--meraki-port', type=int, default=BENCH_MERAKI_PORT, help='mock Dashboard port')
+    argp.add_argument('--label', default='', help='a label for this run in the results')
+    argp.add_argument('-o', '--output', default=BENCH_OUTPUT, help='JSON results filename')
+    args = argp.parse_args()
+
+    results = []
+    for size in args.sizes :
+        for batch_size in args.batch_sizes :
+            result = await run_sync(size, batch_size, args)
+            print(f"{'✔' if result['verified'] else '❌'} sync {size} batch size {result['batch size']}: {result['seconds']}s", file=sys.stderr)
+            results.append(result)
+
+    print(tabulate(results, headers='keys', tablefmt='simple_grid', floatfmt='.3f'))
+    report = {
+        'benchmark' : 'bench_ise_trustsec_to_meraki',
+        'label'     : args.label,
+        'version'   : git_version(),
+        'time'      : datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python'    : platform.python_version(),
+        'platform'  : platform.platform(),
+        'options'   : { k:v for k,v in vars(args).items() if k != 'output' },
+        'results'   : results,
+    }
+    with open(args.output, 'w') as fh :
+        json.dump(report, fh, indent=2)
+    print(f"ⓘ Results: {args.output}")
+
+
+if __name__ == '__main__':
+    """
+    Entrypoint for local script.
+    """
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark the TrustSec matrix construction in
+`ise_trustsec_export.create_trustsec_matrix()` against the previous
+column-per-SGT loop with a `.at` write per egress cell.
+
+Examples:
+    bench_trustsec_matrix.py
+    bench_trustsec_matrix.py --sgts 100 500 1000 --density 0.25
+    bench_trustsec_matrix.py --no-legacy --sgts 2000
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import argparse
+import os
+import sys
+import warnings
+import pandas as pd
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ise_trustsec_export import create_trustsec_egress_policies_by_name, create_trustsec_matrix
+from bench_egress_policies_by_name import synthetic_trustsec, timed
+
+LEGACY_SGTS_MAX = 1000  # the legacy loop takes many seconds beyond this
+
+
+def legacy_trustsec_matrix (df_sgts, df_policies, sort='name') :
+    """
+    The previous matrix construction with one inserted column per SGT and one `.at` write per cell.
+    """
+    warnings.simplefilter('ignore', pd.errors.PerformanceWarning)  # the fragmentation is what is measured
+    df_matrix = df_sgts.drop(df_sgts[df_sgts['name'] == 'ANY'].index)
+    df_matrix.sort_values(sort, inplace=True)
+    df_matrix = df_matrix[['name', 'value', 'description']]
+    df_matrix.rename(columns={'name':'SGT','value':'Value','description':'Description'}, inplace=True)
+    for column in df_matrix['SGT'] :
+        df_matrix[column] = ""
+    df_matrix.set_index('SGT', inplace=True)
+    for row in df_policies.to_dict('records') :
+        if row['SrcSGT'] == 'ANY' :
+            pass
+        elif len(row['SGACLs']) > 0 :
+            df_matrix.at[row['SrcSGT'], row['DstSGT']] = row['SGACLs']
+        else :
+            df_matrix.at[row['SrcSGT'], row['DstSGT']] = row['DefaultRule']
+    df_matrix.reset_index(names=['SGT'], inplace=True)
+    return df_matrix
+
+
+if __name__ == '__main__':
+    """
+    Entrypoint for local script.
+    """
+    argp = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument('-s', '--sgts', type=int, nargs='+', default=[10, 100, 300, 1000], help='SGT counts')
+    argp.add_argument('-d', '--density', type=float, default=0.1, help='ratio of matrix cells with an egress policy')
+    argp.add_argument('--no-legacy', action='store_true', default=False, help='skip the legacy loop')
+    args = argp.parse_args()
+
+    rows = []
+    for sgts in args.sgts :
+        (df_sgts, df_sgacls, matrix) = synthetic_trustsec(max(1, int(sgts * sgts * args.density)), sgt_count=sgts)
+        df_policies = create_trustsec_egress_policies_by_name(df_sgts, df_sgacls, matrix)
+        df_policies['SGACLs'] = df_policies['SGACLs'].apply(lambda sgacls: ','.join(sgacls))
+        row = {'sgts':sgts, 'cells':len(df_policies), 'pivot (s)':timed(create_trustsec_matrix, df_sgts, df_policies)}
+        if not args.no_legacy and sgts <= LEGACY_SGTS_MAX :
+            row['legacy (s)'] = timed(legacy_trustsec_matrix, df_sgts, df_policies)
+            row['speedup'] = row['legacy (s)'] / row['pivot (s)']
+        rows.append(row)
+    print(tabulate(rows, headers='keys', tablefmt='simple_grid', floatfmt='.3f'))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+
+Generate synthetic TrustSec matrices for scale testing as ERS fixtures and
+as the `Matrix`, `SGACLs`, and `SGTs` workbook layout.
+
+The ERS fixtures are the SGT, SGACL, and egress matrix cell details that
+`ISEERS.get_resource_details()` returns, including the reserved objects of a
+new ISE, for `MockISE.load_fixtures()` or `mock_ise_ers.py --fixtures`.
+The workbook is written with the same functions as `ise_trustsec_export.py`
+so it may be loaded with `excel_trustsec_matrix_to_ise.py` and compared with
+an export of the same fixtures.
+
+Cells are sampled between the generated SGTs for a density or a cell count.
+Each cell references one SGACL from the vocabulary or, for a ratio of cells,
+2 or more distinct SGACLs. The same seed always generates the same output.
+
+Examples:
+    generate_trustsec.py --sgts 100 --density 0.1
+    generate_trustsec.py --sgts 1000 --cells 100000 --sgacls 200 --multi 0.3 --max-sgacls 4
+    generate_trustsec.py --sgts 5000 --density 0.01 --no-reserved-sgacls --seed 7 --prefix big
+    generate_trustsec.py --sgts 100 --no-workbook
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ise_trustsec_export import (SGT_ICONS, EXCEL_CONSTANT_MEMORY_SGTS, create_trustsec_dataframes,
+                                 create_trustsec_egress_policies_by_name, write_trustsec_workbook)
+from trustsec_matrix import TrustSecMatrix
+from mock_ise_ers import RESERVED_SGTS, RESERVED_SGACLS, RESERVED_CELLS
+
+SGACL_COUNT = 50
+MULTI_SGACL_RATIO = 0.2     # ratio of cells with 2 or more SGACLs
+MAX_SGACLS_PER_CELL = 3
+SGT_VALUE_MAX = 65519       # 65520-65535 are reserved by ISE
+SGACL_PORTS = [22, 53, 80, 123, 389, 443, 445, 636, 1812, 3389, 8080, 8443]
+
+
+def generate_trustsec (sgt_count:int, density:float=None, cells:int=None, sgacl_count:int=SGACL_COUNT,
+                       reserved_sgacls:bool=True, multi_sgacl_ratio:float=MULTI_SGACL_RATIO,
+                       max_sgacls:int=MAX_SGACLS_PER_CELL, seed:int=0) -> dict :
+    """
+    Returns the ERS fixtures {'sgt':[...], 'sgacl':[...], 'egressmatrixcell':[...]} of a synthetic TrustSec matrix.
+    @sgt_count : the number of generated SGTs, in addition to the reserved SGTs
+    @density : the ratio of the `sgt_count`² cells with an egress policy
+    @cells : the number of cells with an egress policy, instead of the density
+    @sgacl_count : the number of generated SGACLs in the cell vocabulary
+    @reserved_sgacls : include the reserved 'Deny IP' and 'Permit IP' SGACLs in the cell vocabulary
+    @multi_sgacl_ratio : the ratio of cells with 2 to `max_sgacls` SGACLs
+    @max_sgacls : the maximum SGACLs in a cell
+    @seed : the random seed for repeatable output
+    """
+    rng = random.Random(seed)
+    uuid4 = lambda: str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    cells = int(sgt_count * sgt_count * (density or 0)) if cells is None else cells
+    if cells > sgt_count * sgt_count :
+        raise ValueError(f"{cells} cells do not fit in {sgt_count} × {sgt_count} SGTs")
+
+    # SGT values start after the reserved values and skip them
+    reserved_values = { sgt['value'] for sgt in RESERVED_SGTS }
+    values = [ v for v in range(1, SGT_VALUE_MAX + 1) if v not in reserved_values ][:sgt_count]
+    if len(values) < sgt_count :
+        raise ValueError(f"{sgt_count} SGTs exceed the {len(values)} available SGT values")
+    width = len(str(sgt_count))
+    sgts = [ {'id':uuid4(), 'name':f"SGT_{i:0{width}d}", 'description':f"Synthetic SGT {i} value {value}", 'value':value,
+              'generationId':0, 'propogateToApic':False} for (i, value) in enumerate(values, start=1) ]
+
+    width = len(str(sgacl_count))
+    sgacls = []
+    for i in range(1, sgacl_count + 1) :
+        ports = sorted(rng.sample(SGACL_PORTS, rng.randint(1, 3)))
+        sgacl = {'id':uuid4(), 'name':f"SGACL_{i:0{width}d}", 'description':f"Synthetic SGACL {i}", 'generationId':0,
+                 'aclcontent':'\n'.join([ f"permit tcp dst eq {port}" for port in ports ] + ['deny ip'])}
+        if rng.random() < 0.5 :
+            sgacl['ipVersion'] = 'IPV4'     # ISE does not return the default IP_AGNOSTIC
+        sgacls.append(sgacl)
+
+    vocabulary = [ sgacl['id'] for sgacl in sgacls ]
+    if reserved_sgacls :
+        vocabulary += [ sgacl['id'] for sgacl in RESERVED_SGACLS if sgacl['name'] in ['Deny IP', 'Permit IP'] ]
+    if cells and not vocabulary :
+        raise ValueError("cells require at least 1 SGACL in the vocabulary")
+    max_sgacls = min(max_sgacls, len(vocabulary))
+
+    matrix = []
+    for i in sorted(rng.sample(range(sgt_count * sgt_count), cells)) :
+        (src, dst) = (sgts[i // sgt_count], sgts[i % sgt_count])
+        count = rng.randint(2, max_sgacls) if max_sgacls >= 2 and rng.random() < multi_sgacl_ratio else 1
+        matrix.append({
+            'id': uuid4(),
+            'name': f"{src['name']}-{dst['name']}",
+            'description': '',
+            'sourceSgtId': src['id'],
+            'destinationSgtId': dst['id'],
+            'matrixCellStatus': 'ENABLED',
+            'defaultRule': 'NONE',
+            'sgacls': rng.sample(vocabulary, count),
+        })
+
+    return {
+        'sgt' : [ dict(sgt) for sgt in RESERVED_SGTS ] + sgts,
+        'sgacl' : [ dict(sgacl) for sgacl in RESERVED_SGACLS ] + sgacls,
+        'egressmatrixcell' : [ dict(cell) for cell in RESERVED_CELLS ] + matrix,
+    }
+
+
+def write_fixtures (fixtures:dict, filename:str) :
+    """
+    Write the ERS fixtures to a JSON file.
+    """
+    with open(filename, 'w') as fh :
+        json.dump(fixtures, fh, indent=1)
+
+
+def write_workbook (fixtures:dict, filename:str, sort:str='name', constant_memory:bool=None) :
+    """
+    Write the ERS fixtures as the `ise_trustsec_export.py` workbook and return the TrustSecMatrix.
+    @fixtures : the ERS fixtures from `generate_trustsec()`
+    @filename : the Excel workbook filename
+    @sort : the SGT sort key: 'name' or 'value'
+    @constant_memory : write one row at a time. Default: for more than EXCEL_CONSTANT_MEMORY_SGTS SGTs
+    """
+    (df_sgts, df_sgacls) = create_trustsec_dataframes(fixtures['sgt'], fixtures['sgacl'])
+    df_policies = create_trustsec_egress_policies_by_name(df_sgts, df_sgacls, fixtures['egressmatrixcell'])
+    df_policies['SGACLs'] = df_policies['SGACLs'].apply(lambda sgacls: ','.join(sgacls))
+    matrix = TrustSecMatrix.from_policies(df_sgts, df_policies)
+
+    df_sgts.insert(0, 'Icon', SGT_ICONS['security'])
+    df_sgts = df_sgts.drop(df_sgts[df_sgts['name'] == 'ANY'].index)
+    if constant_memory is None :
+        constant_memory = len(matrix.sgts) > EXCEL_CONSTANT_MEMORY_SGTS
+    write_trustsec_workbook(filename, matrix, df_sgacls, df_sgts, sort=sort, constant_memory=constant_memory)
+    return matrix
+
+
+if __name__ == '__main__':
+    """
+    Entrypoint for local script.
+    """
+    argp = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument('-s', '--sgts', type=int, required=True, help='the number of generated SGTs')
+    cell_args = argp.add_mutually_exclusive_group(required=True)
+    cell_args.add_argument('-d', '--density', type=float, help='ratio of SGT × SGT cells with an egress policy')
+    cell_args.add_argument('-c', '--cells', type=int, help='number of cells with an egress policy')
+    argp.add_argument('-a', '--sgacls', type=int, default=SGACL_COUNT, help='number of generated SGACLs in the cell vocabulary')
+    argp.add_argument('--no-reserved-sgacls', action='store_true', default=False, help="do not use 'Deny IP' and 'Permit IP' in cells")
+    argp.add_argument('--multi', type=float, default=MULTI_SGACL_RATIO, help='ratio of cells with multiple SGACLs')
+    argp.add_argument('--max-sgacls', type=int, default=MAX_SGACLS_PER_CELL, help='maximum SGACLs in a cell')
+    argp.add_argument('--seed', type=int, default=0, help='random seed for repeatable output')
+    argp.add_argument('-p', '--prefix', default=None, help='output filename prefix. Default: trustsec_{sgts}_{cells}')
+    argp.add_argument('--sort', choices=['name', 'value'], default='name', help='SGT sort order in the matrix')
+    argp.add_argument('-m', '--constant-memory', action='store_true', default=None, help='always write the workbook in constant memory mode')
+    argp.add_argument('--no-workbook', action='store_true', default=False, help='only write the ERS fixtures')
+    args = argp.parse_args()
+
+    start = time.perf_counter()
+    try :
+        fixtures = generate_trustsec(args.sgts, density=args.density, cells=args.cells, sgacl_count=args.sgacls,
+                                     reserved_sgacls=not args.no_reserved_sgacls, multi_sgacl_ratio=args.multi,
+                                     max_sgacls=args.max_sgacls, seed=args.seed)
+    except ValueError as e :
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    cells = len(fixtures['egressmatrixcell']) - len(RESERVED_CELLS)
+    prefix = args.prefix or f"trustsec_{args.sgts}_{cells}"
+
+    write_fixtures(fixtures, prefix+'_ers.json')
+    print(f"ⓘ ERS fixtures: {prefix}_ers.json ({ {k:len(v) for k,v in fixtures.items()} })")
+    if not args.no_workbook :
+        matrix = write_workbook(fixtures, prefix+'_matrix.xlsx', sort=args.sort, constant_memory=args.constant_memory)
+        print(f"ⓘ Workbook: {prefix}_matrix.xlsx ({len(matrix.sgts)} SGTs, {len(matrix)} cells)")
+    print(f"🕒 {time.perf_counter() - start:.2f} seconds")
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+
+A local mock ISE ERS server for the `sgt`, `sgacl`, and `egressmatrixcell`
+resources to test and benchmark the ISE TrustSec scripts without an ISE.
+
+It supports list paging with `size`, `page` and `filter=name.EQ.{name}`, detail
+GETs, POST, PUT, DELETE, and the ERS Bulk API, with the reserved SGTs, SGACLs
+and the default ANY-ANY egress rule that ISE never allows deleting. Responses
+may be delayed with a latency and jitter, rate limited with `429` and
+`Retry-After`, and concurrent requests above a connection cap get `503`.
+
+Examples:
+    mock_ise_ers.py
+    mock_ise_ers.py --port 9060 --latency 0.05 --jitter 0.02
+    mock_ise_ers.py --rate-limit 50 --max-connections 10
+    mock_ise_ers.py --fixtures trustsec_1000_ers.json
+    ISEERS('127.0.0.1', 'admin', 'admin', base_url='http://127.0.0.1:9060')
+
+    mock = MockISE(latency=0.01)
+    runner = await mock.start('127.0.0.1', 9060)
+    ...
+    await runner.cleanup()
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import sys
+import time
+import uuid
+from aiohttp import web
+
+MOCK_HOST = '127.0.0.1'
+MOCK_PORT = 9060
+MOCK_PAGE_SIZE_MAX = 100
+MOCK_RETRY_AFTER = 1    # seconds in the `Retry-After` header of a 429 response
+
+MOCK_RESOURCES = {
+    'sgt'              : {'object':'Sgt',              'bulk':'SGTBulkRequest'},
+    'sgacl'            : {'object':'Sgacl',            'bulk':'SecurityGroupsACLBulkRequest'},
+    'egressmatrixcell' : {'object':'EgressMatrixCell', 'bulk':'EgressMatrixCellBulkRequest'},
+}
+
+# The hidden ANY SGT referenced by the default ANY-ANY egress rule but never listed
+SGT_ANY_ID = '92bb1950-8c01-11e6-996c-525400b48521'
+
+# Reserved objects of a new ISE deployment
+RESERVED_SGTS = [
+    {'id':'934557f0-8c01-11e6-996c-525400b48521', 'name':'Unknown',          'description':'Unknown Security Group',          'value':0, 'generationId':0, 'propogateToApic':False},
+    {'id':'947832a0-8c01-11e6-996c-525400b48521', 'name':'TrustSec_Devices', 'description':'TrustSec Devices Security Group', 'value':2, 'generationId':0, 'propogateToApic':False},
+]
+RESERVED_SGACLS = [
+    {'id':'92919850-8c01-11e6-996c-525400b48521', 'name':'Deny IP',       'description':'Deny IP SGACL',          'generationId':0, 'aclcontent':'deny ip'},
+    {'id':'92951ac0-8c01-11e6-996c-525400b48521', 'name':'Permit IP',     'description':'Permit IP SGACL',        'generationId':0, 'aclcontent':'permit ip'},
+    {'id':'9296d0a0-8c01-11e6-996c-525400b48521', 'name':'Deny_IP_Log',   'description':'Deny IP with logging',   'generationId':0, 'aclcontent':'deny ip log'},
+    {'id':'929a2a20-8c01-11e6-996c-525400b48521', 'name':'Permit_IP_Log', 'description':'Permit IP with logging', 'generationId':0, 'aclcontent':'permit ip log'},
+]
+RESERVED_CELLS = [
+    {'id':'92c1a900-8c01-11e6-996c-525400b48521', 'name':'ANY-ANY', 'description':'Default egress rule', 'sourceSgtId':SGT_ANY_ID, 'destinationSgtId':SGT_ANY_ID,
+     'matrixCellStatus':'ENABLED', 'defaultRule':'NONE', 'sgacls':['92951ac0-8c01-11e6-996c-525400b48521']},
+]
+
+
+def ers_error (status:int, title:str) -> web.Response :
+    """
+    Returns an ERS error response with the message title.
+    """
+    return web.json_response({'ERSResponse':{'operation':'', 'messages':[{'title':title, 'type':'ERROR'}]}}, status=status)
+
+
+class MockISE :
+    """
+    An in-memory ISE ERS TrustSec configuration served by aiohttp.
+    """
+
+    def __init__ (self, latency:float=0, jitter:float=0, rate_limit:float=None, max_connections:int=None, bulk_delay:float=0, seed:int=0) :
+        """
+        @latency : seconds to delay every response
+        @jitter : maximum random seconds added to the latency
+        @rate_limit : maximum requests per second before `429` responses. Default: unlimited
+        @max_connections : maximum concurrent requests before `503` responses. Default: unlimited
+        @bulk_delay : seconds before a bulk request is reported as completed
+        @seed : the random seed for the jitter
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.max_connections = max_connections
+        self.bulk_delay = bulk_delay
+        self.random = random.Random(seed)
+        self.db = { resource : {} for resource in MOCK_RESOURCES }   # {resource : {id : attributes}}
+        self.names = { resource : {} for resource in MOCK_RESOURCES }   # {resource : {name : id}}
+        self.sgt_values = {}                    # {SGT value : id}
+        self.cell_pairs = {}                    # {(source SGT id, destination SGT id) : id}
+        self.references = collections.Counter() # {SGT or SGACL id : egress cells using it}
+        self.bulk_requests = {}
+        self.reset_stats()
+        for sgt in RESERVED_SGTS : self.add('sgt', dict(sgt))
+        for sgacl in RESERVED_SGACLS : self.add('sgacl', dict(sgacl))
+        for cell in RESERVED_CELLS : self.add('egressmatrixcell', dict(cell))
+
+
+    def reset_stats (self) :
+        """
+        Reset the request statistics.
+        """
+        self.requests = collections.Counter()   # {(method, resource) : count}
+        self.rejected = collections.Counter()   # {status : count}
+        self.in_flight = 0
+        self.high_water = 0
+        self.tokens = self.rate_limit or 0
+        self.tokens_time = time.monotonic()
+
+
+    def add (self, resource:str, data:dict) -> str :
+        """
+        Add or replace a resource without validation and return its id.
+        @resource : the ERS resource name
+        @data : the resource attributes with an optional `id`
+        """
+        data['id'] = data.get('id') or str(uuid.uuid4())
+        data.setdefault('description', '')
+        data.setdefault('generationId', 0)
+        if resource == 'sgt' : data.setdefault('propogateToApic', False)
+        if data['id'] in self.db[resource] :
+            self.remove(resource, data['id'])
+        self.db[resource][data['id']] = data
+        self.names[resource][data.get('name')] = data['id']
+        if resource == 'sgt' :
+            self.sgt_values[data.get('value')] = data['id']
+        elif resource == 'egressmatrixcell' :
+            self.cell_pairs[(data.get('sourceSgtId'), data.get('destinationSgtId'))] = data['id']
+            self.references.update([data.get('sourceSgtId'), data.get('destinationSgtId')] + list(data.get('sgacls', [])))
+        return data['id']
+
+
+    def load_fixtures (self, fixtures:dict) -> dict :
+        """
+        Add the resources of ERS fixtures, like those from `generate_trustsec.py`, and return the counts.
+        SGTs and SGACLs are added before the egress cells that reference them.
+        @fixtures : a dict of {resource : [attributes, ...]}
+        """
+        for resource in MOCK_RESOURCES :
+            for data in fixtures.get(resource, []) :
+                self.add(resource, dict(data))
+        return { resource : self.count(resource) for resource in MOCK_RESOURCES }
+
+
+    def remove (self, resource:str, id:str) :
+        """
+        Remove a resource and its index entries without validation.
+        """
+        data = self.db[resource].pop(id)
+        self.names[resource].pop(data.get('name'), None)
+        if resource == 'sgt' :
+            self.sgt_values.pop(data.get('value'), None)
+        elif resource == 'egressmatrixcell' :
+            self.cell_pairs.pop((data.get('sourceSgtId'), data.get('destinationSgtId')), None)
+            self.references.subtract([data.get('sourceSgtId'), data.get('destinationSgtId')] + list(data.get('sgacls', [])))
+
+
+    def count (self, resource:str, reserved:bool=False) -> int :
+        """
+        Returns the number of resources, without the reserved objects unless `reserved`.
+        """
+        reserved_ids = set() if reserved else { r['id'] for r in RESERVED_SGTS + RESERVED_SGACLS + RESERVED_CELLS }
+        return len([ id for id in self.db[resource] if id not in reserved_ids ])
+
+
+    #--------------------------------------------------------------------------
+    # Validation
+    #--------------------------------------------------------------------------
+
+    def validate (self, resource:str, data:dict, id:str=None) -> str :
+        """
+        Returns an error message if the resource may not be created or updated, else ''.
+        @resource : the ERS resource name
+        @data : the resource attributes
+        @id : the id of an updated resource
+        """
+        name = data.get('name')
+        if not name :
+            return f"{MOCK_RESOURCES[resource]['object']} name is required"
+        if self.names[resource].get(name, id) != id :
+            return f"{MOCK_RESOURCES[resource]['object']} with name {name} already exists"
+        if resource == 'sgt' :
+            if self.sgt_values.get(data.get('value'), id) != id :
+                return f"Security group with value {data.get('value')} already exists"
+        elif resource == 'egressmatrixcell' :
+            for key in ['sourceSgtId', 'destinationSgtId'] :
+                if data.get(key) not in self.db['sgt'] and data.get(key) != SGT_ANY_ID :
+                    return f"Security group {data.get(key)} does not exist"
+            for sgacl in data.get('sgacls', []) :
+                if sgacl not in self.db['sgacl'] :
+                    return f"Security group ACL {sgacl} does not exist"
+            if self.cell_pairs.get((data.get('sourceSgtId'), data.get('destinationSgtId')), id) != id :
+                return "Egress matrix cell for this source and destination already exists"
+        return ''
+
+
+    def delete_error (self, resource:str, id:str) -> tuple :
+        """
+        Returns the (status, message) ISE responds with when the resource may not be deleted, else (None, '').
+        """
+        r = self.db[resource][id]
+        if resource == 'sgt' :
+            if r['name'] == 'Unknown' :
+                return (400, "Deletion of security group Unknown is forbidden and has been blocked!")
+            if r['name'] == 'TrustSec_Devices' or self.references[id] > 0 :
+                return (500, f"Security group {r['name']} is currently in use. References to this security group must be removed before it can be deleted.")
+        elif resource == 'sgacl' :
+            if id in { s['id'] for s in RESERVED_SGACLS } :
+                return (500, f"Deletion of security group ACL {r['name']} is forbidden and has been blocked (read only object).")
+            if self.references[id] > 0 :
+                return (500, f"Security group ACL {r['name']} is currently in use. References to this security group ACL must be removed before it can be deleted.")
+        elif resource == 'egressmatrixcell' :
+            if id in { c['id'] for c in RESERVED_CELLS } :
+                return (400, "can not delete default egress policy matrix rule .")
+        return (None, '')
+
+
+    #--------------------------------------------------------------------------
+    # HTTP Handlers
+    #--------------------------------------------------------------------------
+
+    @web.middleware
+    async def middleware (self, request, handler) :
+        """
+        Count requests and apply the connection cap, rate limit, and latency.
+        """
+        parts = request.path.split('/')    # ['', 'ers', 'config', {resource}, ...]
+        self.requests[(request.method, parts[3] if len(parts) > 3 else '')] += 1
+
+        if self.max_connections and self.in_flight >= self.max_connections :
+            self.rejected[503] += 1
+            return ers_error(503, "Too many concurrent connections")
+        if self.rate_limit :
+            now = time.monotonic()
+            self.tokens = min(self.rate_limit, self.tokens + (now - self.tokens_time) * self.rate_limit)
+            self.tokens_time = now
+            if self.tokens < 1 :
+                self.rejected[429] += 1
+                response = ers_error(429, "Too many requests")
+                response.headers['Retry-After'] = str(MOCK_RETRY_AFTER)
+                return response
+            self.tokens -= 1
+
+        self.in_flight += 1
+        self.high_water = max(self.high_water, self.in_flight)
+        try :
+            if self.latency or self.jitter :
+                await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+            return await handler(request)
+        finally :
+            self.in_flight -= 1
+
+
+    async def list_resources (self, request) :
+        resource = request.match_info['resource']
+        (size, page) = (int(request.query.get('size', 20)), int(request.query.get('page', 1)))
+        if size > MOCK_PAGE_SIZE_MAX :
+            return ers_error(400, f"Page size {size} exceeds {MOCK_PAGE_SIZE_MAX}")
+        if request.query.get('filter', '').startswith('name.EQ.') :
+            id = self.names[resource].get(request.query['filter'][len('name.EQ.'):])
+            resources = [ self.db[resource][id] ] if id else []
+        else :
+            resources = list(self.db[resource].values())
+        return web.json_response({'SearchResult':{
+            'total'     : len(resources),
+            'resources' : [
+                {'id':r['id'], 'name':r.get('name'), 'description':r.get('description', ''),
+                 'link':{'rel':'self', 'href':f"{request.url.origin()}/ers/config/{resource}/{r['id']}", 'type':'application/json'}}
+                for r in resources[(page - 1) * size : page * size]
+            ],
+        }})
+
+
+    async def get_resource (self, request) :
+        (resource, id) = (request.match_info['resource'], request.match_info['id'])
+        if id not in self.db[resource] :
+            return ers_error(404, f"{MOCK_RESOURCES[resource]['object']} not found")
+        return web.json_response({ MOCK_RESOURCES[resource]['object'] : self.db[resource][id] })
+
+
+    async def create_resource (self, request) :
+        resource = request.match_info['resource']
+        data = dict((await request.json())[MOCK_RESOURCES[resource]['object']])
+        data.pop('id', None)
+        message = self.validate(resource, data)
+        if message :
+            return ers_error(400, message)
+        id = self.add(resource, data)
+        return web.Response(status=201, headers={'Location':f"{request.url.origin()}/ers/config/{resource}/{id}"})
+
+
+    async def update_resource (self, request) :
+        (resource, id) = (request.match_info['resource'], request.match_info['id'])
+        if id not in self.db[resource] :
+            return ers_error(404, f"{MOCK_RESOURCES[resource]['object']} not found")
+        data = { **self.db[resource][id], **(await request.json())[MOCK_RESOURCES[resource]['object']], 'id':id }
+        message = self.validate(resource, data, id=id)
+        if message :
+            return ers_error(400, message)
+        data['generationId'] = self.db[resource][id].get('generationId', 0) + 1
+        self.add(resource, data)
+        return web.json_response({'UpdatedFieldsList':{'updatedField':[]}})
+
+
+    async def delete_resource (self, request) :
+        (resource, id) = (request.match_info['resource'], request.match_info['id'])
+        if id not in self.db[resource] :
+            return ers_error(404, f"{MOCK_RESOURCES[resource]['object']} not found")
+        (status, message) = self.delete_error(resource, id)
+        if status :
+            return ers_error(status, message)
+        self.remove(resource, id)
+        return web.Response(status=204)
+
+
+    async def bulk_submit (self, request) :
+        resource = request.match_info['resource']
+        bulk = (await request.json())[MOCK_RESOURCES[resource]['bulk']]
+        operation = bulk['operationType']
+        statuses = []
+        if operation == 'delete' :
+            for id in bulk.get('idList', []) :
+                (status, message) = self.delete_error(resource, id) if id in self.db[resource] else (404, 'not found')
+                if not status : self.remove(resource, id)
+                statuses.append({'id':id, 'bulkExecutionStatus':('FAIL' if status else 'SUCCESS'), 'status':message})
+        else :
+            for item in bulk.get('resourcesList', []) :
+                data = dict(item[MOCK_RESOURCES[resource]['object']])
+                id = data.get('id') if operation == 'update' else None
+                if operation == 'update' and id not in self.db[resource] :
+                    message = 'not found'
+                else :
+                    if operation == 'update' : data = { **self.db[resource][id], **data }
+                    message = self.validate(resource, data, id=id)
+                if not message :
+                    data.pop('id', None) if operation == 'create' else None
+                    id = self.add(resource, { **data, 'id':id } if id else data)
+                statuses.append({'id':id, 'name':data.get('name'), 'bulkExecutionStatus':('FAIL' if message else 'SUCCESS'), 'status':message})
+
+        bulk_id = str(uuid.uuid4())
+        failed = len([ s for s in statuses if s['bulkExecutionStatus'] != 'SUCCESS' ])
+        self.bulk_requests[bulk_id] = {
+            'bulkId'          : bulk_id,
+            'operationType'   : operation,
+            'resourcesCount'  : len(statuses),
+            'successCount'    : len(statuses) - failed,
+            'failCount'       : failed,
+            'executionStatus' : ('COMPLETED_WITH_ERRORS' if failed else 'COMPLETED'),
+            'resourcesStatus' : statuses,
+            'done'            : time.monotonic() + self.bulk_delay,
+        }
+        return web.Response(status=202, headers={'Location':f"{request.url.origin()}/ers/config/{resource}/bulk/{bulk_id}"})
+
+
+    async def bulk_status (self, request) :
+        bulk = self.bulk_requests.get(request.match_info['bulk_id'])
+        if bulk is None :
+            return ers_error(404, "Bulk request not found")
+        status = { k:v for k,v in bulk.items() if k != 'done' }
+        if time.monotonic() < bulk['done'] :
+            status.update({'executionStatus':'IN_PROGRESS', 'resourcesStatus':[]})
+        return web.json_response({'BulkStatus':status})
+
+
+    def app (self) -> web.Application :
+        """
+        Returns the aiohttp application.
+        """
+        app = web.Application(middlewares=[self.middleware])
+        resources = '{resource:' + '|'.join(MOCK_RESOURCES) + '}'
+        app.router.add_put(f"/ers/config/{resources}/bulk/submit", self.bulk_submit)
+        app.router.add_get(f"/ers/config/{resources}/bulk/{{bulk_id}}", self.bulk_status)
+        app.router.add_get(f"/ers/config/{resources}", self.list_resources)
+        app.router.add_post(f"/ers/config/{resources}", self.create_resource)
+        app.router.add_get(f"/ers/config/{resources}/{{id}}", self.get_resource)
+        app.router.add_put(f"/ers/config/{resources}/{{id}}", self.update_resource)
+        app.router.add_delete(f"/ers/config/{resources}/{{id}}", self.delete_resource)
+        return app
+
+
+    async def start (self, host:str=MOCK_HOST, port:int=MOCK_PORT) -> web.AppRunner :
+        """
+        Start serving on the host and port and return the runner to `cleanup()`.
+        """
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+async def main () :
+    """
+    Entrypoint for local script.
+    """
+    argp = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument('--host', default=MOCK_HOST, help='listen address')
+    argp.add_argument('-p', '--port', type=int, default=MOCK_PORT, help='listen port')
+    argp.add_argument('-l', '--latency', type=float, default=0, help='seconds to delay every response')
+    argp.add_argument('-j', '--jitter', type=float, default=0, help='maximum random seconds added to the latency')
+    argp.add_argument('-r', '--rate-limit', type=float, default=None, help='maximum requests per second before 429 responses')
+    argp.add_argument('-m', '--max-connections', type=int, default=None, help='maximum concurrent requests before 503 responses')
+    argp.add_argument('-b', '--bulk-delay', type=float, default=0, help='seconds before a bulk request completes')
+    argp.add_argument('-f', '--fixtures', default=None, help='ERS fixtures JSON file to load, from generate_trustsec.py')
+    args = argp.parse_args()
+
+    mock = MockISE(latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit, max_connections=args.max_connections, bulk_delay=args.bulk_delay)
+    if args.fixtures :
+        with open(args.fixtures) as fh :
+            print(f"ⓘ Loaded {mock.load_fixtures(json.load(fh))} from {args.fixtures}")
+    runner = await mock.start(args.host, args.port)
+    print(f"ⓘ Mock ISE ERS on http://{args.host}:{args.port}/ers/config/{{sgt,sgacl,egressmatrixcell}}")
+    try :
+        while True :
+            await asyncio.sleep(3600)
+    finally :
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    """
+    Entrypoint for local script.
+    """
+    try :
+        asyncio.run(main())
+    except KeyboardInterrupt :
+        pass
+    sys.exit(0) # 0 is ok
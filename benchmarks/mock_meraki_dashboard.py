@@ -0,0 +1,588 @@
+#!/usr/bin/env python3
+"""
+
+A local mock Meraki Dashboard API for the organization, network, device,
+Adaptive Policy, and action batch endpoints to test and benchmark the Meraki
+scripts without a Dashboard organization.
+
+Lists are paged with `perPage` and `startingAfter` and a relative `Link` header
+the SDK follows against its base URL. Each organization is rate limited like
+the Dashboard: requests above `org_rate` per second get `429` with a
+`Retry-After` header. Responses may be delayed with a latency and jitter.
+
+Adaptive Policy groups, ACLs, and policies may be created, updated, and deleted
+directly or with action batches. A batch runs its actions in order after
+`batch_latency` seconds per action and is rolled back if any action fails.
+Asynchronous batches are limited to 100 actions, synchronous batches to 20, and
+an organization to 5 running batches.
+
+Examples:
+    mock_meraki_dashboard.py
+    mock_meraki_dashboard.py --orgs 5 --networks 200 --devices 10 --latency 0.05
+    export MERAKI_BASE_URL=http://127.0.0.1:9080/api/v1
+
+    mock = MockDashboard(latency=0.01)
+    org_id = mock.add_organization('example_org')
+    runner = await mock.start('127.0.0.1', 9080)
+    ...
+    await runner.cleanup()
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import argparse
+import asyncio
+import collections
+import copy
+import random
+import sys
+import time
+from aiohttp import web
+
+MOCK_HOST = '127.0.0.1'
+MOCK_PORT = 9080
+MOCK_BASE_PATH = '/api/v1'
+MOCK_ORG_RATE = 10          # requests per second per organization before `429` responses
+MOCK_RETRY_AFTER = 1        # seconds in the `Retry-After` header of a 429 response
+MOCK_PER_PAGE_MAX = 1000
+MOCK_BATCH_SIZE = 100       # maximum actions in an asynchronous batch
+MOCK_BATCH_SYNC_SIZE = 20   # maximum actions in a synchronous batch
+MOCK_BATCH_RUNNING = 5      # maximum running batches per organization
+
+# Models of the devices that support Adaptive Policy
+MOCK_MODELS = ['MS390-48UX', 'MS390-24UX', 'MR46', 'MR56', 'MX68', 'MX250', 'MS120-8', 'MR33', 'MV12W', 'MG21']
+
+# The default groups of every organization
+DEFAULT_GROUPS = [
+    {'name':'Unknown',        'sgt':0, 'description':'Unknown group'},
+    {'name':'Infrastructure', 'sgt':2, 'description':'Meraki devices'},
+]
+
+
+def meraki_error (status:int, *errors) -> web.Response :
+    """
+    Returns a Dashboard error response.
+    """
+    return web.json_response({'errors':list(errors)}, status=status)
+
+
+class MockDashboard :
+    """
+    An in-memory Meraki Dashboard served by aiohttp.
+    """
+
+    def __init__ (self, latency:float=0, jitter:float=0, org_rate:float=MOCK_ORG_RATE, batch_latency:float=0, seed:int=0) :
+        """
+        @latency : seconds to delay every response
+        @jitter : maximum random seconds added to the latency
+        @org_rate : maximum requests per second per organization before `429` responses. None is unlimited
+        @batch_latency : seconds to run each action of an action batch
+        @seed : the random seed for ids and the jitter
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.org_rate = org_rate
+        self.batch_latency = batch_latency
+        self.random = random.Random(seed)
+        self.orgs = {}              # {organization id : {organization details}}
+        self.networks = {}          # {network id : {network details}}
+        self.devices = {}           # {serial : {device details}}
+        self.adaptive_policy = {}   # {organization id : {'groups'|'acls'|'policies' : {id : object}}}
+        self.batches = {}           # {action batch id : action batch}
+        self.tasks = set()          # running asynchronous action batches
+        self.reset_stats()
+
+
+    def reset_stats (self) :
+        """
+        Reset the request statistics and rate limit buckets.
+        """
+        self.requests = collections.Counter()   # {(method, route) : count}
+        self.org_requests = collections.Counter()   # {organization id : count}
+        self.rejected = collections.Counter()   # {organization id : 429 responses}
+        self.in_flight = 0
+        self.high_water = 0
+        self.buckets = {}           # {organization id : [tokens, monotonic time]}
+        self.batch_actions = collections.Counter()  # {(resource kind, operation) : actions run in batches}
+        self.batch_high_water = 0   # maximum running batches in an organization
+
+
+    def new_id (self, digits:int=18) -> str :
+        """
+        Returns a new numeric Dashboard id.
+        """
+        return str(self.random.randrange(10 ** (digits - 1), 10 ** digits))
+
+
+    #--------------------------------------------------------------------------
+    # Data
+    #--------------------------------------------------------------------------
+
+    def add_organization (self, name:str, api_enabled:bool=True) -> str :
+        """
+        Add an organization with the default Adaptive Policy groups and return its id.
+        """
+        org_id = self.new_id()
+        self.orgs[org_id] = {
+            'id':org_id, 'name':name, 'url':f"https://n1.meraki.com/o/{org_id}/manage/organization/overview",
+            'api':{'enabled':api_enabled}, 'licensing':{'model':'co-term'}, 'cloud':{'region':{'name':'North America'}},
+            'management':{'details':[]},
+        }
+        self.adaptive_policy[org_id] = { 'groups':{}, 'acls':{}, 'policies':{} }
+        for group in DEFAULT_GROUPS :
+            self.add_group(org_id, group['name'], group['sgt'], group['description'], default=True)
+        return org_id
+
+
+    def add_network (self, org_id:str, name:str, product_types:list=None) -> str :
+        """
+        Add a network to the organization and return its id.
+        """
+        network_id = f"L_{self.new_id()}"
+        self.networks[network_id] = {
+            'id':network_id, 'organizationId':org_id, 'name':name, 'productTypes':product_types or ['appliance', 'switch', 'wireless'],
+            'timeZone':'America/Los_Angeles', 'tags':[], 'enrollmentString':None, 'url':f"https://n1.meraki.com/{name}/manage/usage/list",
+            'notes':'', 'isBoundToConfigTemplate':False,
+        }
+        return network_id
+
+
+    def add_device (self, network_id:str, model:str, name:str=None) -> str :
+        """
+        Add a device to the network and return its serial.
+        """
+        serial = '-'.join(''.join(self.random.choice('ABCDEFGHJKLMNPQRSTUVWXYZ23456789') for _ in range(4)) for _ in range(3))
+        self.devices[serial] = {
+            'serial':serial, 'name':name or serial, 'model':model, 'mac':':'.join(f"{self.random.randrange(256):02x}" for _ in range(6)),
+            'networkId':network_id, 'organizationId':self.networks[network_id]['organizationId'], 'firmware':f"{model.split('-')[0].lower()}-17-10-1",
+            'productType':{'MS':'switch', 'MR':'wireless', 'MX':'appliance', 'MV':'camera', 'MG':'cellularGateway'}[model[:2]],
+            'lanIp':None, 'tags':[], 'lat':37.4180951010362, 'lng':-122.098531723022, 'address':'', 'url':'', 'floorPlanId':None,
+            'switchProfileId':None, 'details':[],
+        }
+        return serial
+
+
+    def add_group (self, org_id:str, name:str, sgt:int, description:str='', default:bool=False) -> str :
+        """
+        Add an Adaptive Policy group and return its id.
+        """
+        group_id = self.new_id(16)
+        self.adaptive_policy[org_id]['groups'][group_id] = {
+            'groupId':group_id, 'name':name, 'sgt':sgt, 'description':description, 'policyObjects':[],
+            'isDefaultGroup':default, 'requiredIpMappings':[], 'createdAt':'2024-01-01T00:00:00Z', 'updatedAt':'2024-01-01T00:00:00Z',
+        }
+        return group_id
+
+
+    def add_acl (self, org_id:str, name:str, rules:list, ip_version:str='any', description:str='') -> str :
+        """
+        Add an Adaptive Policy ACL and return its id.
+        """
+        acl_id = self.new_id(16)
+        self.adaptive_policy[org_id]['acls'][acl_id] = {
+            'aclId':acl_id, 'name':name, 'description':description, 'ipVersion':ip_version, 'rules':rules,
+            'createdAt':'2024-01-01T00:00:00Z', 'updatedAt':'2024-01-01T00:00:00Z',
+        }
+        return acl_id
+
+
+    def add_policy (self, org_id:str, source_id:str, destination_id:str, acl_ids:list, last_entry_rule:str='default') -> str :
+        """
+        Add an Adaptive Policy policy between two groups and return its id.
+        """
+        groups = self.adaptive_policy[org_id]['groups']
+        acls = self.adaptive_policy[org_id]['acls']
+        group_ref = lambda id: {'id':id, 'name':groups[id]['name'], 'sgt':groups[id]['sgt']}
+        policy_id = self.new_id(16)
+        self.adaptive_policy[org_id]['policies'][policy_id] = {
+            'adaptivePolicyId':policy_id, 'sourceGroup':group_ref(source_id), 'destinationGroup':group_ref(destination_id),
+            'acls':[ {'id':id, 'name':acls[id]['name']} for id in acl_ids ], 'lastEntryRule':last_entry_rule,
+            'createdAt':'2024-01-01T00:00:00Z', 'updatedAt':'2024-01-01T00:00:00Z',
+        }
+        return policy_id
+
+
+    def adaptive_policy_change (self, state:dict, kind:str, operation:str, id:str=None, body:dict=None) -> dict :
+        """
+        Create, update, or destroy an Adaptive Policy object in an organization's state and return it.
+        Raises ValueError with the Dashboard error message for an invalid change.
+        @state : the organization's {'groups'|'acls'|'policies' : {id : object}}
+        @kind : 'groups', 'acls', or 'policies'
+        @operation : 'create', 'update', or 'destroy'
+        @id : the object id for `update` and `destroy`
+        @body : the object attributes for `create` and `update`
+        """
+        (objects, body) = (state[kind], body or {})
+        if operation != 'create' and id not in objects :
+            raise ValueError(f"Adaptive policy {kind[:-1]} {id} not found")
+        if operation == 'destroy' :
+            if kind == 'groups' and objects[id]['isDefaultGroup'] :
+                raise ValueError(f"Default group {objects[id]['name']} cannot be deleted")
+            references = { 'groups' : lambda p: id in (p['sourceGroup']['id'], p['destinationGroup']['id']),
+                           'acls'   : lambda p: id in [ acl['id'] for acl in p['acls'] ] }.get(kind)
+            if references and any(references(p) for p in state['policies'].values()) :
+                raise ValueError(f"Adaptive policy {kind[:-1]} {objects[id]['name']} is used by a policy")
+            return objects.pop(id)
+
+        current = objects.get(id, {})
+        if kind == 'groups' :
+            obj = { **current, **{ k:body[k] for k in ['name', 'sgt', 'description'] if k in body } }
+            if not obj.get('name') or 'sgt' not in obj : raise ValueError("'name' and 'sgt' are required")
+            if any(g['sgt'] == obj['sgt'] and gid != id for gid, g in objects.items()) :
+                raise ValueError(f"SGT {obj['sgt']} is already used")
+            if current.get('isDefaultGroup') and obj['sgt'] != current['sgt'] :
+                raise ValueError(f"Default group {current['name']} SGT cannot be changed")
+        elif kind == 'acls' :
+            obj = { **current, **{ k:body[k] for k in ['name', 'description', 'rules', 'ipVersion'] if k in body } }
+            if not obj.get('name') or 'rules' not in obj or 'ipVersion' not in obj : raise ValueError("'name', 'rules', and 'ipVersion' are required")
+            if obj['ipVersion'] not in ['any', 'ipv4', 'ipv6'] : raise ValueError(f"Invalid ipVersion {obj['ipVersion']}")
+            for rule in obj['rules'] :
+                if rule.get('policy') not in ['allow', 'deny'] or rule.get('protocol') not in ['any', 'tcp', 'udp', 'icmp'] :
+                    raise ValueError(f"Invalid rule {rule}")
+        else :
+            def group_ref (ref) :
+                for gid, g in state['groups'].items() :
+                    if ref.get('id') == gid or ('id' not in ref and (ref.get('sgt') == g['sgt'] or ref.get('name') == g['name'])) :
+                        return {'id':gid, 'name':g['name'], 'sgt':g['sgt']}
+                raise ValueError(f"Unknown group {ref}")
+            obj = dict(current)
+            for k in ['sourceGroup', 'destinationGroup'] :
+                if k in body : obj[k] = group_ref(body[k])
+            if 'acls' in body :
+                unknown = [ acl['id'] for acl in body['acls'] if acl['id'] not in state['acls'] ]
+                if unknown : raise ValueError(f"Unknown ACLs {unknown}")
+                obj['acls'] = [ {'id':acl['id'], 'name':state['acls'][acl['id']]['name']} for acl in body['acls'] ]
+            obj['lastEntryRule'] = body.get('lastEntryRule', obj.get('lastEntryRule', 'default'))
+            obj.setdefault('acls', [])
+            if 'sourceGroup' not in obj or 'destinationGroup' not in obj : raise ValueError("'sourceGroup' and 'destinationGroup' are required")
+            if any(p['sourceGroup']['id'] == obj['sourceGroup']['id'] and p['destinationGroup']['id'] == obj['destinationGroup']['id'] and pid != id
+                   for pid, p in objects.items()) :
+                raise ValueError(f"A policy from {obj['sourceGroup']['name']} to {obj['destinationGroup']['name']} already exists")
+        if kind in ['groups', 'acls'] and any(o['name'] == obj['name'] and oid != id for oid, o in objects.items()) :
+            raise ValueError(f"Name {obj['name']} is already used")
+
+        if operation == 'create' :
+            id = self.new_id(16)
+            obj.update({ {'groups':'groupId', 'acls':'aclId', 'policies':'adaptivePolicyId'}[kind] : id, 'createdAt':'2024-01-01T00:00:00Z' })
+            if kind == 'groups' : obj.update({'description':obj.get('description', ''), 'policyObjects':[], 'isDefaultGroup':False, 'requiredIpMappings':[]})
+            if kind == 'acls' : obj.setdefault('description', '')
+        obj['updatedAt'] = '2024-01-02T00:00:00Z'
+        objects[id] = obj
+        if kind == 'groups' :   # keep the group names in the policies current
+            for p in state['policies'].values() :
+                for k in ['sourceGroup', 'destinationGroup'] :
+                    if p[k]['id'] == id : p[k] = {'id':id, 'name':obj['name'], 'sgt':obj['sgt']}
+        if kind == 'acls' :
+            for p in state['policies'].values() :
+                p['acls'] = [ {'id':a['id'], 'name':obj['name'] if a['id'] == id else a['name']} for a in p['acls'] ]
+        return obj
+
+
+    def run_actions (self, org_id:str, batch:dict) :
+        """
+        Run the actions of a batch in order on a copy of the organization's state and keep it only if all succeed.
+        """
+        state = copy.deepcopy(self.adaptive_policy[org_id])
+        prefix = f"/organizations/{org_id}/adaptivePolicy/"
+        try :
+            for (i, action) in enumerate(batch['actions']) :
+                resource = action.get('resource', '')
+                if not resource.startswith(prefix) :
+                    raise ValueError(f"Action {i}: unsupported resource {resource}")
+                (kind, _, id) = resource[len(prefix):].partition('/')
+                if kind not in state or action.get('operation') not in ['create', 'update', 'destroy'] or (action['operation'] == 'create') != (not id) :
+                    raise ValueError(f"Action {i}: unsupported {action.get('operation')} of {resource}")
+                try :
+                    obj = self.adaptive_policy_change(state, kind, action['operation'], id or None, action.get('body'))
+                except ValueError as e :
+                    raise ValueError(f"Action {i}: {e}")
+                if action['operation'] == 'create' :
+                    id = obj[{'groups':'groupId', 'acls':'aclId', 'policies':'adaptivePolicyId'}[kind]]
+                    batch['status']['createdResources'].append({'id':id, 'uri':f"/api/v1{prefix}{kind}/{id}"})
+                self.batch_actions[(kind, action['operation'])] += 1
+        except ValueError as e :
+            batch['status'].update({'failed':True, 'errors':[str(e)], 'createdResources':[]})
+            return
+        self.adaptive_policy[org_id] = state
+        batch['status']['completed'] = True
+
+
+    async def run_batch (self, org_id:str, batch:dict) :
+        """
+        Run an action batch after `batch_latency` seconds per action.
+        """
+        try :
+            if self.batch_latency :
+                await asyncio.sleep(self.batch_latency * len(batch['actions']))
+            self.run_actions(org_id, batch)
+        finally :
+            batch.pop('running', None)
+
+
+    #--------------------------------------------------------------------------
+    # Middleware
+    #--------------------------------------------------------------------------
+
+    def request_org (self, request:web.Request) -> str :
+        """
+        Returns the organization id a request counts against or None.
+        """
+        info = request.match_info
+        if 'org_id' in info :
+            return info['org_id']
+        if 'network_id' in info and info['network_id'] in self.networks :
+            return self.networks[info['network_id']]['organizationId']
+        return None
+
+
+    def rate_limited (self, org_id:str) -> bool :
+        """
+        Returns True when the organization exceeded its request rate.
+        """
+        if self.org_rate is None or org_id is None :
+            return False
+        now = time.monotonic()
+        (tokens, updated) = self.buckets.get(org_id, [self.org_rate, now])
+        tokens = min(self.org_rate, tokens + (now - updated) * self.org_rate)
+        if tokens < 1 :
+            self.buckets[org_id] = [tokens, now]
+            return True
+        self.buckets[org_id] = [tokens - 1, now]
+        return False
+
+
+    @web.middleware
+    async def middleware (self, request:web.Request, handler) -> web.Response :
+        """
+        Count requests, apply the per-organization rate limit, and delay responses.
+        """
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.requests[(request.method, route)] += 1
+        org_id = self.request_org(request)
+        if org_id is not None :
+            self.org_requests[org_id] += 1
+            if org_id not in self.orgs :
+                return meraki_error(404, 'Not found')
+            if not self.orgs[org_id]['api']['enabled'] :
+                return meraki_error(404, 'API is not enabled for this organization')
+        if self.rate_limited(org_id) :
+            self.rejected[org_id] += 1
+            return web.json_response({'errors':['API rate limit exceeded for organization']}, status=429, headers={'Retry-After':str(MOCK_RETRY_AFTER)})
+        self.in_flight += 1
+        self.high_water = max(self.high_water, self.in_flight)
+        try :
+            if self.latency or self.jitter :
+                await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+            return await handler(request)
+        finally :
+            self.in_flight -= 1
+
+
+    #--------------------------------------------------------------------------
+    # Handlers
+    #--------------------------------------------------------------------------
+
+    def page (self, request:web.Request, items:list, key:str) -> web.Response :
+        """
+        Returns a page of items sorted by `key` after `startingAfter` with a relative `Link` to the next page.
+        """
+        per_page = min(int(request.query.get('perPage', MOCK_PER_PAGE_MAX)), MOCK_PER_PAGE_MAX)
+        items = sorted(items, key=lambda item: item[key])
+        starting_after = request.query.get('startingAfter')
+        if starting_after is not None :
+            items = [ item for item in items if item[key] > starting_after ]
+        headers = {}
+        if len(items) > per_page :
+            path = request.path[len(MOCK_BASE_PATH):]
+            headers['Link'] = f"<{path}?perPage={per_page}&startingAfter={items[per_page - 1][key]}>; rel=next"
+        return web.json_response(items[:per_page], headers=headers)
+
+
+    async def get_organizations (self, request:web.Request) -> web.Response :
+        return self.page(request, list(self.orgs.values()), 'id')
+
+
+    async def get_organization_networks (self, request:web.Request) -> web.Response :
+        org_id = request.match_info['org_id']
+        return self.page(request, [ n for n in self.networks.values() if n['organizationId'] == org_id ], 'id')
+
+
+    async def get_organization_devices (self, request:web.Request) -> web.Response :
+        org_id = request.match_info['org_id']
+        return self.page(request, [ d for d in self.devices.values() if d['organizationId'] == org_id ], 'serial')
+
+
+    async def get_network_devices (self, request:web.Request) -> web.Response :
+        network_id = request.match_info['network_id']
+        if network_id not in self.networks :
+            return meraki_error(404, 'Not found')
+        return web.json_response([ d for d in self.devices.values() if d['networkId'] == network_id ])
+
+
+    async def get_adaptive_policy (self, request:web.Request) -> web.Response :
+        (org_id, kind) = (request.match_info['org_id'], request.match_info['kind'])
+        return web.json_response(list(self.adaptive_policy[org_id][kind].values()))
+
+
+    async def get_adaptive_policy_item (self, request:web.Request) -> web.Response :
+        (org_id, kind, id) = (request.match_info['org_id'], request.match_info['kind'], request.match_info['id'])
+        if id not in self.adaptive_policy[org_id][kind] :
+            return meraki_error(404, 'Not found')
+        return web.json_response(self.adaptive_policy[org_id][kind][id])
+
+
+    async def create_adaptive_policy (self, request:web.Request) -> web.Response :
+        (org_id, kind) = (request.match_info['org_id'], request.match_info['kind'])
+        try :
+            return web.json_response(self.adaptive_policy_change(self.adaptive_policy[org_id], kind, 'create', body=await request.json()), status=201)
+        except ValueError as e :
+            return meraki_error(400, str(e))
+
+
+    async def update_adaptive_policy (self, request:web.Request) -> web.Response :
+        (org_id, kind, id) = (request.match_info['org_id'], request.match_info['kind'], request.match_info['id'])
+        if id not in self.adaptive_policy[org_id][kind] :
+            return meraki_error(404, 'Not found')
+        try :
+            return web.json_response(self.adaptive_policy_change(self.adaptive_policy[org_id], kind, 'update', id, await request.json()))
+        except ValueError as e :
+            return meraki_error(400, str(e))
+
+
+    async def delete_adaptive_policy (self, request:web.Request) -> web.Response :
+        (org_id, kind, id) = (request.match_info['org_id'], request.match_info['kind'], request.match_info['id'])
+        if id not in self.adaptive_policy[org_id][kind] :
+            return meraki_error(404, 'Not found')
+        try :
+            self.adaptive_policy_change(self.adaptive_policy[org_id], kind, 'destroy', id)
+        except ValueError as e :
+            return meraki_error(400, str(e))
+        return web.Response(status=204)
+
+
+    def batch_response (self, batch:dict) -> dict :
+        return { k:v for k,v in batch.items() if k != 'running' }
+
+
+    async def create_action_batch (self, request:web.Request) -> web.Response :
+        org_id = request.match_info['org_id']
+        body = await request.json()
+        (actions, synchronous, confirmed) = (body.get('actions', []), body.get('synchronous', False), body.get('confirmed', False))
+        if not actions :
+            return meraki_error(400, "'actions' must not be empty")
+        if len(actions) > (MOCK_BATCH_SYNC_SIZE if synchronous else MOCK_BATCH_SIZE) :
+            return meraki_error(400, f"{'Synchronous' if synchronous else 'Asynchronous'} batches have at most {MOCK_BATCH_SYNC_SIZE if synchronous else MOCK_BATCH_SIZE} actions")
+        running = sum(1 for b in self.batches.values() if b['organizationId'] == org_id and b.get('running'))
+        if confirmed and running >= MOCK_BATCH_RUNNING :
+            return meraki_error(400, f"Too many concurrently executing batches. Maximum is {MOCK_BATCH_RUNNING} confirmed but not yet executed batches.")
+        batch = {
+            'id':self.new_id(), 'organizationId':org_id, 'confirmed':confirmed, 'synchronous':synchronous, 'actions':actions,
+            'status':{'completed':False, 'failed':False, 'errors':[], 'createdResources':[]},
+        }
+        self.batches[batch['id']] = batch
+        if confirmed :
+            batch['running'] = True
+            self.batch_high_water = max(self.batch_high_water, running + 1)
+            if synchronous :
+                await self.run_batch(org_id, batch)
+            else :
+                task = asyncio.create_task(self.run_batch(org_id, batch))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+        return web.json_response(self.batch_response(batch), status=201)
+
+
+    async def get_action_batch (self, request:web.Request) -> web.Response :
+        (org_id, id) = (request.match_info['org_id'], request.match_info['id'])
+        if id not in self.batches or self.batches[id]['organizationId'] != org_id :
+            return meraki_error(404, 'Not found')
+        return web.json_response(self.batch_response(self.batches[id]))
+
+
+    def app (self) -> web.Application :
+        """
+        Returns the aiohttp application.
+        """
+        app = web.Application(middlewares=[self.middleware])
+        base = MOCK_BASE_PATH
+        kinds = '{kind:groups|acls|policies}'
+        app.router.add_get(f"{base}/organizations", self.get_organizations)
+        app.router.add_get(f"{base}/organizations/{{org_id}}/networks", self.get_organization_networks)
+        app.router.add_get(f"{base}/organizations/{{org_id}}/devices", self.get_organization_devices)
+        app.router.add_get(f"{base}/networks/{{network_id}}/devices", self.get_network_devices)
+        app.router.add_get(f"{base}/organizations/{{org_id}}/adaptivePolicy/{kinds}", self.get_adaptive_policy)
+        app.router.add_get(f"{base}/organizations/{{org_id}}/adaptivePolicy/{kinds}/{{id}}", self.get_adaptive_policy_item)
+        app.router.add_post(f"{base}/organizations/{{org_id}}/adaptivePolicy/{kinds}", self.create_adaptive_policy)
+        app.router.add_put(f"{base}/organizations/{{org_id}}/adaptivePolicy/{kinds}/{{id}}", self.update_adaptive_policy)
+        app.router.add_delete(f"{base}/organizations/{{org_id}}/adaptivePolicy/{kinds}/{{id}}", self.delete_adaptive_policy)
+        app.router.add_post(f"{base}/organizations/{{org_id}}/actionBatches", self.create_action_batch)
+        app.router.add_get(f"{base}/organizations/{{org_id}}/actionBatches/{{id}}", self.get_action_batch)
+        return app
+
+
+    async def start (self, host:str=MOCK_HOST, port:int=MOCK_PORT) -> web.AppRunner :
+        """
+        Start serving on the host and port and return the runner to `cleanup()`.
+        """
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def seed_inventory (mock:MockDashboard, orgs:int, networks:int, devices:int) -> list :
+    """
+    Add organizations with networks and devices of random models and return the organization ids.
+    @orgs : the number of organizations
+    @networks : the networks per organization
+    @devices : the devices per network
+    """
+    org_ids = []
+    for o in range(orgs) :
+        org_id = mock.add_organization(f"org_{o}")
+        for n in range(networks) :
+            network_id = mock.add_network(org_id, f"org_{o}_net_{n}")
+            for _ in range(devices) :
+                mock.add_device(network_id, mock.random.choice(MOCK_MODELS))
+        org_ids.append(org_id)
+    return org_ids
+
+
+async def main () :
+    """
+    Entrypoint for local script.
+    """
+    argp = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argp.add_argument('--host', default=MOCK_HOST, help='listen address')
+    argp.add_argument('-p', '--port', type=int, default=MOCK_PORT, help='listen port')
+    argp.add_argument('-o', '--orgs', type=int, default=1, help='organizations to create')
+    argp.add_argument('-n', '--networks', type=int, default=3, help='networks per organization')
+    argp.add_argument('-d', '--devices', type=int, default=5, help='devices per network')
+    argp.add_argument('-l', '--latency', type=float, default=0, help='seconds to delay every response')
+    argp.add_argument('-j', '--jitter', type=float, default=0, help='maximum random seconds added to the latency')
+    argp.add_argument('-r', '--org-rate', type=float, default=MOCK_ORG_RATE, help='maximum requests per second per organization before 429 responses')
+    argp.add_argument('-b', '--batch-latency', type=float, default=0, help='seconds to run each action of an action batch')
+    args = argp.parse_args()
+
+    mock = MockDashboard(latency=args.latency, jitter=args.jitter, org_rate=args.org_rate, batch_latency=args.batch_latency)
+    seed_inventory(mock, args.orgs, args.networks, args.devices)
+    runner = await mock.start(args.host, args.port)
+    print(f"ⓘ Mock Meraki Dashboard on http://{args.host}:{args.port}{MOCK_BASE_PATH}")
+    try :
+        while True :
+            await asyncio.sleep(3600)
+    finally :
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    """
+    Entrypoint for local script.
+    """
+    try :
+        asyncio.run(main())
+    except KeyboardInterrupt :
+        pass
+    sys.exit(0) # 0 is ok
@@ -8,6 +8,8 @@ Examples:
     excel_trustsec_matrix_to_ise.py -v
     excel_trustsec_matrix_to_ise.py -f ise_trustsec_matrix_default.xlsx
     excel_trustsec_matrix_to_ise.py -vvv -it
+    excel_trustsec_matrix_to_ise.py --bulk -f ise_trustsec_matrix_default.xlsx
+    excel_trustsec_matrix_to_ise.py --sync -f ise_trustsec_matrix.xlsx
 
 Requires setting the these environment variables using the `export` command:
   export ISE_PPAN='1.2.3.4'             # hostname or IP address of ISE PAN
@@ -33,206 +35,163 @@ import os
 import random
 import sys
 import time
+import traceback
+import openpyxl
 import pandas as pd
 from tabulate import tabulate
+from ise_ers import ISEERS, RETRY_ATTEMPTS, count_failed, show_results
+from ise_trustsec_clear import ise_trustsec_clear
+from trustsec_matrix import TrustSecMatrix
+from trustsec_metrics import Metrics
+from trustsec_profile import RunProfiler
 
 # Globals
 DATA_DIR = './'
 DEFAULT_TRUSTSEC_FILENAME = 'ise_trustsec_matrix.xlsx'
 
-# REST Options
-JSON_HEADERS = {'Accept':'application/json', 'Content-Type':'application/json'}
-REST_PAGE_SIZE_DEFAULT=20
-REST_PAGE_SIZE_MAX=100
-REST_PAGE_SIZE=REST_PAGE_SIZE_MAX
-
-# Limit TCP connection pool size to prevent connection refusals by ISE!
-# 30 for ISE 2.6+; See https://cs.co/ise-scale for Concurrent ERS Connections.
-# Testing with ISE 3.0 shows *no* performance gain for >5-10
-TCP_CONNECTIONS_DEFAULT=10
-TCP_CONNECTIONS_MAX=30
-TCP_CONNECTIONS=5
-
-# CSV table for ISE REST API resource names and mappings
-REST_ENDPOINT_URLS = """
-'resource',         'object',           'url'
-'sgt',              'Sgt',              '/ers/config/sgt'
-'sgacl',            'Sgacl',            '/ers/config/sgacl'
-'egressmatrixcell', 'EgressMatrixCell', '/ers/config/egressmatrixcell'
-"""
-
 # This hidden SGT is required for lookups with the default ANY-ANY SGACL.
 SGT_ANY = {'id':'92bb1950-8c01-11e6-996c-525400b48521', 'name':'ANY', 'description':'ANY', 'value':65535, 'generationId':0, 'propogateToApic':False}
 
+# Reserved ISE objects that may be referenced but never created, updated, or deleted
+RESERVED_SGT_NAMES = ['Unknown', 'TrustSec_Devices', 'ANY']
+RESERVED_SGACL_NAMES = ['Deny IP', 'Deny_IP_Log', 'Permit IP', 'Permit_IP_Log']
 
-async def get_ise_resource (session, url) :
-    async with session.get(url) as resp:
-        json = await resp.json()
-        # if args.verbose >= 3 : print(f"ⓘ get_ise_resource({url}): {json}")
-        return json['SearchResult']['resources']
+# Matrix cell values without SGACLs that use an egress cell default rule instead
+CELL_DEFAULT_RULES = ['DENY_IP', 'PERMIT_IP']
 
+RESULT_ICONS = {'create':'🌟', 'update':'🔄', 'delete':'⌫'}
 
-async def get_ise_resources (session, path) :
-    """
-    Fetch the resources from ISE.
-    @session : the aiohttp session to reuse
-    @path : the REST endpoint path
-    """
-    if args.verbose >= 3 : print(f"ⓘ get_ise_resources({path})")
-
-    # Get the first page for the total resources
-    response = await session.get(f"{path}?size={REST_PAGE_SIZE}")
-    if response.status != 200:
-        raise ValueError(f"Bad status: {response}")
-    json = await response.json()
-    total = json['SearchResult']['total']
-    resources = json['SearchResult']['resources']
-    if args.verbose >= 3 : print(f"ⓘ get_ise_resources({path}): Total: {total}")
-
-    # Get all remaining resources if more than the REST page size
-    if total > REST_PAGE_SIZE :
-        pages = int(total / REST_PAGE_SIZE) + (1 if total % REST_PAGE_SIZE else 0)
-        
-        # Generate all paging URLs 
-        urls = []
-        for page in range(2, pages + 1): # already fetched first page above
-            urls.append(f"{path}?size={REST_PAGE_SIZE}&page={page}")
-
-        # Get all pages with asyncio!
-        tasks = []
-        [ tasks.append(asyncio.ensure_future(get_ise_resource(session, url))) for url in urls ]
-        responses = await asyncio.gather(*tasks)
-        [ resources.extend(response) for response in responses ]
-
-    # remove ugly 'link' attribute to flatten data
-    for r in resources:
-        if type(r) == dict and r.get('link'): 
-            del r['link']
-
-    return resources
-
-
-async def get_ise_resource_details (session, ers_name, path) :
+
+def cell_rule (names) :
     """
-    Fetch the resources from ISE.
-    @session : the aiohttp session to reuse
-    @ers_name : the ERS object name in the JSON
-    @path : the REST endpoint path
+    Returns the (SGACL names, default rule) of a matrix cell: a single CELL_DEFAULT_RULES value
+    is the cell's default rule without SGACLs, anything else is a list of SGACL names.
+    @names : the cell's comma-separated values as a list of stripped names
     """
-    if args.verbose >= 3 : print(f"ⓘ get_ise_resource_details({ers_name}, {path})")
-
-    # Get all resources for their UUIDs
-    resources = await get_ise_resources(session, path)
+    if len(names) == 1 and names[0] in CELL_DEFAULT_RULES :
+        return ([], names[0])
+    return (names, 'NONE')
 
-    # Save UUIDs
-    uuids = [r['id'] for r in resources]
-    resources = [] # clear list for detailed data
-    for uuid in uuids:
-        async with session.get(f"{path}/{uuid}") as resp:
-            json = await resp.json()
-            resources.append(json[ers_name])
 
-    # remove ugly 'link' attribute to flatten data
-    for r in resources:
-        if type(r) == dict and r.get('link'): 
-            del r['link']
-
-    return resources
-
-
-async def delete_ise_resources (session, ers_name, path, resources) :
+def iter_worksheet_records (filename, sheet_name) :
     """
-    POST the resources to ISE.
-    @session : the aiohttp session to reuse
-    @ers_name : the ERS object name in the JSON
-    @path : the REST endpoint path
-    @resources : a list of resources identifiers (id or name)
+    Yields each non-empty row of a worksheet as a {column : value} dict with empty values as ''.
+    The workbook is parsed read-only, one row at a time.
+    @filename : the Excel workbook filename
+    @sheet_name : the worksheet name
     """
-    if args.verbose >= 3 : print(f"ⓘ > delete_ise_resources({ers_name}, {path}, {len(df)})")
-
-    for resource in resources :
-        if args.verbose >= 3 : print(f"delete resource: {path}/{resource}")
-        async with session.delete(f"{path}/{resource}") as resp:
-            if resp.ok : print(f"⌫ {resp.status} {resource}")
-            # elif resp.status == 400 : print(f"ⓘ  {resp.status} {row['name']} {(await resp.json())['ERSResponse']['messages'][0]['title']}")
-            else : print(f"❌ {resp.status} {(await resp.json())['ERSResponse']['messages'][0]['title']}")
-
-    if args.verbose >= 3 : print(f"ⓘ < delete_ise_resources({ers_name}, {path}) {len(resources)}")
-
+    workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    try :
+        rows = workbook[sheet_name].iter_rows(values_only=True)
+        columns = next(rows, ())
+        for row in rows :
+            if any(value is not None for value in row) :
+                yield { column : ('' if value is None else value) for column, value in zip(columns, row) if column is not None }
+    finally :
+        workbook.close()
 
 
-async def post_simple_ise_resources (session, ers_name, path, df) :
+def iter_matrix_rows (filename) :
+    """
+    Yields ({'name', 'value', 'description'}, [(destination SGT name, cell value), ...]) for each
+    source SGT row of the `Matrix` worksheet with only its non-empty cells.
+    The workbook is parsed read-only, one row at a time.
+    @filename : the Excel workbook filename
+    """
+    workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    try :
+        rows = workbook['Matrix'].iter_rows(values_only=True)
+        destinations = next(rows, ())[3:]  # ['SGT', 'Value', 'Description', {SGT names}...]
+        for row in rows :
+            if not row or row[0] is None : continue
+            sgt = { 'name':str(row[0]), 'value':int(row[1]), 'description':('' if row[2] is None else str(row[2])) }
+            cells = [ (dst, str(val).strip()) for dst, val in zip(destinations, row[3:]) if val is not None and str(val).strip() ]
+            yield (sgt, cells)
+    finally :
+        workbook.close()
+
+
+async def apply_ise_resources (ise, resource, operation, resources) :
+    """
+    Create, update, or delete the resources in ISE, show and return the results.
+    @ise : the ISEERS client to reuse
+    @resource : the ERS resource name
+    @operation : 'create', 'update', or 'delete'
+    @resources : a list of resource attribute dicts for `create` and `update` or UUIDs for `delete`
+    """
+    if len(resources) == 0 :
+        return []
+    if args.bulk :
+        results = await ise.bulk(resource, operation, resources)
+    elif operation == 'create' :
+        results = await ise.create_resources(resource, resources)
+    elif operation == 'update' :
+        results = await ise.update_resources(resource, resources)
+    else :
+        results = await ise.delete_resources(resource, resources)
+    show_results(results, icon=RESULT_ICONS[operation])
+    return results
+
+
+async def post_simple_ise_resources (ise, resource, df) :
     """
-    POST the resources to ISE.
-    @session : the aiohttp session to reuse
-    @ers_name : the ERS object name in the JSON
-    @path : the REST endpoint path
+    POST the resources to ISE and return the ({name : id} of all resources of that type, failed creates).
+    The ids, including those of the reserved resources, are from the list pages instead of a GET per resource.
+    @ise : the ISEERS client to reuse
+    @resource : the ERS resource name
     @df : the dataframe of resources to create
     """
-    if args.verbose >= 3 : print(f"ⓘ > post_simple_ise_resources({ers_name}, {path}, {len(df)})")
+    if args.verbose >= 3 : print(f"ⓘ > post_simple_ise_resources({resource}, {len(df)})")
 
-    for row in df.to_dict('records'):
-        if args.verbose >= 3 : print(f"row: {row}")
-        resource = { ers_name : row }
-        if args.verbose >= 3 : print(f"resource: {resource}")
-        if args.verbose >= 3 : print(f"resource as json: {json.dumps(resource)}")
-        async with session.post(f"{path}", data=json.dumps(resource)) as resp:
-            if resp.ok : print(f"🌟 {resp.status} {row['name']}")
-            elif resp.status == 400 : print(f"ⓘ  {resp.status} {row['name']} {(await resp.json())['ERSResponse']['messages'][0]['title']}")
-            else : print(f"❌ {resp.status} {(await resp.json())['ERSResponse']['messages'][0]['title']}")
+    results = await apply_ise_resources(ise, resource, 'create', df.to_dict('records'))
 
-    # Get newly created resources
-    resources = await get_ise_resources(session, path)
-    resources = await get_ise_resource_details(session, ers_name, path)
+    # Get the ids of the newly created resources
+    ids = { r['name'] : r['id'] for r in await ise.get_resources(resource) }
 
-    if args.verbose >= 3 : print(f"ⓘ < post_simple_ise_resources({ers_name}, {path}) {len(resources)}")
+    if args.verbose >= 3 : print(f"ⓘ < post_simple_ise_resources({resource}) {len(ids)}")
 
-    return resources
+    return (ids, count_failed(results))
 
 
-async def excel_trustsec_matrix_to_ise (session, filename) :
+def read_workbook (filename) -> tuple :
     """
-    Read the TrustSec Matrix, SGTs, and SGACLs from Excel and load into ISE.
+    Returns the (matrix, df_sgacls) of the `Matrix` and `SGACLs` worksheets.
+    The workbook is parsed once, read-only, one row at a time, and only the non-empty matrix cells are kept.
+    @filename : the Excel workbook filename
+    """
+    matrix = TrustSecMatrix.from_rows(iter_matrix_rows(filename))
+    df_sgacls = pd.DataFrame(iter_worksheet_records(filename, 'SGACLs'))
+    return (matrix, df_sgacls)
+
+
+async def excel_trustsec_matrix_to_ise (ise, matrix, df_sgacls) :
+    """
+    Load the TrustSec Matrix, SGTs, and SGACLs read from Excel into ISE and return the number of failures.
+    @ise : the ISEERS client to reuse
+    @matrix : the TrustSecMatrix of the `Matrix` worksheet from `read_workbook()`
+    @df_sgacls : the dataframe of the `SGACLs` worksheet from `read_workbook()`
     """
-    
-    #--------------------------------------------------------------------------
-    # Read Excel Workbook with Worksheets ['Matrix', 'SGACLs']
-    #--------------------------------------------------------------------------
-    # df_sgts = pd.read_excel(filename, sheet_name='SGTs').fillna('')
-    df_sgacls = pd.read_excel(filename, sheet_name='SGACLs').fillna('')
-    df_matrix = pd.read_excel(filename, sheet_name='Matrix').fillna('')
-    
-    # print(f"\nSGTs:\n{df_sgts.to_markdown(index=False, tablefmt='simple_grid')}")
     if args.verbose >= 3 : print(f"\nSGACLs:\n{df_sgacls.to_markdown(index=False, tablefmt='simple_grid')}")
-    if args.verbose >= 3 : print(f"\nMatrix:\n{df_matrix.to_markdown(index=False, tablefmt='simple_grid')}")
 
     #--------------------------------------------------------------------------
     # Configure SGTs from Matrix
     #--------------------------------------------------------------------------
-    df_sgts = df_matrix[['SGT','Value','Description']].copy()
-    df_sgts.rename(columns={'SGT':'name','Value':'value','Description':'description'}, inplace=True)
-
-    # remove Reserved SGTs
-    RESERVED_SGT_NAMES = ['Unknown', 'TrustSec_Devices']
-    for name in RESERVED_SGT_NAMES :
-        df_sgts.drop(df_sgts[df_sgts['name'] == name].index, inplace=True)
-
-    # if args.verbose : print(f"ⓘ Creating {len(df_sgts)} SGTs ...")
-    sgts = await post_simple_ise_resources (session, 'Sgt', '/ers/config/sgt', df_sgts)
-    if args.verbose >= 3 : print(f"\nⓘ SGTs:\n{sgts}")
+    df_matrix_sgts = matrix.sgts.reset_index()[['name', 'value', 'description']]
+    df_matrix_sgts = df_matrix_sgts[~df_matrix_sgts['name'].isin(RESERVED_SGT_NAMES)]   # remove Reserved SGTs
 
     #--------------------------------------------------------------------------
     # Configure SGACLs
     #--------------------------------------------------------------------------
-    df_sgacls.drop(['generationId'], axis='columns', inplace=True)
+    df_sgacls = df_sgacls.drop(['generationId'], axis='columns', errors='ignore')
 
     # remove Reserved SGACLs
-    RESERVED_SGACL_NAMES = ['Deny IP', 'Deny_IP_Log', 'Permit IP', 'Permit_IP_Log']
     for name in RESERVED_SGACL_NAMES :
         df_sgacls.drop(df_sgacls[df_sgacls['name'] == name].index, inplace=True)
 
-    sgacls = await post_simple_ise_resources (session, 'Sgacl', '/ers/config/sgacl', df_sgacls)
-    if args.verbose >= 3 : print(f"\nⓘ SGACLs:\n{sgacls}")
+    with ise.metrics.phase('apply') :
+        ((sgt_ids, sgt_failed), (sgacl_ids, sgacl_failed)) = await asyncio.gather(post_simple_ise_resources(ise, 'sgt', df_matrix_sgts), post_simple_ise_resources(ise, 'sgacl', df_sgacls))
+    if args.verbose >= 3 : print(f"\nⓘ SGTs:\n{sgt_ids}")
+    if args.verbose >= 3 : print(f"\nⓘ SGACLs:\n{sgacl_ids}")
 
     #--------------------------------------------------------------------------
     # Configure Matrix Cell JSON:
@@ -250,45 +209,211 @@ async def excel_trustsec_matrix_to_ise (session, filename) :
     #     }
     # }
     #--------------------------------------------------------------------------
-    df_sgts = pd.DataFrame(sgts)
-    df_sgts.set_index('name', inplace=True)
-    print(f"\nⓘ SGTs:\n{df_sgts[['value','description','generationId','propogateToApic']].to_markdown(tablefmt='simple_grid')}")
-
-    df_sgacls = pd.DataFrame(sgacls)
-    df_sgacls.set_index('name', inplace=True)
-    # print(f"\nⓘ SGACLs:\n{df_sgacls.to_markdown(tablefmt='simple_grid')}")
-    print(f"\nⓘ SGACLs:\n{df_sgacls.drop(['id'], axis='columns').to_markdown(tablefmt='simple_grid')}")
+    print(f"\nⓘ SGTs:\n{df_matrix_sgts.set_index('name').to_markdown(tablefmt='simple_grid')}")
+    print(f"\nⓘ SGACLs:\n{df_sgacls.set_index('name').drop(['id'], axis='columns', errors='ignore').to_markdown(tablefmt='simple_grid')}")
+    
+    with ise.metrics.phase('resolve') :
+        resources = []
+        for (src, dst, val) in ( (matrix.name(src), matrix.name(dst), val) for (src, dst, val) in matrix.cells() ) :
+            if args.verbose >= 3 : print(f"ⓘ src: {src} | dst: {dst} | val: {val}")
+            (sgacl_names, default_rule) = cell_rule([ name.strip() for name in val.split(',') if name.strip() ])
+            resources.append(
+              {
+                "name": f"{src}-{dst}",                     # <= 32 characters
+                "description": "",                          # <= 256 characters
+                "sourceSgtId": sgt_ids[src],                # UUID
+                "destinationSgtId": sgt_ids[dst],           # UUID
+                "matrixCellStatus": "ENABLED",              # ['ENABLED' | 'DISABLED' | 'MONITOR']
+                "sgacls": [                                 # list of SGACL UUIDs
+                    sgacl_ids[name] for name in sgacl_names
+                ],
+                "defaultRule": default_rule                 # ['NONE','DENY_IP','PERMIT_IP']
+              }
+            )
+    with ise.metrics.phase('apply') :
+        results = await apply_ise_resources(ise, 'egressmatrixcell', 'create', resources)   # nothing references the cells so they are not listed again
+    return sgt_failed + sgacl_failed + count_failed(results)
     
-    resources = []
-    for row in df_matrix.to_dict('records') :
-        for col,val in row.items() :
-            if args.verbose >= 3 : print(f"ⓘ row: {row} | col: {col} | val: {val}")
-            if col not in ['SGT','Value','Description'] and val :
-                resources.append(
-                  {
-                    "name": f"{row['SGT']}-{col}",              # <= 32 characters
+
+def diff_resources (current, desired, fields) :
+    """
+    Returns the (creates, updates, deletes) to change the current resources into the desired resources.
+    Both are dicts keyed by name so the diff is a single pass over each.
+    @current : a dict of {name : resource} from ISE, each with an `id`
+    @desired : a dict of {name : resource} to configure
+    @fields : the attribute names to compare
+    """
+    creates = [ r for name, r in desired.items() if name not in current ]
+    updates = [ { **current[name], **r } for name, r in desired.items()
+                if name in current and any(current[name].get(f, '') != r.get(f, '') for f in fields) ]
+    deletes = [ r['id'] for name, r in current.items() if name not in desired ]
+    return (creates, updates, deletes)
+
+
+def workbook_trustsec_state (filename) :
+    """
+    Returns the (sgts, sgacls, cells, sgacl_columns) configured in the `Matrix` and `SGACLs` worksheets.
+    SGTs and SGACLs are keyed by name and cells by (source, destination) SGT names with a list of SGACL names.
+    The worksheets are streamed read-only so only the non-empty matrix cells are kept.
+    @filename : the Excel workbook filename
+    """
+    matrix = TrustSecMatrix.from_rows(iter_matrix_rows(filename))
+    sgts = {
+        sgt.name : { 'name':sgt.name, 'value':int(sgt.value), 'description':str(sgt.description) }
+        for sgt in matrix.sgts.reset_index().itertuples(index=False)
+    }
+    sgacls = {}
+    sgacl_columns = set()
+    for row in iter_worksheet_records(filename, 'SGACLs') :
+        sgacl_columns.update(row.keys())
+        sgacl = { 'name':row['name'], 'description':str(row.get('description', '')), 'aclcontent':str(row.get('aclcontent', '')) }
+        if 'ipVersion' in row : sgacl['ipVersion'] = row['ipVersion'] or 'IP_AGNOSTIC'
+        sgacls[row['name']] = sgacl
+
+    cells = {
+        (matrix.name(src), matrix.name(dst)) : [ name.strip() for name in val.split(',') if name.strip() ]
+        for (src, dst, val) in matrix.cells()
+    }
+    return (sgts, sgacls, cells, sgacl_columns)
+
+
+def check_workbook_cells (matrix, df_sgacls) :
+    """
+    Raise a ValueError if a matrix cell references an SGACL that is neither in the `SGACLs` worksheet
+    nor reserved. Check before clearing ISE so an invalid workbook never leaves ISE empty.
+    @matrix : the TrustSecMatrix of the `Matrix` worksheet from `read_workbook()`
+    @df_sgacls : the dataframe of the `SGACLs` worksheet from `read_workbook()`
+    """
+    known = set(df_sgacls.get('name', [])) | set(RESERVED_SGACL_NAMES)
+    errors = []
+    for (src, dst, val) in matrix.cells() :
+        missing = [ name for name in cell_rule([ name.strip() for name in val.split(',') if name.strip() ])[0] if name not in known ]
+        if missing :
+            errors.append(f"{matrix.name(src)}-{matrix.name(dst)}: {missing}")
+    if errors :
+        raise ValueError(f"{len(errors)} matrix cells with unknown SGACLs, ISE is unchanged: {errors[:10]}")
+
+
+async def sync_trustsec_matrix_to_ise (ise, filename) :
+    """
+    Read the TrustSec Matrix and SGACLs from Excel and only create, update, or delete
+    the SGTs, SGACLs, and egress matrix cells in ISE that differ from the workbook.
+    Returns the number of failed changes and unresolved cells.
+    """
+    def read_workbook () :
+        with ise.metrics.phase('read') :
+            return workbook_trustsec_state(filename)
+
+    # Parse the workbook in a thread while the current ISE state is fetched concurrently
+    with ise.metrics.phase('fetch') :
+        (workbook, sgts, sgacls, cells) = await asyncio.gather(
+            asyncio.to_thread(read_workbook),
+            ise.get_resource_details('sgt'),
+            ise.get_resource_details('sgacl'),
+            ise.get_resource_details('egressmatrixcell'),
+        )
+
+    with ise.metrics.phase('diff') :
+        (want_sgts, want_sgacls, want_cells, sgacl_columns) = workbook
+        sgts = { r['name'] : r for r in sgts + [SGT_ANY] }
+        sgacls = { r['name'] : { 'ipVersion':'IP_AGNOSTIC', **r } for r in sgacls }  # ipVersion is not returned when IP_AGNOSTIC
+
+        # Diff SGTs and SGACLs by name and value, ignoring reserved objects
+        sgt_changes = diff_resources(
+            { k:v for k,v in sgts.items() if k not in RESERVED_SGT_NAMES },
+            { k:v for k,v in want_sgts.items() if k not in RESERVED_SGT_NAMES },
+            ['value', 'description'])
+        sgacl_fields = ['description', 'aclcontent'] + (['ipVersion'] if 'ipVersion' in sgacl_columns else [])
+        sgacl_changes = diff_resources(
+            { k:v for k,v in sgacls.items() if k not in RESERVED_SGACL_NAMES },
+            { k:v for k,v in want_sgacls.items() if k not in RESERVED_SGACL_NAMES },
+            sgacl_fields)
+        for (name, (creates, updates, deletes)) in [('SGTs', sgt_changes), ('SGACLs', sgacl_changes)] :
+            print(f"ⓘ {name}: {len(creates)} create, {len(updates)} update, {len(deletes)} delete")
+
+    # Create and update SGTs and SGACLs before the cells that reference them
+    with ise.metrics.phase('apply') :
+        results = await asyncio.gather(
+            apply_ise_resources(ise, 'sgt', 'create', sgt_changes[0]),
+            apply_ise_resources(ise, 'sgacl', 'create', sgacl_changes[0]),
+            apply_ise_resources(ise, 'sgt', 'update', sgt_changes[1]),
+            apply_ise_resources(ise, 'sgacl', 'update', sgacl_changes[1]),
+        )
+    (sgt_results, sgacl_results) = results[:2]
+    failed = sum(count_failed(r) for r in results)
+
+    with ise.metrics.phase('diff') :
+        sgt_ids = { name : r['id'] for name, r in sgts.items() }
+        sgt_ids.update({ r['name'] : r['id'] for r in sgt_results if isinstance(r, dict) and r['id'] })
+        sgacl_ids = { name : r['id'] for name, r in sgacls.items() }
+        sgacl_ids.update({ r['name'] : r['id'] for r in sgacl_results if isinstance(r, dict) and r['id'] })
+
+        # Diff the cells by (source, destination) SGT names
+        sgt_names = { id : name for name, id in sgt_ids.items() }
+        sgacl_names = { id : name for name, id in sgacl_ids.items() }
+        current_cells = {}
+        for cell in cells :
+            key = (sgt_names.get(cell['sourceSgtId']), sgt_names.get(cell['destinationSgtId']))
+            if key != ('ANY', 'ANY') :   # never change the default ANY-ANY egress rule
+                current_cells[key] = cell
+
+        cell_sgacl_names = lambda cell: [ sgacl_names.get(id) for id in cell.get('sgacls', []) ]
+        cell_default_rule = lambda cell: 'NONE' if cell.get('sgacls') else cell.get('defaultRule', 'NONE')
+        creates, updates = [], []
+        for (src, dst), names in want_cells.items() :
+            (names, default_rule) = cell_rule(names)
+            if default_rule != 'NONE' :
+                sgacl_list = []
+            else :
+                missing = [ name for name in names if name not in sgacl_ids ]
+                if src not in sgt_ids or dst not in sgt_ids or missing :
+                    print(f"❌ {src}-{dst} unknown SGT or SGACL: {[n for n in [src, dst] if n not in sgt_ids] + missing}", file=sys.stderr)
+                    failed += 1
+                    continue
+                sgacl_list = [ sgacl_ids[name] for name in names ]
+            cell = current_cells.get((src, dst))
+            if cell is None :
+                creates.append({
+                    "name": f"{src}-{dst}",                     # <= 32 characters
                     "description": "",                          # <= 256 characters
-                    "sourceSgtId": df_sgts['id'].at[row['SGT']],# UUID
-                    "destinationSgtId": df_sgts['id'].at[col],  # UUID
+                    "sourceSgtId": sgt_ids[src],                # UUID
+                    "destinationSgtId": sgt_ids[dst],           # UUID
                     "matrixCellStatus": "ENABLED",              # ['ENABLED' | 'DISABLED' | 'MONITOR']
-                    "sgacls": [
-                        df_sgacls['id'].at[val]                 # list of SGACL UUIDs
-                    ],
-                    "defaultRule": "NONE"                       # ['NONE','DENY IP','PERMIT IP']
-                  }
-                )
-    df_resources = pd.DataFrame(resources)
-    cells = await post_simple_ise_resources (session, 'EgressMatrixCell', '/ers/config/egressmatrixcell', df_resources)
-    # df_cells = pd.DataFrame(cells)
-    # print(f"\nCells:\n{df_cells.to_markdown(index=False, tablefmt='simple_grid')}")
-    
+                    "sgacls": sgacl_list,                       # list of SGACL UUIDs
+                    "defaultRule": default_rule                 # ['NONE','DENY_IP','PERMIT_IP']
+                })
+            elif (cell_sgacl_names(cell), cell_default_rule(cell)) != (names, default_rule) :
+                updates.append({ **cell, 'sgacls':sgacl_list, 'defaultRule':default_rule })
+        deletes = [ cell['id'] for key, cell in current_cells.items() if key not in want_cells ]
+        print(f"ⓘ Cells: {len(creates)} create, {len(updates)} update, {len(deletes)} delete")
+
+    with ise.metrics.phase('apply') :
+        results = await asyncio.gather(
+            apply_ise_resources(ise, 'egressmatrixcell', 'create', creates),
+            apply_ise_resources(ise, 'egressmatrixcell', 'update', updates),
+            apply_ise_resources(ise, 'egressmatrixcell', 'delete', deletes),
+        )
+
+        # Delete SGTs and SGACLs only after the cells that referenced them
+        results += await asyncio.gather(
+            apply_ise_resources(ise, 'sgt', 'delete', sgt_changes[2]),
+            apply_ise_resources(ise, 'sgacl', 'delete', sgacl_changes[2]),
+        )
+    return failed + sum(count_failed(r) for r in results)
+
 
 async def parse_cli_arguments () :
     """
     Parse the command line arguments
     """
     ARGS = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ARGS.add_argument('-a', '--adaptive', action='store_true', default=False, help='adapt the ISE request concurrency to the measured response times')
     ARGS.add_argument('-f', '--filename', action='store', type=str, help='TrustSec matrix filename', default=DEFAULT_TRUSTSEC_FILENAME)
+    ARGS.add_argument('-b', '--bulk', action='store_true', default=False, help='use the ISE ERS Bulk API')
+    ARGS.add_argument('-s', '--sync', action='store_true', default=False, help='only create, update, and delete the differences with ISE')
+    ARGS.add_argument('--metrics', default=None, metavar='FILENAME', help='save per-phase and per-endpoint metrics as JSON and show a summary')
+    ARGS.add_argument('--profile', nargs='?', const='excel_trustsec_matrix_to_ise_profile', default=None, metavar='PREFIX', help='profile the run to PREFIX.pstats and PREFIX.collapsed')
+    ARGS.add_argument('-r', '--retries', type=int, default=RETRY_ATTEMPTS, help='retries for transient ISE errors')
     ARGS.add_argument('-t', '--timer', action='store_true', default=False, help='show response timer' )
     ARGS.add_argument('-v', '--verbose', action='store_true', default=False, help='Verbosity; multiple allowed')
     return ARGS.parse_args()
@@ -302,56 +427,64 @@ async def main ():
     global args     # promote to global scope for use in other functions
     args = await parse_cli_arguments()
     if args.verbose >= 3 : print(f"ⓘ Args: {args}")
-    if args.verbose : print(f"ⓘ TCP_CONNECTIONS: {TCP_CONNECTIONS}")
-    if args.verbose : print(f"ⓘ REST_PAGE_SIZE: {REST_PAGE_SIZE}")
     if args.verbose : print(f"ⓘ filename: {args.filename}")
     if args.timer :
         global start_time
         start_time = time.time()
 
-    # Load Environment Variables
-    global env
-    env = { k : v for (k, v) in os.environ.items() if k.startswith('ISE_') }
-
-
+    failed = 0
+    metrics = Metrics()
+    profiler = RunProfiler(args.profile, metrics=metrics) if args.profile else None
+    if profiler : profiler.start()
     try :
-        # Create HTTP session
-        ssl_verify = (False if env['ISE_VERIFY'][0:1].lower() in ['f','n'] else True)
-        tcp_conn = aiohttp.TCPConnector(limit=TCP_CONNECTIONS, limit_per_host=TCP_CONNECTIONS, ssl=ssl_verify)
-        auth = aiohttp.BasicAuth(login=env['ISE_REST_USERNAME'], password=env['ISE_REST_PASSWORD'])
-        base_url = f"https://{env['ISE_PPAN']}"
-        session = aiohttp.ClientSession(base_url, auth=auth, connector=tcp_conn, headers=JSON_HEADERS)
-
-        # await ise_trustsec_clear(session)
-        sgts = await get_ise_resources (session, '/ers/config/sgt')
-        await delete_ise_resources(session, 'Sgt', '/ers/config/sgt', [sgt['id'] for sgt in sgts])
-        sgacls = await get_ise_resources (session, '/ers/config/sgacl')
-        await delete_ise_resources(session, 'Sgacl', '/ers/config/sgacl', [sgacl['id'] for sgacl in sgacls])
-        cells = await get_ise_resources (session, '/ers/config/egressmatrixcell')
-        await delete_ise_resources(session, 'EgressMatrixCell', '/ers/config/egressmatrixcell', [cell['id'] for cell in cells])
-
-        await excel_trustsec_matrix_to_ise(session, args.filename)
+        async with ISEERS.from_env(adaptive=args.adaptive, retries=args.retries, metrics=metrics, verbose=args.verbose) as ise :
+            if args.verbose : print(f"ⓘ TCP_CONNECTIONS: {ise.connections}")
+            if args.verbose : print(f"ⓘ REST_PAGE_SIZE: {ise.page_size}")
+            if args.sync :
+                failed += await sync_trustsec_matrix_to_ise(ise, args.filename)
+            else :
+                workbook = []
+
+                async def read_and_check () :
+                    # parse once in a thread while the clear lists ISE; nothing is deleted if the workbook is invalid
+                    with metrics.phase('read') :
+                        workbook.extend(await asyncio.to_thread(read_workbook, args.filename))
+                        check_workbook_cells(*workbook)
+
+                failed += await ise_trustsec_clear(ise, bulk=args.bulk, check=read_and_check())
+                failed += await excel_trustsec_matrix_to_ise(ise, *workbook)
 
     except aiohttp.ContentTypeError as e :
         print(f"\n❌ Error: {e.message}\n\n💡Enable the ISE REST APIs\n")
+        failed += 1
     except aiohttp.ClientConnectorError as e :  # cannot connect to host
         print(f"\n❌ Host unreachable: {e}\n", file=sys.stderr)
+        failed += 1
     except aiohttp.ClientError as e :           # base aiohttp Exception
         print(f"\n❌ Exception: {e}\n", file=sys.stderr)
-    except:                                     # catch *all* exceptions
-        print(f"\n❌ Exception: {e}\n", file=sys.stderr)
-    finally:
-        await session.close()
-
+        failed += 1
+    except Exception as e :                     # catch *all* exceptions
+        print(f"\n❌ {type(e).__name__}: {e}\n", file=sys.stderr)
+        if args.verbose : traceback.print_exc()
+        failed += 1
+
+    if profiler :
+        profiler.stop()
+        print(profiler.summary(), file=sys.stderr)
     if args.timer :
         duration = time.time() - start_time
         print(f"\n 🕒 {duration} seconds\n", file=sys.stderr)
+    if args.metrics :
+        print(metrics.summary(), file=sys.stderr)
+        metrics.save(args.metrics)
+        print(f"ⓘ Metrics: {args.metrics}", file=sys.stderr)
+    return failed
 
 
 if __name__ == '__main__':
     """
     Entrypoint for local script.
     """
-    asyncio.run(main())
+    failed = asyncio.run(main())
 
-    sys.exit(0) # 0 is ok
+    sys.exit(1 if failed else 0) # 0 is ok
@@ -0,0 +1,779 @@
+#!/usr/bin/env python3
+"""
+
+Asynchronous ISE ERS REST API client shared by the ISE TrustSec scripts.
+
+The client owns the aiohttp session, TCP connection pool, base URL, auth and
+JSON headers so every script (or a chain of scripts in one process) shares the
+same request stack.
+
+Examples:
+    async with ISEERS.from_env() as ise :
+        sgts = await ise.get_resource_details('sgt')
+        async for sgacl in ise.iter_resources('sgacl', prefetch=4) : ...
+        results = await ise.create_resources('sgacl', [{'name':'Permit_Web', 'aclcontent':'permit tcp dst eq 443'}])
+        results = await ise.delete_resources('egressmatrixcell', [cell['id'] for cell in cells])
+    for deployment in load_deployments('ise_deployments.json') :
+        async with ISEERS.from_env(env=deployment['env'], **deployment['options']) as ise : ...
+
+Requires setting the these environment variables using the `export` command:
+  export ISE_PPAN='1.2.3.4'             # hostname or IP address of ISE PAN
+  export ISE_REST_USERNAME='admin'      # ISE ERS admin or operator username
+  export ISE_REST_PASSWORD='C1sco12345' # ISE ERS admin or operator password
+  export ISE_VERIFY=false               # validate the ISE certificate
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import aiohttp
+import asyncio
+import collections
+import email.utils
+import json
+import os
+import random
+import re
+import sys
+import time
+import urllib.parse
+from trustsec_metrics import Metrics
+
+# REST Options
+JSON_HEADERS = {'Accept':'application/json', 'Content-Type':'application/json'}
+REST_PAGE_SIZE_DEFAULT=20
+REST_PAGE_SIZE_MAX=100
+REST_PAGE_SIZE=REST_PAGE_SIZE_MAX
+REST_PAGE_PREFETCH=4            # pages requested ahead of the consumer when streaming resources
+
+# Limit TCP connection pool size to prevent connection refusals by ISE!
+# 30 for ISE 2.6+; See https://cs.co/ise-scale for Concurrent ERS Connections.
+# Testing with ISE 3.0 shows *no* performance gain for >5-10
+TCP_CONNECTIONS_DEFAULT=10
+TCP_CONNECTIONS_MAX=30
+TCP_CONNECTIONS=5
+
+# Adaptive concurrency (AIMD) options
+# The limit grows by ~1 request per round trip while latency stays near the best observed
+# latency and shrinks multiplicatively on 429/503 responses, connection errors, or slow responses.
+ADAPTIVE_DECREASE=0.5           # limit multiplier on 429/503 responses or connection errors
+ADAPTIVE_DECREASE_LATENCY=0.9   # limit multiplier when latency exceeds ADAPTIVE_LATENCY_TOLERANCE
+ADAPTIVE_LATENCY_TOLERANCE=2.0  # latency / best latency ratio considered slow
+ADAPTIVE_LATENCY_DRIFT=1.01     # best latency growth per response so it tracks a changing ISE load
+ADAPTIVE_OVERLOAD_STATUSES = [429, 503]
+
+# Retry options for transient errors with exponential backoff and full jitter.
+# ISE uses 500 for permanent errors like "currently in use" so it is never retried.
+RETRY_ATTEMPTS=3                # retries after the first attempt
+RETRY_BACKOFF=0.5               # seconds for the first retry backoff, doubled for each retry
+RETRY_BACKOFF_MAX=30            # maximum seconds for a backoff or `Retry-After`
+RETRY_STATUSES = [429, 502, 503, 504]
+
+# ISE ERS resource names with their JSON object names, URL paths, and Bulk API request names
+ERS_RESOURCES = {
+    'sgt'              : {'object':'Sgt',              'path':'/ers/config/sgt',              'bulk':'SGTBulkRequest'},
+    'sgacl'            : {'object':'Sgacl',            'path':'/ers/config/sgacl',            'bulk':'SecurityGroupsACLBulkRequest'},
+    'egressmatrixcell' : {'object':'EgressMatrixCell', 'path':'/ers/config/egressmatrixcell', 'bulk':'EgressMatrixCellBulkRequest'},
+}
+
+# ERS Bulk API Options
+# A bulk request is submitted with `PUT {path}/bulk/submit` and returns `202 Accepted` with
+# a `Location: {path}/bulk/{bulkId}` header to poll for the `BulkStatus` until it completes.
+BULK_OPERATIONS = ['create', 'update', 'delete']
+BULK_CHUNK_SIZE=500             # resources per bulk request
+BULK_CONCURRENCY=3              # bulk requests executing at once in ISE
+BULK_POLL_INTERVAL=0.5          # seconds before the first status poll
+BULK_POLL_INTERVAL_MAX=10       # seconds between status polls with backoff
+BULK_TIMEOUT=3600               # seconds to wait for a bulk request to complete
+BULK_DONE_STATUSES = ['COMPLETED', 'COMPLETED_WITH_ERRORS', 'FAILED', 'ABORTED']
+
+ENV_REQUIRED_VARIABLES = ['ISE_PPAN', 'ISE_REST_USERNAME', 'ISE_REST_PASSWORD', 'ISE_VERIFY']
+
+# Client options a deployment in a deployments file may set in addition to its `ISE_*` variables
+DEPLOYMENT_OPTIONS = ['connections', 'max_connections', 'page_size', 'adaptive', 'retries', 'base_url']
+DEPLOYMENT_NAME_PATTERN = re.compile(r'^[\w.-]+$')    # deployment names are used in filenames
+
+# A response from ISE with the decoded JSON body (None if empty)
+ERSResponse = collections.namedtuple('ERSResponse', ['status', 'reason', 'headers', 'json'])
+
+
+def ers_message (data:dict=None) -> str :
+    """
+    Returns the first message title from an ERS error response or an empty string.
+    @data : the decoded JSON response body
+    """
+    try :
+        return data['ERSResponse']['messages'][0]['title']
+    except (KeyError, IndexError, TypeError) :
+        return ''
+
+
+async def map_limited (func, items:list, limit:int=TCP_CONNECTIONS) -> list :
+    """
+    Returns the results of `await func(item)` for every item, in item order, with
+    at most `limit` calls in flight. Exceptions are returned in place of results
+    so one failure does not stop the others.
+    @func : an async function of one argument
+    @items : the list of arguments
+    @limit : the maximum number of concurrent calls
+    """
+    results = [None] * len(items)
+    pending = iter(enumerate(items))
+
+    async def worker () :
+        # each worker takes the next item from the shared iterator until it is exhausted
+        for i, item in pending :
+            try :
+                results[i] = await func(item)
+            except Exception as e :
+                results[i] = e
+
+    await asyncio.gather(*[worker() for _ in range(min(max(1, limit), len(items)))])
+    return results
+
+
+async def map_limited_stream (func, items, limit:int=TCP_CONNECTIONS) -> tuple :
+    """
+    Returns (items, results) for `await func(item)` on every item of an async iterable,
+    in item order, with at most `limit` calls in flight. Calls start as soon as items
+    arrive so they overlap with the iterable's own network time. Exceptions are returned
+    in place of results. An exception from the iterable itself, like a failed page,
+    cancels the calls in flight, closes the iterable, and is raised.
+    @func : an async function of one argument
+    @items : an async iterable of arguments
+    @limit : the maximum number of concurrent calls
+    """
+    (received, results) = ([], {})
+    pending = aiter(items)
+    lock = asyncio.Lock()   # an async generator may not be advanced by two workers at once
+
+    async def worker () :
+        while True :
+            async with lock :
+                try :
+                    item = await anext(pending)
+                except StopAsyncIteration :
+                    return
+                i = len(received)
+                received.append(item)
+            try :
+                results[i] = await func(item)
+            except Exception as e :
+                results[i] = e
+
+    try :
+        async with asyncio.TaskGroup() as tg :     # the first failed worker cancels the others
+            for _ in range(max(1, limit)) :
+                tg.create_task(worker())
+    except ExceptionGroup as eg :
+        raise eg.exceptions[0] from None
+    finally :
+        if hasattr(pending, 'aclose') :
+            await pending.aclose()
+    return (received, [ results[i] for i in range(len(received)) ])
+
+
+class AdaptiveLimiter :
+    """
+    An asyncio concurrency limiter for ISE requests. When adaptive, the limit follows
+    additive-increase/multiplicative-decrease (AIMD) from the observed response latency,
+    429/503 responses, and connection errors, between `minimum` and `maximum`.
+
+    Examples:
+        async with limiter :
+            ...
+        limiter.update(latency, overloaded=False)
+    """
+
+    def __init__ (self, initial:int=TCP_CONNECTIONS, minimum:int=1, maximum:int=TCP_CONNECTIONS_MAX, adaptive:bool=True) :
+        """
+        @initial : the initial concurrency limit
+        @minimum : the minimum concurrency limit
+        @maximum : the maximum concurrency limit
+        @adaptive : adapt the limit from the responses, otherwise it is fixed at `initial`
+        """
+        self.adaptive = adaptive
+        self.minimum = minimum
+        self.maximum = maximum if adaptive else initial
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.in_flight = 0
+        self.high_water = 0         # maximum concurrent requests observed
+        self.best_latency = None    # baseline latency in seconds
+        self.decreased = 0          # monotonic time of the last multiplicative decrease
+        self.condition = asyncio.Condition()
+
+
+    async def __aenter__ (self) :
+        async with self.condition :
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self.high_water = max(self.high_water, self.in_flight)
+
+
+    async def __aexit__ (self, exc_type, exc, tb) :
+        async with self.condition :
+            self.in_flight -= 1
+            self.condition.notify_all()     # the limit may have grown by more than one
+
+
+    def update (self, latency:float, overloaded:bool=False) :
+        """
+        Adapt the limit from one response.
+        @latency : the response time in seconds
+        @overloaded : ISE refused or rate-limited the request
+        """
+        if not self.adaptive :
+            return
+        now = time.monotonic()
+        if not overloaded :     # fast refusals are not a latency baseline
+            self.best_latency = min(latency, (self.best_latency or latency) * ADAPTIVE_LATENCY_DRIFT)
+
+        if overloaded or latency > self.best_latency * ADAPTIVE_LATENCY_TOLERANCE :
+            # decrease at most once per round trip so a burst of errors from the same window counts once
+            if now - self.decreased > latency :
+                self.limit = max(self.minimum, self.limit * (ADAPTIVE_DECREASE if overloaded else ADAPTIVE_DECREASE_LATENCY))
+                self.decreased = now
+        else :
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+
+class ISEERS :
+    """
+    An asynchronous ISE ERS REST API client.
+    """
+
+    def __init__ (self, hostname:str, username:str, password:str, ssl_verify:bool=True, connections:int=TCP_CONNECTIONS, page_size:int=REST_PAGE_SIZE, adaptive:bool=False, max_connections:int=TCP_CONNECTIONS_MAX, retries:int=RETRY_ATTEMPTS, base_url:str=None, metrics:Metrics=None, verbose:int=0) :
+        """
+        @hostname : the ISE PAN hostname or IP address
+        @username : the ISE ERS admin or operator username
+        @password : the ISE ERS admin or operator password
+        @ssl_verify : validate the ISE certificate
+        @connections : the TCP connection pool size and default concurrency limit
+        @page_size : the REST page size for listing resources
+        @adaptive : adapt the concurrency limit from `connections` up to `max_connections`
+        @max_connections : the maximum adaptive concurrency limit
+        @retries : the number of retries for transient errors
+        @base_url : the ERS base URL, e.g. a local mock ISE. Default: `https://{hostname}`
+        @metrics : the Metrics to record requests in, for example to share with other clients. Default: a new Metrics
+        @verbose : verbosity level
+        """
+        self.hostname = hostname
+        self.base_url = base_url or f"https://{hostname}"
+        self.auth = aiohttp.BasicAuth(login=username, password=password)
+        self.ssl_verify = ssl_verify
+        self.limiter = AdaptiveLimiter(connections, maximum=max_connections, adaptive=adaptive)
+        self.connections = self.limiter.maximum   # TCP pool size and concurrent workers; the limiter decides what is in flight
+        self.page_size = page_size
+        self.retries = retries
+        self.retried = 0            # total retries
+        self.metrics = metrics or Metrics()
+        self.verbose = verbose
+        self.session = None
+
+
+    @classmethod
+    def from_env (cls, env:dict=None, **kwargs) :
+        """
+        Returns a client configured from the `ISE_*` environment variables.
+        @env : a dict of environment variables. Default: `os.environ`
+        @kwargs : additional client options
+        """
+        env = { k : v for (k, v) in (os.environ if env is None else env).items() if k.startswith('ISE_') }
+        for v in ENV_REQUIRED_VARIABLES :
+            if env.get(v, None) == None :
+                raise ValueError(f"Missing environment variable {v}")
+        return cls(env['ISE_PPAN'],
+                   env['ISE_REST_USERNAME'],
+                   env['ISE_REST_PASSWORD'],
+                   ssl_verify=(False if env['ISE_VERIFY'][0:1].lower() in ['f','n'] else True),
+                   **kwargs)
+
+
+    async def open (self) :
+        """
+        Create the HTTP session and TCP connection pool.
+        """
+        if self.session is None :
+            tcp_conn = aiohttp.TCPConnector(limit=self.connections, limit_per_host=self.connections, ssl=self.ssl_verify)
+            self.session = aiohttp.ClientSession(self.base_url, auth=self.auth, connector=tcp_conn, headers=JSON_HEADERS)
+        return self
+
+
+    async def close (self) :
+        """
+        Close the HTTP session.
+        """
+        if self.session is not None :
+            await self.session.close()
+            self.session = None
+
+
+    async def __aenter__ (self) :
+        return await self.open()
+
+
+    async def __aexit__ (self, exc_type, exc, tb) :
+        await self.close()
+
+
+    def path (self, resource:str, id:str=None) -> str :
+        """
+        Returns the ERS URL path for the resource and optional id.
+        @resource : the ERS resource name, for example `sgt`
+        @id : the resource UUID
+        """
+        path = ERS_RESOURCES[resource]['path']
+        return path if id is None else f"{path}/{id}"
+
+
+    async def send (self, method:str, url:str, body:str=None) -> ERSResponse :
+        """
+        Send a single request to ISE within the concurrency limit and return the ERSResponse.
+        @method : the HTTP method
+        @url : the URL path relative to the base URL
+        @body : an optional JSON string body
+        """
+        endpoint = self.metrics.endpoint(method, url)
+        async with self.limiter :
+            start = time.monotonic()
+            (status, content) = (None, b'')
+            self.metrics.request_started(endpoint)
+            try :
+                async with self.session.request(method, url, data=body) as resp :
+                    content = await resp.read()
+                    status = resp.status
+                    response = ERSResponse(resp.status, resp.reason, resp.headers, (await resp.json() if content.strip() else None))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) :
+                self.limiter.update(time.monotonic() - start, overloaded=True)
+                raise
+            finally :
+                self.metrics.request_finished(endpoint, status, time.monotonic() - start, len(body.encode()) if body else 0, len(content))
+            self.limiter.update(time.monotonic() - start, overloaded=(response.status in ADAPTIVE_OVERLOAD_STATUSES))
+        if self.verbose >= 4 and self.limiter.adaptive : print(f"ⓘ limit: {self.limiter.limit:.1f} in flight: {self.limiter.in_flight}")
+        return response
+
+
+    def backoff (self, attempt:int, retry_after:str=None) -> float :
+        """
+        Returns the seconds to wait before a retry: the `Retry-After` header when ISE sends one,
+        otherwise an exponential backoff with full jitter.
+        @attempt : the number of the failed attempt, starting at 0
+        @retry_after : the optional `Retry-After` header value in seconds or as an HTTP date
+        """
+        if retry_after :
+            try :
+                return min(RETRY_BACKOFF_MAX, max(0, float(retry_after)))
+            except ValueError :
+                try :
+                    return min(RETRY_BACKOFF_MAX, max(0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()))
+                except (TypeError, ValueError) :
+                    pass
+        return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt))
+
+
+    async def request (self, method:str, url:str, data:dict=None, exists=None) -> ERSResponse :
+        """
+        Send a request to ISE, retrying transient errors, and return the ERSResponse.
+        @method : the HTTP method
+        @url : the URL path relative to the base URL
+        @data : an optional dict to send as the JSON body
+        @exists : for a POST, an async function returning the id of the resource if it was
+                  already created so a retry after a lost response never creates a duplicate
+        """
+        if self.verbose >= 4 : print(f"ⓘ {method} {url}")
+        body = None if data is None else json.dumps(data)
+        for attempt in range(self.retries + 1) :
+            if attempt > 0 and exists is not None :
+                id = await exists()
+                if id :
+                    return ERSResponse(201, 'Created', {'Location':f"{url}/{id}"}, None)
+            try :
+                response = await self.send(method, url, body)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e :
+                if attempt >= self.retries : raise
+                (delay, reason) = (self.backoff(attempt), f"{type(e).__name__} {e}")
+            else :
+                if method == 'DELETE' and attempt > 0 and response.status == 404 :
+                    return ERSResponse(204, 'No Content', response.headers, None)  # deleted by a previous attempt
+                if response.status not in RETRY_STATUSES or attempt >= self.retries :
+                    return response
+                (delay, reason) = (self.backoff(attempt, response.headers.get('Retry-After')), f"{response.status} {response.reason}")
+            self.retried += 1
+            self.metrics.retry(self.metrics.endpoint(method, url))
+            if self.verbose : print(f"ⓘ Retry {attempt + 1}/{self.retries} in {delay:.2f}s: {method} {url} {reason}", file=sys.stderr)
+            await asyncio.sleep(delay)
+
+
+    async def find_resource_id (self, resource:str, name:str) -> str :
+        """
+        Returns the id of the named resource or None if it does not exist.
+        @resource : the ERS resource name
+        @name : the resource name
+        """
+        response = await self.request('GET', f"{self.path(resource)}?filter=name.EQ.{urllib.parse.quote(str(name))}")
+        if response.status != 200 :
+            return None
+        for r in response.json['SearchResult']['resources'] :
+            if r.get('name') == name :
+                return r['id']
+        return None
+
+
+    async def get_page (self, resource:str, page:int=1) -> dict :
+        """
+        Returns the `SearchResult` for one page of resources.
+        @resource : the ERS resource name
+        @page : the page number, starting at 1
+        """
+        url = f"{self.path(resource)}?size={self.page_size}" + (f"&page={page}" if page > 1 else '')
+        response = await self.request('GET', url)
+        if response.status != 200 :
+            raise ValueError(f"Bad status: {response.status} {response.reason} {url}")
+        return response.json['SearchResult']
+
+
+    async def iter_resources (self, resource:str, prefetch:int=REST_PAGE_PREFETCH, ordered:bool=True, limit:int=None) :
+        """
+        Yields resources (`id`, `name`, `description`) as their pages arrive with at most
+        `prefetch` page requests in flight, so the caller can work while later pages load.
+        Breaking out of the loop or reaching `limit` stops early and cancels pages in flight;
+        use `contextlib.aclosing()` to cancel them immediately after a `break`.
+        @resource : the ERS resource name
+        @prefetch : the maximum number of page requests in flight
+        @ordered : yield pages in page order, else in arrival order
+        @limit : an optional maximum number of resources to yield
+        """
+        if self.verbose >= 3 : print(f"ⓘ iter_resources({resource})")
+
+        # Get the first page for the total resources
+        result = await self.get_page(resource)
+        total = result['total']
+        pages = int(total / self.page_size) + (1 if total % self.page_size else 0)
+        if self.verbose >= 3 : print(f"ⓘ iter_resources({resource}): Total: {total}")
+
+        count = 0
+        next_page = 2
+        pending = collections.deque()
+        try :
+            while True :
+                for r in result['resources'] :
+                    if type(r) == dict and r.get('link') :
+                        del r['link']   # remove ugly 'link' attribute to flatten data
+                    yield r
+                    count += 1
+                    if limit and count >= limit : return
+
+                # keep the prefetch window full with the next pages
+                while next_page <= pages and len(pending) < max(1, prefetch) :
+                    pending.append(asyncio.ensure_future(self.get_page(resource, next_page)))
+                    next_page += 1
+                if not pending : return
+
+                if ordered :
+                    result = await pending[0]
+                    pending.popleft()
+                else :
+                    (done, _) = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    task = done.pop()
+                    pending.remove(task)
+                    result = task.result()
+        finally :
+            for task in pending :
+                task.cancel()
+
+
+    async def get_resources (self, resource:str) -> list :
+        """
+        Returns the list of all resources (`id`, `name`, `description`) from every page.
+        @resource : the ERS resource name
+        """
+        return [ r async for r in self.iter_resources(resource, prefetch=self.connections) ]
+
+
+    async def get_resource (self, resource:str, id:str) -> dict :
+        """
+        Returns the details of a single resource.
+        @resource : the ERS resource name
+        @id : the resource UUID
+        """
+        response = await self.request('GET', self.path(resource, id))
+        if response.status != 200 :
+            raise ValueError(f"Bad status: {response.status} {response.reason} {ers_message(response.json)}")
+        r = response.json[ERS_RESOURCES[resource]['object']]
+        if type(r) == dict and r.get('link') :
+            del r['link']
+        return r
+
+
+    async def get_resource_details (self, resource:str, ids:list=None, limit:int=None, errors:dict=None) -> list :
+        """
+        Returns the details of all resources, in list order, without any that failed.
+        @resource : the ERS resource name
+        @ids : an optional list of UUIDs. Default: all resources
+        @limit : the maximum number of detail requests in flight. Default: the pool size
+        @errors : an optional dict to collect {uuid : exception} for failed details
+        """
+        if self.verbose >= 3 : print(f"ⓘ get_resource_details({resource})")
+        if ids is None :
+            # get details while the remaining pages are still listed
+            ids = ( r['id'] async for r in self.iter_resources(resource, prefetch=self.connections) )
+            (ids, results) = await map_limited_stream(lambda id: self.get_resource(resource, id), ids, limit or self.connections)
+        else :
+            results = await map_limited(lambda id: self.get_resource(resource, id), ids, limit or self.connections)
+        resources = []
+        for id, result in zip(ids, results) :
+            if isinstance(result, Exception) :
+                print(f"❌ {self.path(resource, id)} {result}", file=sys.stderr)
+                if errors is not None : errors[id] = result
+            else :
+                resources.append(result)
+        return resources
+
+
+    async def create_resource (self, resource:str, data:dict) -> dict :
+        """
+        POST a new resource and return a result dict with the `status`, new `id`, `name`, and any error `message`.
+        @resource : the ERS resource name
+        @data : the resource attributes
+        """
+        exists = (lambda: self.find_resource_id(resource, data['name'])) if data.get('name') else None
+        response = await self.request('POST', self.path(resource), { ERS_RESOURCES[resource]['object'] : data }, exists=exists)
+        location = response.headers.get('Location', '')
+        return {
+            'status'  : response.status,
+            'id'      : location.rsplit('/', 1)[-1] if location else None,
+            'name'    : data.get('name'),
+            'message' : ers_message(response.json),
+        }
+
+
+    async def update_resource (self, resource:str, id:str, data:dict) -> dict :
+        """
+        PUT the resource attributes and return a result dict with the `status`, `id`, `name`, and any error `message`.
+        @resource : the ERS resource name
+        @id : the resource UUID
+        @data : the resource attributes
+        """
+        response = await self.request('PUT', self.path(resource, id), { ERS_RESOURCES[resource]['object'] : { 'id':id, **data } })
+        return {
+            'status'  : response.status,
+            'id'      : id,
+            'name'    : data.get('name'),
+            'message' : ers_message(response.json),
+        }
+
+
+    async def delete_resource (self, resource:str, id:str) -> dict :
+        """
+        DELETE the resource and return a result dict with the `status`, `id`, and any error `message`.
+        @resource : the ERS resource name
+        @id : the resource UUID
+        """
+        response = await self.request('DELETE', self.path(resource, id))
+        return {
+            'status'  : response.status,
+            'id'      : id,
+            'name'    : None,
+            'message' : ers_message(response.json),
+        }
+
+
+    async def create_resources (self, resource:str, resources:list, limit:int=None) -> list :
+        """
+        POST many resources concurrently and return their results in order.
+        @resource : the ERS resource name
+        @resources : a list of resource attribute dicts
+        @limit : the maximum number of requests in flight. Default: the pool size
+        """
+        return await map_limited(lambda data: self.create_resource(resource, data), resources, limit or self.connections)
+
+
+    async def update_resources (self, resource:str, resources:list, limit:int=None) -> list :
+        """
+        PUT many resources concurrently and return their results in order.
+        @resource : the ERS resource name
+        @resources : a list of resource attribute dicts, each with an `id`
+        @limit : the maximum number of requests in flight. Default: the pool size
+        """
+        return await map_limited(lambda data: self.update_resource(resource, data['id'], data), resources, limit or self.connections)
+
+
+    async def delete_resources (self, resource:str, ids:list, limit:int=None) -> list :
+        """
+        DELETE many resources concurrently and return their results in order.
+        @resource : the ERS resource name
+        @ids : a list of resource UUIDs
+        @limit : the maximum number of requests in flight. Default: the pool size
+        """
+        return await map_limited(lambda id: self.delete_resource(resource, id), ids, limit or self.connections)
+
+
+    async def bulk_submit (self, resource:str, operation:str, resources:list) -> str :
+        """
+        Submit a single ERS Bulk API request and return the bulk id to poll.
+        @resource : the ERS resource name
+        @operation : one of BULK_OPERATIONS
+        @resources : a list of resource attribute dicts for `create` and `update` or UUIDs for `delete`
+        """
+        if operation not in BULK_OPERATIONS :
+            raise ValueError(f"Invalid bulk operation: {operation}")
+        request = {
+            'operationType'     : operation,
+            'resourceMediaType' : f"vnd.com.cisco.ise.trustsec.{resource}.1.0+xml",
+        }
+        if operation == 'delete' :
+            request['idList'] = list(resources)
+        else :
+            request['resourcesList'] = [ { ERS_RESOURCES[resource]['object'] : r } for r in resources ]
+
+        response = await self.request('PUT', f"{self.path(resource)}/bulk/submit", { ERS_RESOURCES[resource]['bulk'] : request })
+        if response.status != 202 :
+            raise ValueError(f"Bad status: {response.status} {response.reason} {ers_message(response.json)}")
+        return response.headers['Location'].rstrip('/').rsplit('/', 1)[-1]
+
+
+    async def bulk_status (self, resource:str, bulk_id:str) -> dict :
+        """
+        Returns the `BulkStatus` of a bulk request.
+        @resource : the ERS resource name
+        @bulk_id : the bulk id from `bulk_submit()`
+        """
+        response = await self.request('GET', f"{self.path(resource)}/bulk/{bulk_id}")
+        if response.status != 200 :
+            raise ValueError(f"Bad status: {response.status} {response.reason} {ers_message(response.json)}")
+        return response.json['BulkStatus']
+
+
+    async def bulk_wait (self, resource:str, bulk_id:str, timeout:float=BULK_TIMEOUT) -> dict :
+        """
+        Poll a bulk request with exponential backoff until it is done and return the final `BulkStatus`.
+        @resource : the ERS resource name
+        @bulk_id : the bulk id from `bulk_submit()`
+        @timeout : the maximum seconds to wait
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        interval = BULK_POLL_INTERVAL
+        while True :
+            await asyncio.sleep(interval)
+            status = await self.bulk_status(resource, bulk_id)
+            if self.verbose >= 3 : print(f"ⓘ bulk {resource} {bulk_id} {status.get('executionStatus')} {status.get('successCount', 0)}/{status.get('resourcesCount', 0)}")
+            if status.get('executionStatus') in BULK_DONE_STATUSES :
+                return status
+            if loop.time() + interval > deadline :
+                raise asyncio.TimeoutError(f"Bulk request {bulk_id} not done after {timeout} seconds")
+            interval = min(interval * 2, BULK_POLL_INTERVAL_MAX)
+
+
+    async def bulk_chunk (self, resource:str, operation:str, resources:list) -> list :
+        """
+        Submit and wait for a single bulk request and return a result dict per resource, in order.
+        @resource : the ERS resource name
+        @operation : one of BULK_OPERATIONS
+        @resources : a list of resource attribute dicts for `create` and `update` or UUIDs for `delete`
+        """
+        bulk_id = await self.bulk_submit(resource, operation, resources)
+        status = await self.bulk_wait(resource, bulk_id)
+
+        # Map each resource status back to its request by id (update, delete) or name (create)
+        statuses = status.get('resourcesStatus', [])
+        by_key = { (s.get('name') if operation == 'create' else s.get('id')) : s for s in statuses }
+        results = []
+        for i, r in enumerate(resources) :
+            id = r if operation == 'delete' else r.get('id')
+            name = None if operation == 'delete' else r.get('name')
+            s = by_key.get(name if operation == 'create' else id) or (statuses[i] if i < len(statuses) else {})
+            ok = s.get('bulkExecutionStatus', s.get('resourceExecutionStatus')) == 'SUCCESS'
+            results.append({
+                'status'  : ({'create':201, 'update':200, 'delete':204}[operation] if ok else 500),
+                'id'      : s.get('id', id),
+                'name'    : name,
+                'message' : '' if ok else s.get('status', status.get('executionStatus', '')),
+            })
+        return results
+
+
+    async def bulk (self, resource:str, operation:str, resources:list, chunk_size:int=BULK_CHUNK_SIZE, limit:int=BULK_CONCURRENCY) -> list :
+        """
+        Create, update, or delete many resources with the ERS Bulk API and return a result dict
+        per resource, in order. Resources are split into chunks submitted concurrently.
+        @resource : the ERS resource name
+        @operation : one of BULK_OPERATIONS
+        @resources : a list of resource attribute dicts for `create` and `update` or UUIDs for `delete`
+        @chunk_size : the maximum resources per bulk request
+        @limit : the maximum bulk requests in flight
+        """
+        if self.verbose >= 3 : print(f"ⓘ bulk({resource}, {operation}, {len(resources)})")
+        chunks = [ resources[i:i+chunk_size] for i in range(0, len(resources), chunk_size) ]
+        results = []
+        for chunk, chunk_results in zip(chunks, await map_limited(lambda chunk: self.bulk_chunk(resource, operation, chunk), chunks, limit)) :
+            if isinstance(chunk_results, Exception) :
+                # the whole chunk failed so report the same exception for each resource
+                chunk_results = [chunk_results] * len(chunk)
+            results.extend(chunk_results)
+        return results
+
+
+def load_deployments (filename:str) -> list :
+    """
+    Returns the ISE deployments in a JSON file as a list of `{'name', 'env', 'options'}` dicts
+    for `ISEERS.from_env(env=deployment['env'], **deployment['options'])`.
+    The file has a list of deployments, each with a unique `name`, the ENV_REQUIRED_VARIABLES,
+    and any DEPLOYMENT_OPTIONS, for example its own `connections` budget:
+        [{"name":"lab", "ISE_PPAN":"10.1.1.1", "ISE_REST_USERNAME":"admin", "ISE_REST_PASSWORD":"$LAB_ISE_PASSWORD", "ISE_VERIFY":false, "connections":10}]
+    Environment variables like `$LAB_ISE_PASSWORD` are expanded in strings so passwords may stay out of the file.
+    @filename : the deployments JSON filename
+    """
+    with open(filename) as fh :
+        data = json.load(fh)
+    if not isinstance(data, list) or not data :
+        raise ValueError(f"{filename}: expected a list of deployments")
+
+    deployments = []
+    for (i, deployment) in enumerate(data) :
+        if not isinstance(deployment, dict) :
+            raise ValueError(f"{filename}: deployment {i} is not an object")
+        deployment = { k : os.path.expandvars(v) if isinstance(v, str) else v for (k, v) in deployment.items() }
+        name = str(deployment.pop('name', ''))
+        if not DEPLOYMENT_NAME_PATTERN.match(name) :
+            raise ValueError(f"{filename}: deployment {i} needs a `name` of letters, digits, `_`, `.`, or `-`: '{name}'")
+        if name in [ d['name'] for d in deployments ] :
+            raise ValueError(f"{filename}: duplicate deployment name '{name}'")
+        env = { k : str(v) for (k, v) in deployment.items() if k.startswith('ISE_') }
+        missing = [ v for v in ENV_REQUIRED_VARIABLES if v not in env ]
+        if missing :
+            raise ValueError(f"{filename}: deployment '{name}' is missing {missing}")
+        unknown = [ k for k in deployment if k not in env and k not in DEPLOYMENT_OPTIONS ]
+        if unknown :
+            raise ValueError(f"{filename}: deployment '{name}' has unknown options {unknown}")
+        deployments.append({'name':name, 'env':env, 'options':{ k : deployment[k] for k in DEPLOYMENT_OPTIONS if k in deployment }})
+    return deployments
+
+
+def count_failed (results:list) -> int :
+    """
+    Returns the number of create/update/delete results that failed. A `400` for a named
+    resource, like one that already exists, is shown as information and is not a failure.
+    @results : a list of result dicts or exceptions
+    """
+    return sum(1 for r in results if isinstance(r, Exception) or not (200 <= r['status'] < 300 or (r['status'] == 400 and r['name'])))
+
+
+def show_results (results:list, icon:str='🌟') -> int :
+    """
+    Print one line per create/update/delete result in the style of the TrustSec scripts
+    and return the number of failed results.
+    @results : a list of result dicts or exceptions
+    @icon : the icon for successful results
+    """
+    for r in results :
+        if isinstance(r, Exception) :
+            print(f"❌ {r}", file=sys.stderr)
+        elif 200 <= r['status'] < 300 :
+            print(f"{icon} {r['status']} {r['name'] or r['id']}")
+        elif r['status'] == 400 and r['name'] :
+            print(f"ⓘ  {r['status']} {r['name']} {r['message']}")
+        else :
+            print(f"❌ {r['status']} {r['message']}")
+    return count_failed(results)
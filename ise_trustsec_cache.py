@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+
+A local snapshot cache of ISE TrustSec resource details for each ISE deployment.
+
+Only the ERS list pages are fetched on each run. A resource gets a detail GET
+only when its id is new or one of its listed attributes (`name`, `description`,
+and `generationId` when ISE lists it) changed since the snapshot was saved.
+ERS list pages only have the `id`, `name`, and `description`, so a changed SGT
+`value` or SGACL `aclcontent` is served from the snapshot until it is older
+than `max_age` and is refetched completely.
+
+Snapshots are gzip-compressed JSON in `~/.cache/ise_trustsec/{ISE_PPAN}/`
+by default or the `ISE_CACHE_DIR` environment variable. They are never
+unpickled, so a file written to the cache directory can not run code.
+
+Each save evicts the snapshots of other ISE deployments that were not saved
+within `evict_age` seconds or beyond the `max_hosts` most recently saved.
+
+Examples:
+    cache = SnapshotCache(ise.hostname, max_age=3600, max_hosts=5, evict_age=86400)
+    sgts = await cache.get_resource_details(ise, 'sgt')
+    cache.clear()
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import gzip
+import json
+import os
+import shutil
+import time
+
+CACHE_DIR = os.environ.get('ISE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'ise_trustsec'))
+CACHE_MAX_AGE = 3600                    # seconds before a snapshot is refetched completely
+CACHE_RESOURCES = ['sgt', 'sgacl']      # resources with a `generationId`
+CACHE_KEYS = ['name', 'description', 'generationId']   # listed attributes that invalidate a cached resource
+CACHE_MAX_HOSTS = 20                    # ISE deployments kept in the cache directory
+CACHE_EVICT_AGE = 30 * 86400            # seconds since a deployment's last save before its snapshots are deleted
+CACHE_SUFFIXES = ('.json.gz', '.pkl.gz', '.tmp')    # snapshot files of this and older cache versions
+CACHE_VERSION = 2                       # 2: gzip JSON instead of pickle
+
+
+class SnapshotCache :
+    """
+    A snapshot cache of ISE ERS resource details for one ISE deployment.
+    """
+
+    def __init__ (self, hostname:str, cache_dir:str=CACHE_DIR, max_age:float=CACHE_MAX_AGE, resources:list=CACHE_RESOURCES,
+                  max_hosts:int=CACHE_MAX_HOSTS, evict_age:float=CACHE_EVICT_AGE, verbose:int=0) :
+        """
+        @hostname : the ISE PAN hostname or IP address used as the cache key
+        @cache_dir : the cache directory
+        @max_age : the maximum snapshot age in seconds. 0 disables reuse.
+        @resources : the ERS resource names to cache; all others are always refetched
+        @max_hosts : the maximum ISE deployments kept in the cache directory, including this one. 0 keeps all.
+        @evict_age : seconds since another deployment's last save before its snapshots are deleted. 0 keeps all.
+        @verbose : verbosity level
+        """
+        self.hostname = hostname
+        self.cache_dir = cache_dir
+        self.directory = os.path.join(cache_dir, hostname.replace(':', '_'))
+        self.max_age = max_age
+        self.max_hosts = max_hosts
+        self.evict_age = evict_age
+        self.resources = resources
+        self.verbose = verbose
+
+
+    def filename (self, resource:str) -> str :
+        """
+        Returns the snapshot filename for the resource.
+        @resource : the ERS resource name
+        """
+        return os.path.join(self.directory, f"{resource}.json.gz")
+
+
+    def load (self, resource:str) -> tuple :
+        """
+        Returns the cached ({id : resource} details, time of the last full fetch)
+        or ({}, None) if missing, expired, or unreadable.
+        @resource : the ERS resource name
+        """
+        try :
+            with gzip.open(self.filename(resource), 'rt', encoding='utf-8') as fh :
+                snapshot = json.load(fh)
+        except (OSError, EOFError, ValueError) :
+            return ({}, None)
+        if not isinstance(snapshot, dict) or snapshot.get('version') != CACHE_VERSION or snapshot.get('hostname') != self.hostname :
+            return ({}, None)
+        age = time.time() - snapshot.get('time', 0)
+        if age > self.max_age :
+            if self.verbose : print(f"ⓘ Cache expired: {resource} ({int(age)}s)")
+            return ({}, None)
+        return ({ r['id'] : r for r in snapshot['resources'] }, snapshot['time'])
+
+
+    def save (self, resource:str, resources:list, fetch_time:float=None) :
+        """
+        Save the resource details as the new snapshot.
+        @resource : the ERS resource name
+        @resources : the list of resource details
+        @fetch_time : the time of the last full fetch the snapshot expires from. Default: now
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot = {
+            'version'   : CACHE_VERSION,
+            'hostname'  : self.hostname,
+            'resource'  : resource,
+            'time'      : fetch_time or time.time(),    # kept from the last full fetch so the snapshot still expires
+            'resources' : resources,
+        }
+        # write then rename so an interrupted run never leaves a partial snapshot
+        tmp = self.filename(resource) + '.tmp'
+        with gzip.open(tmp, 'wt', encoding='utf-8') as fh :
+            json.dump(snapshot, fh, separators=(',', ':'))
+        os.replace(tmp, self.filename(resource))
+        self.evict()
+
+
+    def evict (self) :
+        """
+        Delete the snapshot directories of the other ISE deployments that were not saved within
+        `evict_age` seconds or are not among the `max_hosts` most recently saved.
+        Directories with files that are not snapshots are never deleted.
+        """
+        try :
+            names = os.listdir(self.cache_dir)
+        except OSError :
+            return
+        hosts = []      # (last save time, directory) of the other deployments
+        for name in names :
+            directory = os.path.join(self.cache_dir, name)
+            if directory == self.directory or not os.path.isdir(directory) :
+                continue
+            try :
+                files = [ os.path.join(directory, f) for f in os.listdir(directory) ]
+                if any(not f.endswith(CACHE_SUFFIXES) or not os.path.isfile(f) for f in files) :
+                    continue
+                hosts.append((max([ os.path.getmtime(f) for f in files ] or [os.path.getmtime(directory)]), directory))
+            except OSError :
+                continue
+        now = time.time()
+        for (i, (saved, directory)) in enumerate(sorted(hosts, reverse=True)) :
+            if (self.max_hosts and i + 1 >= self.max_hosts) or (self.evict_age and now - saved > self.evict_age) :
+                if self.verbose : print(f"ⓘ Cache evicted: {directory} ({int(now - saved)}s)")
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+    def clear (self) :
+        """
+        Delete all snapshots for this ISE deployment.
+        """
+        for resource in self.resources :
+            try :
+                os.remove(self.filename(resource))
+            except FileNotFoundError :
+                pass
+
+
+    async def get_resource_details (self, ise, resource:str) -> list :
+        """
+        Returns the details of all resources, in list order, using the snapshot
+        for resources that have not changed.
+        @ise : the ISEERS client to reuse
+        @resource : the ERS resource name
+        """
+        listed = await ise.get_resources(resource)
+        if resource not in self.resources :
+            return await ise.get_resource_details(resource, ids=[r['id'] for r in listed])
+
+        (cached, fetch_time) = self.load(resource)
+        stale = set(
+            r['id'] for r in listed
+            if r['id'] not in cached or any(r[k] != cached[r['id']].get(k) for k in CACHE_KEYS if k in r)
+        )
+        if self.verbose : print(f"ⓘ Cache {resource}: {len(listed) - len(stale)} cached, {len(stale)} fetched")
+
+        fetched = { r['id'] : r for r in await ise.get_resource_details(resource, ids=[r['id'] for r in listed if r['id'] in stale]) }
+        resources = [ (fetched.get(r['id']) if r['id'] in stale else cached[r['id']]) for r in listed ]
+        resources = [ r for r in resources if r is not None ]   # skip failed details
+        # only a full fetch restarts the snapshot age so unlisted changes are picked up after max_age
+        self.save(resource, resources, fetch_time if len(stale) < len(listed) else None)
+        return resources
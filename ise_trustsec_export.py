@@ -9,6 +9,12 @@ Examples:
     ise_trustsec_export.py -vvv
     ise_trustsec_export.py --filename my_prefix
     ise_trustsec_export.py -t -f 20250101_trustsec_backup
+    ise_trustsec_export.py --cache --cache-max-age 86400
+    ise_trustsec_export.py --constant-memory
+    ise_trustsec_export.py --formats csv xlsx parquet jsonl
+    ise_trustsec_export.py --output summary
+    ise_trustsec_export.py --output window --window 30 10 --window-from Employees Guests
+    ise_trustsec_export.py --deployments ise_deployments.json -f 20250101_trustsec_backup
 
 Requires setting the these environment variables using the `export` command:
   export ISE_PPAN='1.2.3.4'             # hostname or IP address of ISE PAN
@@ -19,6 +25,14 @@ Requires setting the these environment variables using the `export` command:
 You may add these export lines to a text file and load with `source`:
   source ise.sh
 
+With `--deployments`, every ISE deployment in a JSON file is exported concurrently
+with its own credentials and connection budget instead of the `ISE_*` variables:
+  [
+    {"name":"lab", "ISE_PPAN":"10.1.1.1", "ISE_REST_USERNAME":"admin", "ISE_REST_PASSWORD":"$LAB_ISE_PASSWORD", "ISE_VERIFY":false},
+    {"name":"prod_east", "ISE_PPAN":"ise-east.example.com", "ISE_REST_USERNAME":"ers", "ISE_REST_PASSWORD":"$EAST_ISE_PASSWORD", "ISE_VERIFY":true, "connections":10}
+  ]
+Each deployment is written to `{filename}_{name}_*` files and compared in `{filename}_deployments.xlsx`.
+
 """
 __author__ = "Thomas Howard"
 __email__ = "thomas@cisco.com"
@@ -29,13 +43,23 @@ import asyncio
 import argparse
 import csv
 import io
+import itertools
 import json
 import os
 import random
 import sys
 import time
+import traceback
 import pandas as pd
+import xlsxwriter
+import yaml
 from tabulate import tabulate
+from ise_ers import ISEERS, RETRY_ATTEMPTS, TCP_CONNECTIONS, load_deployments
+from ise_trustsec_cache import SnapshotCache, CACHE_DIR, CACHE_MAX_AGE, CACHE_MAX_HOSTS, CACHE_EVICT_AGE
+from trustsec_formats import TABLE_FORMATS, check_formats, write_trustsec_tables
+from trustsec_matrix import TrustSecMatrix
+from trustsec_metrics import Metrics
+from trustsec_profile import RunProfiler
 
 # Globals
 DATA_DIR = './'
@@ -56,18 +80,20 @@ CELL_COLOR_DENY    = '#EF7775'  # Status Red, 40% Lighter
 CELL_COLOR_DEFAULT = LITE_GRAY  # default / empty
 CELL_COLOR_CUSTOM  = STATUS_BLUE  # Cisco Blue
 
-# REST Options
-JSON_HEADERS = {'Accept':'application/json', 'Content-Type':'application/json'}
-REST_PAGE_SIZE_DEFAULT=20
-REST_PAGE_SIZE_MAX=100
-REST_PAGE_SIZE=REST_PAGE_SIZE_MAX
+# Write the workbook row by row in XlsxWriter `constant_memory` mode above this many SGTs
+EXCEL_CONSTANT_MEMORY_SGTS = 1000
+
+# Output file formats. See `trustsec_formats.py` for the JSON Lines, Parquet, and Arrow IPC tables.
+OUTPUT_FORMATS = ['csv', 'xlsx'] + TABLE_FORMATS
+OUTPUT_FORMATS_DEFAULT = ['csv', 'xlsx']
 
-# Limit TCP connection pool size to prevent connection refusals by ISE!
-# 30 for ISE 2.6+; See https://cs.co/ise-scale for Concurrent ERS Connections.
-# Testing with ISE 3.0 shows *no* performance gain for >5-10
-TCP_CONNECTIONS_DEFAULT=10
-TCP_CONNECTIONS_MAX=30
-TCP_CONNECTIONS=5
+# Terminal output modes. `auto` shows every table up to OUTPUT_FULL_SGTS SGTs and OUTPUT_FULL_POLICIES
+# policies and the summary with a window of the matrix above them.
+OUTPUT_MODES = ['auto', 'full', 'summary', 'window', 'quiet']
+OUTPUT_FULL_SGTS = 20
+OUTPUT_FULL_POLICIES = 200
+OUTPUT_WINDOW = [20, 8]         # matrix window rows and columns
+OUTPUT_TOP_CELLS = 10           # most common matrix cell values in the summary
 
 # This hidden SGT is required for lookups with the default ANY-ANY SGACL.
 SGT_ANY = {'id':'92bb1950-8c01-11e6-996c-525400b48521', 'name':'ANY', 'description':'ANY', 'value':65535, 'generationId':0, 'propogateToApic':False}
@@ -132,6 +158,7 @@ Icon,Name:String(32):Required,Value,Description:String(256)
 # - `ipVersion` default is `IPV4` but attribute will not be returned if `IP_AGNOSTIC`
 # - `aclcontent` may be anything - it is not validated
 SGACL_IP_VALUES = ['IPV4','IPV6','IP_AGNOSTIC']
+SGACL_COLUMNS = ['id', 'name', 'description', 'generationId', 'aclcontent']   # for a deployment without SGACLs
 
 DEFAULT_SGACLS = """
 name,description,ipVersion,aclcontent
@@ -161,94 +188,51 @@ deny tcp dst eq 3389"
 """
 
 
-async def get_ise_resource (session, url) :
-    async with session.get(url) as resp:
-        json = await resp.json()
-        # if args.verbose : print(f'ⓘ get_ise_resource({url}): {json}')
-        return json['SearchResult']['resources']
-
-
-async def get_ise_resources (session, path) :
-    """
-    Fetch the resources from ISE.
-    @session : the aiohttp session to reuse
-    @path : the REST endpoint path
-    """
-    if args.verbose >= 4 : print(f'ⓘ get_ise_resources({path})')
-
-    # Get the first page for the total resources
-    response = await session.get(f'{path}?size={REST_PAGE_SIZE}')
-    if response.status != 200:
-        raise ValueError(f'Bad status: {response}')
-    json = await response.json()
-    total = json['SearchResult']['total']
-    resources = json['SearchResult']['resources']
-    if args.verbose : print(f'ⓘ get_ise_resources({path}): Total: {total}')
-
-    # Get all remaining resources if more than the REST page size
-    if total > REST_PAGE_SIZE :
-        pages = int(total / REST_PAGE_SIZE) + (1 if total % REST_PAGE_SIZE else 0)
-        
-        # Generate all paging URLs 
-        urls = []
-        for page in range(2, pages + 1): # already fetched first page above
-            urls.append(f'{path}?size={REST_PAGE_SIZE}&page={page}')
-
-        # Get all pages with asyncio!
-        tasks = []
-        [ tasks.append(asyncio.ensure_future(get_ise_resource(session, url))) for url in urls ]
-        responses = await asyncio.gather(*tasks)
-        [ resources.extend(response) for response in responses ]
-
-    # remove ugly 'link' attribute to flatten data
-    for r in resources:
-        if type(r) == dict and r.get('link'): 
-            del r['link']
-
-    return resources
-
-
-async def get_ise_resource_details (session, ers_name, path) :
+def create_trustsec_dataframes (sgts, sgacls) :
     """
-    Fetch the resources from ISE.
-    @session : the aiohttp session to reuse
-    @ers_name : the ERS object name in the JSON
-    @path : the REST endpoint path
+    Returns (df_sgts, df_sgacls) indexed by id from the ISE SGT and SGACL details.
+    The hidden 'ANY' SGT is added to the SGTs for the name lookup of the default egress rule.
+    @sgts : the list of SGT details
+    @sgacls : the list of SGACL details
     """
-    if args.verbose >= 4 : print(f'ⓘ get_ise_resource_details({ers_name}, {path})')
-
-    # Get all resources for their UUIDs
-    resources = await get_ise_resources(session, path)
-
-    # Save UUIDs
-    uuids = [r['id'] for r in resources]
-    resources = [] # clear list for detailed data
-    for uuid in uuids:
-        async with session.get(f'{path}/{uuid}') as resp:
-            json = await resp.json()
-            resources.append(json[ers_name])
-
-    # remove ugly 'link' attribute to flatten data
-    for r in resources:
-        if type(r) == dict and r.get('link'): 
-            del r['link']
+    df_sgts = pd.DataFrame(sgts + [SGT_ANY]).fillna('')    # ['id', 'name', 'description', 'value', 'generationId', 'propogateToApic']
+    df_sgts['generationId'] = df_sgts['generationId'].astype('int32')   # convert from text to int
+    df_sgts.set_index('id', inplace=True) # required for name lookup for the matrix
 
-    return resources
+    df_sgacls = pd.DataFrame(sgacls, columns=None if sgacls else SGACL_COLUMNS).fillna('')    # ['id', 'name', 'description', 'generationId', 'aclcontent']
+    df_sgacls['generationId'] = df_sgacls['generationId'].astype('int32')   # convert from text to int
+    df_sgacls.set_index('id', inplace=True) # required for name lookup for the matrix
+    return (df_sgts, df_sgacls)
 
 
 def create_trustsec_egress_policies_by_name (df_sgts, df_sgacls, matrix) :
     """
     Returns a dataframe of the TrustSec egress cell policies by names instead of UUIDs.
+    Names are resolved with vectorized Series lookups. Cells with an unknown source or
+    destination SGT id are reported and dropped; unknown SGACL ids are reported and kept as the id.
     """
     # print(f'\nTrustSec Matrix ({len(matrix)})\n')
     # matrix: ['id', 'name', 'description', 'sourceSgtId', 'destinationSgtId', 'matrixCellStatus', 'defaultRule', 'sgacls']
-    df = pd.DataFrame(matrix)
+    df = pd.DataFrame(matrix, columns=['id', 'name', 'description', 'sourceSgtId', 'destinationSgtId', 'matrixCellStatus', 'defaultRule', 'sgacls'])
 
     # assumes the df_sgts and df_sgacls have their index set on the id column
-    df['SrcSGT'] = df['sourceSgtId'].map(lambda id: df_sgts.loc[id,'name'])
-    df['DstSGT'] = df['destinationSgtId'].map(lambda id: df_sgts.loc[id,'name'])
-    df['SGACLs'] = df['sgacls'].map(lambda l: [ df_sgacls.loc[id,'name'] for id in l ])
-    # df['SGACLs'] = df['sgacls'].map(lambda l: ','.join([ df_sgacls.loc[id,'name'] for id in l ]) )
+    df['SrcSGT'] = df['sourceSgtId'].map(df_sgts['name'])
+    df['DstSGT'] = df['destinationSgtId'].map(df_sgts['name'])
+    dangling = df['SrcSGT'].isna() | df['DstSGT'].isna()
+    if dangling.any() :
+        print(f"⚠ Dropped {dangling.sum()} egress cells with unknown SGT ids: {df.loc[dangling, 'name'].tolist()[:10]}", file=sys.stderr)
+        df = df[~dangling].reset_index(drop=True)
+
+    # one row per (cell, SGACL id) to resolve multi-SGACL cells, then re-chunk per cell in order
+    sgacl_lists = df['sgacls'].map(lambda l: l if isinstance(l, list) else [])
+    sgacl_ids = sgacl_lists.explode().dropna()
+    sgacl_names = sgacl_ids.map(df_sgacls['name'])
+    dangling = sgacl_names.isna()
+    if dangling.any() :
+        print(f"⚠ {dangling.sum()} unknown SGACL ids kept as ids: {sgacl_ids[dangling].unique().tolist()[:10]}", file=sys.stderr)
+        sgacl_names = sgacl_names.where(~dangling, sgacl_ids)
+    names = iter(sgacl_names.tolist())
+    df['SGACLs'] = [ list(itertools.islice(names, n)) for n in sgacl_lists.map(len) ]
 
     # Re-order and drop columns
     df = df[['id', 'name', 'description', 'matrixCellStatus', 'SrcSGT', 'DstSGT', 'SGACLs', 'defaultRule',]]
@@ -263,36 +247,46 @@ def create_trustsec_egress_policies_by_name (df_sgts, df_sgacls, matrix) :
     return df
 
 
+def create_trustsec_matrix (df_sgts, df_policies, sort='name') :
+    """
+    Returns a dataframe of the TrustSec matrix with the columns ['SGT', 'Value', 'Description']
+    followed by a column for each destination SGT and a row for each source SGT.
+    Each cell has the comma-separated SGACL names or the default rule if it has no SGACLs.
+    @df_sgts : the SGTs dataframe
+    @df_policies : the egress policies by name from `create_trustsec_egress_policies_by_name()`
+    @sort : the SGT sort key: 'name' or 'value'
+    """
+    return TrustSecMatrix.from_policies(df_sgts, df_policies).to_dense(sort)
+
+
 def show (resources=None, format='dump', fh='-') :
     """
     Shows the resources in the specified format to the file handle.
-    resources : 
+    resources : a list of resource dicts
     format : ['dump', 'line', 'pretty', 'table', 'csv', 'id', 'yaml']
     filehandle : Default: `sys.stdout`
     """
-    if args.verbose : print(f"{len(resources)} resources of type ({type(resources[0])}): ")
+    if args.verbose and resources : print(f"{len(resources)} resources of type ({type(resources[0])}): ")
     # 💡 Do not close sys.stdout or it may not be re-opened
     if fh == '-':
         fh = sys.stdout
 
     if format == 'dump':  # dump json
-        # print(resources, end='\n', file=fh, flush=False)
         print(json.dumps(resources), file=fh)
 
     elif format == 'pretty':  # pretty-print
         print(json.dumps(resources, indent=2), file=fh)
 
     elif format == 'line':  # 1 line per object
-        print('[')
+        print('[', file=fh)
         [print(json.dumps(r), end=',\n', file=fh) for r in resources]
-        print(']')
+        print(']', file=fh)
 
     elif format == 'table':  # table
         print(f"\n{tabulate(resources, headers='keys', tablefmt='simple_grid')}", file=fh)
 
     elif format == 'id':  # list of ids
         ids = [[r['id']] for r in resources]  # single column table
-        # print (f"ⓘ ids : {type(ids)} | {ids}")
         print(f"\n{tabulate(ids, tablefmt='plain')}", file=fh)
 
     elif format == 'csv':  # CSV
@@ -304,224 +298,514 @@ def show (resources=None, format='dump', fh='-') :
             writer.writerow(row)
 
     elif format == 'yaml':  # YAML
-        # [print(yaml.dump(r, indent=2, default_flow_style=False), file=fh) for r in resources]
         [print(yaml.dump(r, indent=2), file=fh) for r in resources]
 
     else:  # just in case something gets through the CLI parser
-        print(MSG_CERTIFICATE_ERROR + f': {args.output}', file=sys.stderr)
+        print(f"❌ Unknown format: {format}", file=sys.stderr)
+
+
+def format_matrix_worksheet (workbook, worksheet, sgts) :
+    """
+    Set the Matrix worksheet column widths and rotated SGT headers and colorize the cells with conditional formats.
+    @workbook : the xlsxwriter Workbook
+    @worksheet : the Matrix worksheet
+    @sgts : a dataframe of the SGTs in matrix order with `name`, `value`, and `description` columns
+    """
+    # Apply a conditional format to the required cell range.
+    (max_row, max_col) = (len(sgts), len(sgts) + 3)
+
+    trustsec_cell_bg_allow   = workbook.add_format({'bg_color': CELL_COLOR_ALLOW})
+    trustsec_cell_bg_deny    = workbook.add_format({'bg_color': CELL_COLOR_DENY})
+    trustsec_cell_bg_default = workbook.add_format({'bg_color': CELL_COLOR_DEFAULT})
+    trustsec_cell_bg_custom  = workbook.add_format({'bg_color': CELL_COLOR_CUSTOM})
+    rotate_ccw               = workbook.add_format({'rotation': 45, 'border': 1})
+    header                   = workbook.add_format({'align':'left', 'valign':'bottom'})
+    reserved_sgts            = workbook.add_format({'bg_color': LITE_GRAY})
+
+    # Column widths
+    worksheet.set_column(0, 0, sgts['name'].str.len().max(), workbook.add_format({'align':'left', 'valign':'bottom'}))
+    worksheet.set_column(1, 1, 6, workbook.add_format({'align':'right', 'valign':'bottom'}))
+    worksheet.set_column(2, 2, sgts['description'].astype(str).str.len().max()/2, header)
+    worksheet.set_column(3, max_col-1, 12, header)
+
+    # Rotated destination SGT headers
+    for i,name in enumerate(sgts['name'], start=3) :
+        worksheet.write(0, i, name, rotate_ccw)
+ 
+    # With Row/Column notation, specify all cells in the range: (first_row, first_col, last_row, last_col)
+    # SGT Reserved Values 0-2
+    worksheet.conditional_format(1, 1, max_row, 1, 
+                                    {
+                                    'type':     'cell',
+                                    'criteria': 'between',
+                                    'minimum':  0,
+                                    'maximum':  2,
+                                    'format':   reserved_sgts
+                                    })
+
+    # SGT Reserved Values > 65519
+    worksheet.conditional_format(1, 1, max_row, 1, 
+                                    {
+                                    'type':     'cell',
+                                    'criteria': 'greater than',
+                                    'minimum':  65519,
+                                    'value':    'Reserved',
+                                    'format':   reserved_sgts
+                                    })
+
+    # Empty cells
+    worksheet.conditional_format(1, 3, max_row, max_col-1, 
+                                    {
+                                    'type':     'blanks',
+                                    'format':   trustsec_cell_bg_default
+                                    })
+
+    # 'default' from Meraki
+    worksheet.conditional_format(1, 3, max_row, max_col-1, 
+                                    {
+                                    'type':     'text',
+                                    'criteria': 'begins with',
+                                    'value':    'default',
+                                    'format':   trustsec_cell_bg_default
+                                    })
+
+    # 'allow' from Meraki
+    worksheet.conditional_format(1, 3, max_row, max_col-1,
+                                    {
+                                    'type':     'text',
+                                    'criteria': 'begins with',
+                                    'value':    'allow',
+                                    'format':   trustsec_cell_bg_allow
+                                    })
+
+    # 'permit' default SGACLs from ISE
+    worksheet.conditional_format(1, 3, max_row, max_col-1,
+                                    {
+                                    'type':     'text',
+                                    'criteria': 'begins with',
+                                    'value':    'permit',
+                                    'format':   trustsec_cell_bg_allow
+                                    })
+
+    # 'deny' default SGACLs from ISE
+    worksheet.conditional_format(1, 3, max_row, max_col-1,
+                                    {
+                                    'type':     'text',
+                                    'criteria': 'begins with',
+                                    'value':    'deny',
+                                    'format':   trustsec_cell_bg_deny
+                                    })
+
+    # Custom SGACL Names
+    worksheet.conditional_format(1, 3, max_row, max_col-1,
+                                    {
+                                    'type':     'no_blanks',
+                                    'format':   trustsec_cell_bg_custom
+                                    })
+
+
+def write_trustsec_workbook (filename, matrix, df_sgacls, df_sgts, sort='name', constant_memory=False, df_matrix=None) :
+    """
+    Write the Matrix, SGACLs, and SGTs worksheets to an Excel workbook.
+    @filename : the Excel workbook filename
+    @matrix : the TrustSecMatrix
+    @df_sgacls : the SGACLs dataframe
+    @df_sgts : the SGTs dataframe
+    @sort : the SGT sort key: 'name' or 'value'
+    @constant_memory : write one row at a time with `write_trustsec_workbook_streaming()`
+    @df_matrix : the dense matrix if already created
+    """
+    if constant_memory :
+        write_trustsec_workbook_streaming(filename, matrix, df_sgacls, df_sgts, sort=sort)
+        return
+
+    df_matrix = matrix.to_dense(sort=sort) if df_matrix is None else df_matrix
+    with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
+
+        df_matrix.to_excel(writer, sheet_name='Matrix', index=False)
+        df_sgacls.to_excel(writer, sheet_name='SGACLs', index=False)
+        df_sgts.to_excel(writer, sheet_name='SGTs', index=False)
+
+        worksheet = writer.sheets['Matrix']
+        format_matrix_worksheet(writer.book, worksheet, matrix.sorted_sgts(sort))
+
+        # worksheet.select()      # tab highlighted
+        worksheet.set_first_sheet() # First, leftmost, visible worksheet tab.
+        worksheet.activate()    # initially visible in a multi-sheet workbook
 
 
-async def ise_trustsec_export (session) :
+def write_trustsec_workbook_streaming (filename, matrix, df_sgacls, df_sgts, sort='name') :
+    """
+    Write the Matrix, SGACLs, and SGTs worksheets one row at a time with XlsxWriter's
+    `constant_memory` mode so memory stays flat for very large matrices.
+    Matrix rows are written directly from the sparse matrix with only the non-default cells.
+    @filename : the Excel workbook filename
+    @matrix : the TrustSecMatrix
+    @df_sgacls : the SGACLs dataframe
+    @df_sgts : the SGTs dataframe
+    @sort : the SGT sort key: 'name' or 'value'
+    """
+    workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+
+    # Rows must be written in order: the header row, with the rotated SGT headers, first
+    worksheet = workbook.add_worksheet('Matrix')
+    worksheet.write_row(0, 0, ['SGT', 'Value', 'Description'])
+    format_matrix_worksheet(workbook, worksheet, matrix.sorted_sgts(sort))
+    for (row, (name, value, description, cells)) in enumerate(matrix.iter_rows(sort), start=1) :
+        worksheet.write_row(row, 0, [name, value, description])
+        for (col, cell) in cells :
+            worksheet.write_string(row, col + 3, cell)
+    worksheet.set_first_sheet() # First, leftmost, visible worksheet tab.
+    worksheet.activate()    # initially visible in a multi-sheet workbook
+
+    for (sheet, df) in [('SGACLs', df_sgacls), ('SGTs', df_sgts)] :
+        worksheet = workbook.add_worksheet(sheet)
+        worksheet.write_row(0, 0, df.columns)
+        for (row, values) in enumerate(df.astype(object).itertuples(index=False, name=None), start=1) :
+            worksheet.write_row(row, 0, values)
+
+    workbook.close()
+
+
+async def ise_trustsec_fetch (ise, cache=None) -> tuple :
+    """
+    Returns the ISE TrustSec (sgts, sgacls, policies) details fetched concurrently.
+    @ise : the ISEERS client to reuse
+    @cache : an optional SnapshotCache to only fetch the details of changed resources
+    """
+    get_resource_details = (lambda resource: cache.get_resource_details(ise, resource)) if cache else ise.get_resource_details
+
+    # The resources are independent until name resolution so they are fetched together.
+    # Every request shares the client's connection pool and concurrency limit.
+    with ise.metrics.phase('fetch') :
+        return await asyncio.gather(
+            get_resource_details('sgt'),
+            get_resource_details('sgacl'),
+            get_resource_details('egressmatrixcell'),
+        )
+
+
+async def ise_trustsec_export (ise, cache=None) :
     """
     Get and show the ISE TrustSec SGTs, SGACLs, and Matrix.
+    @ise : the ISEERS client to reuse
+    @cache : an optional SnapshotCache to only fetch the details of changed resources
+    """
+    (sgts, sgacls, policies) = await ise_trustsec_fetch(ise, cache)
+    trustsec_export(sgts, sgacls, policies, DATA_DIR+args.filename, sort=args.sort,
+                    constant_memory=args.constant_memory, verbose=args.verbose, metrics=ise.metrics, formats=args.formats,
+                    output=args.output, window=args.window, window_from=args.window_from)
+
+
+async def ise_trustsec_export_deployments (deployments:list, metrics:Metrics) -> int :
+    """
+    Fetch the TrustSec data of every ISE deployment concurrently and export each one as it arrives,
+    in a thread so it never blocks the fetches still in flight, to `{filename}_{deployment}` files,
+    then write the `{filename}_deployments.xlsx` comparison workbook.
+    Each deployment has its own client, connection pool, and concurrency limit so a slow PAN
+    only holds its own connections. Returns the number of deployments that failed.
+    @deployments : the deployments from `load_deployments()`
+    @metrics : the Metrics shared by every deployment's client
+    """
+    async def fetch (deployment) :
+        start = time.perf_counter()
+        try :
+            options = {'connections':args.connections, 'adaptive':args.adaptive, 'retries':args.retries, **deployment['options']}
+            async with ISEERS.from_env(env=deployment['env'], metrics=metrics, verbose=args.verbose, **options) as ise :
+                cache = SnapshotCache(ise.hostname, cache_dir=args.cache_dir, max_age=args.cache_max_age, max_hosts=args.cache_max_hosts,
+                                      evict_age=args.cache_evict_age, verbose=args.verbose) if args.cache else None
+                if cache and args.cache_clear : cache.clear()
+                return (deployment, await ise_trustsec_fetch(ise, cache), None, time.perf_counter() - start)
+        except Exception as e :
+            return (deployment, None, e, time.perf_counter() - start)
+
+    summary = []
+    snapshots = {}          # {deployment name : (sgacls, TrustSecMatrix)}
+    for future in asyncio.as_completed([ fetch(deployment) for deployment in deployments ]) :
+        (deployment, trustsec, error, seconds) = await future
+        (name, hostname) = (deployment['name'], deployment['env']['ISE_PPAN'])
+        if not error :
+            (sgts, sgacls, policies) = trustsec
+            print(f"\nⓘ Deployment: {name} {hostname} ({len(sgts)} SGTs, {len(sgacls)} SGACLs, {len(policies)} policies) in {seconds:.3f} seconds")
+            try :
+                # pandas and XlsxWriter run in a thread so the other deployments' fetches keep going
+                matrix = await asyncio.to_thread(trustsec_export, sgts, sgacls, policies, DATA_DIR+f"{args.filename}_{name}", sort=args.sort,
+                                                 constant_memory=args.constant_memory, verbose=args.verbose, metrics=metrics,
+                                                 formats=args.formats, output=args.output, window=args.window,
+                                                 window_from=args.window_from)
+                snapshots[name] = (sgacls, matrix)
+            except Exception as e :
+                error = e
+        if error :
+            print(f"\n❌ {name} {hostname}: {type(error).__name__}: {error}\n", file=sys.stderr)
+            if args.verbose : traceback.print_exception(error)
+            summary.append({'Deployment':name, 'Hostname':hostname, 'Status':f"{type(error).__name__}: {error}", 'Seconds':round(seconds, 3)})
+            continue
+        (sgacls, matrix) = snapshots[name]
+        summary.append({'Deployment':name, 'Hostname':hostname, 'Status':'OK', 'Seconds':round(seconds, 3),
+                        'SGTs':len(matrix.sgts), 'SGACLs':len(sgacls), 'Cells':len(matrix)})
+
+    # the workbook lists the deployments in the file order instead of the completion order
+    order = [ deployment['name'] for deployment in deployments ]
+    summary.sort(key=lambda row: order.index(row['Deployment']))
+    comparison = compare_deployments({ name : snapshots[name] for name in order if name in snapshots })
+    filename = DATA_DIR+f"{args.filename}_deployments.xlsx"
+    with metrics.phase('excel') :
+        write_deployments_workbook(filename, pd.DataFrame(summary), comparison)
+    differences = { sheet : int((~df['Consistent']).sum()) for (sheet, df) in comparison.items() }
+    print(f"\nⓘ Deployments: {len(snapshots)} of {len(deployments)} exported, differences: {differences}")
+    print(f"ⓘ Comparison: {filename}")
+    return len(deployments) - len(snapshots)
+
+
+def compare_deployments (snapshots:dict) -> dict :
+    """
+    Returns the 'SGTs', 'SGACLs', and 'Matrix' comparison dataframes of the deployments with a row per
+    SGT name, SGACL name, or (Source, Destination) cell and a column per deployment with its SGT value,
+    SGACL content, or cell value. A row is `Consistent` when every deployment has the same value.
+    @snapshots : {deployment name : (sgacls, TrustSecMatrix)} in column order
+    """
+    def sgacl_content (sgacl) :
+        # ISE omits the `ipVersion` of IP_AGNOSTIC SGACLs
+        ip_version = sgacl.get('ipVersion', 'IP_AGNOSTIC')
+        return sgacl.get('aclcontent', '') if ip_version == 'IP_AGNOSTIC' else f"{ip_version}\n{sgacl.get('aclcontent', '')}"
+
+    def cells (matrix) :
+        names = matrix.sgts['name']
+        return { (names[src], names[dst]) : value for (src, dst, value) in matrix.cells() }
+
+    columns = {
+        'SGTs'   : { name : dict(zip(matrix.sgts['name'], matrix.sgts.index)) for (name, (sgacls, matrix)) in snapshots.items() },
+        'SGACLs' : { name : { sgacl['name'] : sgacl_content(sgacl) for sgacl in sgacls } for (name, (sgacls, matrix)) in snapshots.items() },
+        'Matrix' : { name : cells(matrix) for (name, (sgacls, matrix)) in snapshots.items() },
+    }
+    index_names = {'SGTs':['SGT'], 'SGACLs':['SGACL'], 'Matrix':['Source', 'Destination']}
+    comparison = {}
+    for (sheet, values) in columns.items() :
+        keys = sorted(set().union(*values.values()))
+        index = pd.MultiIndex.from_tuples(keys, names=index_names[sheet]) if sheet == 'Matrix' else pd.Index(keys, name=index_names[sheet][0])
+        df = pd.DataFrame({ name : pd.Series(column, dtype=object) for (name, column) in values.items() }, index=index, dtype=object)
+        df['Consistent'] = df.nunique(axis='columns', dropna=False) == 1
+        comparison[sheet] = df.fillna('').reset_index()
+    return comparison
+
+
+def write_deployments_workbook (filename:str, df_summary:pd.DataFrame, comparison:dict) :
+    """
+    Write the Summary worksheet and the 'SGTs', 'SGACLs', and 'Matrix' comparison worksheets
+    with the inconsistent rows highlighted to an Excel workbook.
+    @filename : the Excel workbook filename
+    @df_summary : a row per deployment with its status and counts
+    @comparison : the comparison dataframes from `compare_deployments()`
+    """
+    with pd.ExcelWriter(filename, engine='xlsxwriter') as writer :
+        df_summary.to_excel(writer, sheet_name='Summary', index=False)
+        inconsistent = writer.book.add_format({'bg_color': CELL_COLOR_DENY})
+        wrap = writer.book.add_format({'text_wrap': True, 'valign': 'top'})
+        for (sheet, df) in comparison.items() :
+            df.to_excel(writer, sheet_name=sheet, index=False)
+            worksheet = writer.sheets[sheet]
+            worksheet.freeze_panes(1, 2 if sheet == 'Matrix' else 1)
+            worksheet.set_column(0, len(df.columns) - 1, 24, wrap if sheet == 'SGACLs' else None)
+            consistent = xlsxwriter.utility.xl_col_to_name(len(df.columns) - 1)
+            worksheet.conditional_format(1, 0, max(len(df), 1), len(df.columns) - 1,
+                                         {
+                                         'type':     'formula',
+                                         'criteria': f'=${consistent}2=FALSE',
+                                         'format':   inconsistent
+                                         })
+        worksheet = writer.sheets['Summary']
+        worksheet.set_column(0, len(df_summary.columns) - 1, 16)
+        worksheet.activate()    # initially visible in a multi-sheet workbook
+
+
+def output_mode (output:str, matrix, df_policies) -> str :
+    """
+    Returns the terminal output mode with `auto` resolved by the data size.
+    @output : the output mode from OUTPUT_MODES
+    @matrix : the TrustSecMatrix
+    @df_policies : the egress policies by name
+    """
+    if output != 'auto' :
+        return output
+    return 'full' if len(matrix.sgts) <= OUTPUT_FULL_SGTS and len(df_policies) <= OUTPUT_FULL_POLICIES else 'window'
+
+
+def sgt_position (sgts, sgt) -> int :
     """
-    
+    Returns the 0-based position of the SGT name or value in the sorted SGTs or 0 if it is not found.
+    @sgts : the sorted SGTs from `TrustSecMatrix.sorted_sgts()`
+    @sgt : an SGT name or value or None
+    """
+    if sgt is None :
+        return 0
+    found = (sgts['name'] == str(sgt)) | (sgts['value'].astype(str) == str(sgt))
+    if not found.any() :
+        print(f"⚠ Unknown window SGT '{sgt}'", file=sys.stderr)
+        return 0
+    return int(found.to_numpy().argmax())
+
+
+def show_trustsec (df_sgts, df_sgacls, df_policies, matrix, df_matrix=None, output='auto', sort='name', window=OUTPUT_WINDOW, window_from=None) :
+    """
+    Show the TrustSec data on the terminal in an output mode:
+    - full : the SGTs, SGACLs, policies, and the dense matrix up to EXCEL_CONSTANT_MEMORY_SGTS SGTs
+    - summary : only the counts and the most common matrix cells
+    - window : the summary and a window of the matrix
+    - quiet : nothing so no tables are rendered
+    - auto : full for small exports and window above OUTPUT_FULL_SGTS SGTs or OUTPUT_FULL_POLICIES policies
+    @df_sgts : the SGTs dataframe
+    @df_sgacls : the SGACLs dataframe
+    @df_policies : the egress policies by name with comma-separated SGACLs
+    @matrix : the TrustSecMatrix
+    @df_matrix : the dense matrix if already created
+    @output : the output mode from OUTPUT_MODES
+    @sort : the SGT sort key: 'name' or 'value'
+    @window : the matrix window (rows, columns)
+    @window_from : the (source, destination) SGT names or values of the window's first row and column
+    """
+    output = output_mode(output, matrix, df_policies)
+    if output == 'quiet' :
+        return
+
+    if output == 'full' :
+        print(f"\nⓘ SGTs:\n{df_sgts.to_markdown(index=False, tablefmt='simple_grid')}\n")
+        print(f"\nⓘ SGACLs:\n{df_sgacls.to_markdown(index=False, tablefmt='simple_grid')}\n")
+        print(f"\nⓘ Policies:\n{df_policies.to_markdown(index=False, tablefmt='simple_grid')}\n")
+        if len(matrix.sgts) > EXCEL_CONSTANT_MEMORY_SGTS :
+            print(f"\nⓘ Matrix: {len(matrix.sgts)} × {len(matrix.sgts)} SGTs is only written to Excel. Use `--output window` to show part of it.\n")
+        else :
+            df_matrix = matrix.to_dense(sort=sort) if df_matrix is None else df_matrix
+            print(f"\nⓘ Matrix:\n{df_matrix.to_markdown(index=False, tablefmt='simple_grid')}\n")
+        return
+
+    # Summary
+    sgts = len(matrix.sgts)
+    used = { name for sgacls in df_policies['SGACLs'] for name in sgacls.split(',') }
+    unused = int((~df_sgacls['name'].isin(used)).sum())
+    density = 100 * len(matrix) / sgts**2 if sgts else 0
+    print(f"\nⓘ Summary: {sgts} SGTs, {len(df_sgacls)} SGACLs ({unused} unused), {len(df_policies)} policies, "
+          f"{len(matrix)} of {sgts**2} matrix cells ({density:.1f}%)")
+    if len(df_policies) :
+        print(f"ⓘ Policy status: {df_policies['Status'].value_counts().to_dict()}")
+    counts = matrix.value_counts().head(OUTPUT_TOP_CELLS)
+    if len(counts) :
+        df_counts = pd.DataFrame({'Cell':counts.index, 'Cells':counts.to_numpy(), '%':100 * counts.to_numpy() / len(matrix)})
+        print(f"\nⓘ Top matrix cells:\n{df_counts.to_markdown(index=False, tablefmt='simple_grid', floatfmt='.1f')}\n")
+
+    # Window
+    if output == 'window' and sgts :
+        sorted_sgts = matrix.sorted_sgts(sort)
+        (row, column) = [ sgt_position(sorted_sgts, sgt) for sgt in (window_from or [None, None]) ]
+        df_window = matrix.window(window[0], window[1], row=row, column=column, sort=sort).drop(columns='Description')
+        columns = len(df_window.columns) - 2
+        print(f"\nⓘ Matrix rows {row + 1}-{row + len(df_window)} and columns {column + 1}-{column + columns} of {sgts} SGTs:")
+        print(f"{df_window.to_markdown(index=False, tablefmt='simple_grid')}\n")
+
+
+def trustsec_export (sgts, sgacls, policies, filename, sort='name', constant_memory=False, verbose=0, metrics=None, formats=OUTPUT_FORMATS_DEFAULT,
+                     output='auto', window=OUTPUT_WINDOW, window_from=None) :
+    """
+    Show and write the SGTs, SGACLs, and egress matrix cells to the CSVs, the Excel workbook,
+    and any JSON Lines, Parquet, or Arrow IPC tables. Returns the TrustSecMatrix.
+    @sgts : the list of SGT details
+    @sgacls : the list of SGACL details
+    @policies : the list of egress matrix cell details
+    @filename : the output filename prefix for `{filename}_sgts.csv`, `_sgacls.csv`, `_matrix.csv`, `_matrix.xlsx`,
+                and `{filename}_{table}.{format}` tables
+    @sort : the SGT sort key: 'name' or 'value'
+    @constant_memory : write Excel row by row. Default: above EXCEL_CONSTANT_MEMORY_SGTS SGTs
+    @verbose : verbosity level
+    @metrics : the Metrics to time the phases in
+    @formats : the OUTPUT_FORMATS to write
+    @output : the terminal output mode from OUTPUT_MODES. See `show_trustsec()`.
+    @window : the matrix window (rows, columns)
+    @window_from : the (source, destination) SGT names or values of the window's first row and column
+    """
+    metrics = metrics or Metrics()
+    check_formats(formats)
+
     #--------------------------------------------------------------------------
-    # Show on Terminal
+    # Resolve SGT and SGACL names and pivot the matrix
     #--------------------------------------------------------------------------
+    with metrics.phase('resolve') :
+        (df_sgts, df_sgacls) = create_trustsec_dataframes(sgts, sgacls)
+        df_policies = create_trustsec_egress_policies_by_name(df_sgts, df_sgacls, policies)
+        sgacl_lists = df_policies['SGACLs']     # the tables keep the SGACL name lists
+        df_policies['SGACLs'] = df_policies['SGACLs'].apply(lambda sgacls: ','.join(sgacls))
+
+    # keep the matrix sparse and only expand it to the dense SGT × SGT layout for display and Excel
+    with metrics.phase('pivot') :
+        matrix = TrustSecMatrix.from_policies(df_sgts, df_policies)
+        constant_memory = constant_memory or len(matrix.sgts) > EXCEL_CONSTANT_MEMORY_SGTS
+        output = output_mode(output, matrix, df_policies)
+        dense = not constant_memory and ('xlsx' in formats or output == 'full')
+        df_matrix = matrix.to_dense(sort=sort) if dense else None
 
-    # Show SGTs
-    sgts = await get_ise_resource_details(session, 'Sgt', '/ers/config/sgt')
-    sgts.append(SGT_ANY)
-    df_sgts = pd.DataFrame(sgts).fillna('')    # ['id', 'name', 'description', 'value', 'generationId', 'propogateToApic']
-    df_sgts['generationId'] = df_sgts['generationId'].astype('int32')   # convert from text to int
-    df_sgts.set_index('id', inplace=True) # required for name lookup for the matrix
-    print(f"\nⓘ SGTs:\n{df_sgts.to_markdown(index=False, tablefmt='simple_grid')}\n")
+    #--------------------------------------------------------------------------
+    # Show on Terminal
+    #--------------------------------------------------------------------------
+    with metrics.phase('show') :
+        # ⚠ Raw policy data is a list of dicts with UUIDs for SGTs and SGACLs
+        if verbose and output == 'full' : print(f"\nⓘ Raw Policies with UUIDs:\n{policies}")
+        show_trustsec(df_sgts, df_sgacls, df_policies, matrix, df_matrix=df_matrix, output=output, sort=sort,
+                      window=window, window_from=window_from)
 
-    # Show SGACLs
-    sgacls = await get_ise_resource_details(session, 'Sgacl', '/ers/config/sgacl')
-    df_sgacls = pd.DataFrame(sgacls).fillna('')    # ['id', 'name', 'description', 'generationId', 'aclcontent']
-    df_sgacls['generationId'] = df_sgacls['generationId'].astype('int32')   # convert from text to int
-    df_sgacls.set_index('id', inplace=True) # required for name lookup for the matrix
-    print(f"\nⓘ SGACLs:\n{df_sgacls.to_markdown(index=False, tablefmt='simple_grid')}\n")
-
-    # Show Policies
-    # ⚠ Raw policy data is a list of dicts with UUIDs for SGTs and SGACLs
-    policies = await get_ise_resource_details(session, 'EgressMatrixCell', '/ers/config/egressmatrixcell')
-    if args.verbose : print(f"\nⓘ Raw Policies with UUIDs:\n{policies}")
-
-    df_policies = create_trustsec_egress_policies_by_name(df_sgts, df_sgacls, policies)
-    df_policies['SGACLs'] = df_policies['SGACLs'].apply(lambda sgacls: ','.join(sgacls))
-    print(f"\nⓘ Policies:\n{df_policies.to_markdown(index=False, tablefmt='simple_grid')}\n")
-
-    df_matrix = df_sgts.drop(df_sgts[df_sgts['name'] == 'ANY'].index)   # do not show 'ANY' SGT
-    df_matrix.sort_values(args.sort, inplace=True) # name or value
-    df_matrix = df_matrix[['name', 'value', 'description']] # drop all other columns
-    df_matrix.rename(columns={'name':'SGT','value':'Value','description':'Description'}, inplace=True)
-
-    for column in df_matrix['SGT'] :
-        df_matrix[column] = ""    # create empty matrix with default
-    if args.verbose : print(f"\nⓘ Matrix after columns added:\n{df_matrix.to_markdown(index=False, tablefmt='simple_grid')}")
-    
-    # iterate over policies to fill in the matrix
-    df_matrix.set_index('SGT', inplace=True)
-    for row in df_policies.to_dict('records') :
-        if row['SrcSGT'] == 'ANY' :
-            pass    # do not include 'ANY'
-        elif len(row['SGACLs']) > 0 :
-            # use the SGACL(s)
-            df_matrix.at[row['SrcSGT'], row['DstSGT']] = row['SGACLs']
-        else :
-            # use the default rule
-            df_matrix.at[row['SrcSGT'], row['DstSGT']] = row['lastEntryRule']
-    df_matrix.reset_index(names=['SGT'], inplace=True)   # keep the name column
-    print(f"\nⓘ Matrix:\n{df_matrix.to_markdown(index=False, tablefmt='simple_grid')}\n")
+    #--------------------------------------------------------------------------
+    # Export typed tables to JSON Lines, Parquet, or Arrow IPC
+    #--------------------------------------------------------------------------
+    write_trustsec_tables(filename, formats, df_sgts, df_sgacls, df_policies.assign(SGACLs=sgacl_lists), matrix, metrics=metrics)
 
     #--------------------------------------------------------------------------
     # Export dataframes to CSVs
     #--------------------------------------------------------------------------
-
-    # Icon,Name:String(32):Required,Value,Description:String(256)
+    # the CSVs and the workbook have the SGTs with an icon and without the hidden 'ANY' SGT
     df_sgts.insert(0, 'Icon', SGT_ICONS['security'])
     df_sgts = df_sgts.drop(df_sgts[df_sgts['name'] == 'ANY'].index)
-    df_sgts.drop(['generationId', 'propogateToApic'], axis='columns') \
-           .rename(columns={
-                    'name' : 'Name:String(32):Required',
-                    'description' : 'Description:String(256)',
-                    'value' : 'Value',
-                }) \
-           .to_csv(DATA_DIR+args.filename+'_sgts.csv', index=False)
-
-    # There is no CSV format for SGACLs so we will do the raw dataframe
-    df_sgacls.to_csv(DATA_DIR+args.filename+'_sgacls.csv', index=False)
-
-    #
-    # ISE Policy Matrix CSV import/export header
-    # EgressMatrixCells
-    # - Source SGT:String(32):Required
-    # - Destination SGT:String(32):Required
-    # - SGACL Name:String(32):Required
-    # - Rule Status:String(enabled|disabled|monitor):Required
-    #
-    # ['ID', 'Name', 'Description', 'Status', 'SrcSGT', 'DstSGT', 'SGACLs', 'DefaultRule']
-    df_policies[['SrcSGT','DstSGT','SGACLs','Status',]] \
-        .drop(df_policies[df_policies['SrcSGT'] == 'ANY'].index) \
-        .rename(columns={
-                'SrcSGT':'Source SGT:String(32):Required',
-                'DstSGT':'Destination SGT:String(32):Required',
-                'SGACLs':'SGACL Name:String(32):Required',
-                'Status':'Rule Status:String(enabled|disabled|monitor):Required',
-            }) \
-        .to_csv(DATA_DIR+args.filename+'_matrix.csv', index=False)
+
+    if 'csv' in formats :
+        with metrics.phase('csv') :
+
+            # Icon,Name:String(32):Required,Value,Description:String(256)
+            df_sgts.drop(['generationId', 'propogateToApic'], axis='columns') \
+                   .rename(columns={
+                            'name' : 'Name:String(32):Required',
+                            'description' : 'Description:String(256)',
+                            'value' : 'Value',
+                        }) \
+                   .to_csv(filename+'_sgts.csv', index=False)
+
+            # There is no CSV format for SGACLs so we will do the raw dataframe
+            df_sgacls.to_csv(filename+'_sgacls.csv', index=False)
+
+            #
+            # ISE Policy Matrix CSV import/export header
+            # EgressMatrixCells
+            # - Source SGT:String(32):Required
+            # - Destination SGT:String(32):Required
+            # - SGACL Name:String(32):Required
+            # - Rule Status:String(enabled|disabled|monitor):Required
+            #
+            # ['ID', 'Name', 'Description', 'Status', 'SrcSGT', 'DstSGT', 'SGACLs', 'DefaultRule']
+            df_policies[['SrcSGT','DstSGT','SGACLs','Status',]] \
+                .drop(df_policies[df_policies['SrcSGT'] == 'ANY'].index) \
+                .rename(columns={
+                        'SrcSGT':'Source SGT:String(32):Required',
+                        'DstSGT':'Destination SGT:String(32):Required',
+                        'SGACLs':'SGACL Name:String(32):Required',
+                        'Status':'Rule Status:String(enabled|disabled|monitor):Required',
+                    }) \
+                .to_csv(filename+'_matrix.csv', index=False)
 
 
     #--------------------------------------------------------------------------
     # Export dataframes to an Excel Workbook
     #--------------------------------------------------------------------------
-    with pd.ExcelWriter(DATA_DIR+args.filename+'_matrix.xlsx', engine='xlsxwriter') as writer:
-
-        df_matrix.to_excel(writer, sheet_name='Matrix', index=False)
-        df_sgacls.to_excel(writer, sheet_name='SGACLs', index=False)
-        df_sgts.to_excel(writer, sheet_name='SGTs', index=False)
-
-        # 
-        # Colorize the matrix sheet in Excel
-        #
-        
-        # Apply a conditional format to the required cell range.
-        (max_row, max_col) = df_matrix.shape
-        workbook  = writer.book
-
-        trustsec_cell_bg_allow   = workbook.add_format({'bg_color': CELL_COLOR_ALLOW})
-        trustsec_cell_bg_deny    = workbook.add_format({'bg_color': CELL_COLOR_DENY})
-        trustsec_cell_bg_default = workbook.add_format({'bg_color': CELL_COLOR_DEFAULT})
-        trustsec_cell_bg_custom  = workbook.add_format({'bg_color': CELL_COLOR_CUSTOM})
-        rotate_ccw               = workbook.add_format({'rotation': 45, 'border': 1})
-        header                   = workbook.add_format({'align':'left', 'valign':'bottom'})
-        reserved_sgts            = workbook.add_format({'bg_color': LITE_GRAY})
-        
-        worksheet = writer.sheets['Matrix']
-
-        # Column widths
-        for i,column in enumerate(df_matrix.columns, start=0) :
-            if column == 'SGT' : 
-                worksheet.set_column(i, i, \
-                                    max(df_matrix['SGT'].apply(lambda x: len(x))), \
-                                    workbook.add_format({'align':'left', 'valign':'bottom'}))
-            elif column == 'Value' : 
-                worksheet.set_column(i, i, 6, workbook.add_format({'align':'right', 'valign':'bottom'}))
-            elif column == 'Description' : 
-                worksheet.set_column(i, i, max(df_matrix['Description'].apply(lambda x: len(x)))/2, header)
-            else : 
-                worksheet.set_column(i, i, 12, header)
-                worksheet.write(0, i, column, rotate_ccw)
- 
-        # With Row/Column notation, specify all cells in the range: (first_row, first_col, last_row, last_col)
-        # SGT Reserved Values 0-2
-        worksheet.conditional_format(1, 1, max_row, 1, 
-                                        {
-                                        'type':     'cell',
-                                        'criteria': 'between',
-                                        'minimum':  0,
-                                        'maximum':  2,
-                                        'format':   reserved_sgts
-                                        })
-
-        # SGT Reserved Values > 65519
-        worksheet.conditional_format(1, 1, max_row, 1, 
-                                        {
-                                        'type':     'cell',
-                                        'criteria': 'greater than',
-                                        'minimum':  65519,
-                                        'value':    'Reserved',
-                                        'format':   reserved_sgts
-                                        })
-
-        # Empty cells
-        worksheet.conditional_format(1, 3, max_row, max_col-1, 
-                                        {
-                                        'type':     'blanks',
-                                        'format':   trustsec_cell_bg_default
-                                        })
-
-        # 'default' from Meraki
-        worksheet.conditional_format(1, 3, max_row, max_col-1, 
-                                        {
-                                        'type':     'text',
-                                        'criteria': 'begins with',
-                                        'value':    'default',
-                                        'format':   trustsec_cell_bg_default
-                                        })
-
-        # 'allow' from Meraki
-        worksheet.conditional_format(1, 3, max_row, max_col-1,
-                                        {
-                                        'type':     'text',
-                                        'criteria': 'begins with',
-                                        'value':    'allow',
-                                        'format':   trustsec_cell_bg_allow
-                                        })
-
-        # 'permit' default SGACLs from ISE
-        worksheet.conditional_format(1, 3, max_row, max_col-1,
-                                        {
-                                        'type':     'text',
-                                        'criteria': 'begins with',
-                                        'value':    'permit',
-                                        'format':   trustsec_cell_bg_allow
-                                        })
-
-        # 'deny' default SGACLs from ISE
-        worksheet.conditional_format(1, 3, max_row, max_col-1,
-                                        {
-                                        'type':     'text',
-                                        'criteria': 'begins with',
-                                        'value':    'deny',
-                                        'format':   trustsec_cell_bg_deny
-                                        })
-
-        # Custom SGACL Names
-        worksheet.conditional_format(1, 3, max_row, max_col-1,
-                                        {
-                                        'type':     'no_blanks',
-                                        'format':   trustsec_cell_bg_custom
-                                        })
-
-        # worksheet.select()      # tab highlighted
-        worksheet.set_first_sheet() # First, leftmost, visible worksheet tab.
-        worksheet.activate()    # initially visible in a multi-sheet workbook
-
-
+    if 'xlsx' in formats :
+        with metrics.phase('excel') :
+            write_trustsec_workbook(filename+'_matrix.xlsx', matrix, df_sgacls, df_sgts, sort=sort,
+                                    constant_memory=constant_memory, df_matrix=df_matrix)
+    return matrix
 
 
 async def parse_cli_arguments () :
@@ -529,13 +813,35 @@ async def parse_cli_arguments () :
     Parse the command line arguments
     """
     ARGS = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ARGS.add_argument('-a', '--adaptive', action='store_true', default=False, help='adapt the ISE request concurrency to the measured response times')
+    ARGS.add_argument('-c', '--cache', action='store_true', default=False, help='only fetch details of SGTs and SGACLs that are new or have a new name or description since the last cached snapshot. '
+                      'ERS list pages have no generationId, so a changed SGT value or SGACL content is only fetched after --cache-max-age')
+    ARGS.add_argument('--cache-dir', default=CACHE_DIR, help='snapshot cache directory')
+    ARGS.add_argument('--cache-max-age', type=float, default=CACHE_MAX_AGE, help='seconds before a snapshot is refetched completely; the longest a changed SGT value or SGACL content may be stale')
+    ARGS.add_argument('--cache-max-hosts', type=int, default=CACHE_MAX_HOSTS, help='ISE deployments kept in the snapshot cache, at least the number of deployments; 0 keeps all')
+    ARGS.add_argument('--cache-evict-age', type=float, default=CACHE_EVICT_AGE, help="seconds since another deployment's last snapshot before it is evicted; 0 keeps all")
+    ARGS.add_argument('--cache-clear', action='store_true', default=False, help='delete the cached snapshots before the export')
+    ARGS.add_argument('-d', '--deployments', default=None, metavar='FILENAME', help='export every ISE deployment in the JSON file concurrently and compare them')
     ARGS.add_argument('-f', '--filename', required=False, help='filename', default=TRUSTSEC_BASE_FILENAME)
-    # ARGS.add_argument('-o', '--output', choices=['dump', 'line', 'pretty', 'table', 'csv', 'id', 'yaml'], default='dump')
+    ARGS.add_argument('-n', '--connections', type=int, default=TCP_CONNECTIONS, help='ISE connections per deployment unless set in the deployments file')
+    ARGS.add_argument('-m', '--constant-memory', action='store_true', default=False, help=f'write Excel row by row in constant memory. Default: above {EXCEL_CONSTANT_MEMORY_SGTS} SGTs')
+    ARGS.add_argument('-F', '--formats', nargs='+', choices=OUTPUT_FORMATS, default=OUTPUT_FORMATS_DEFAULT, help='output file formats. Parquet and Arrow IPC require pyarrow')
+    ARGS.add_argument('-o', '--output', choices=OUTPUT_MODES, default='auto', help=f'terminal output. Default: full up to {OUTPUT_FULL_SGTS} SGTs, else a summary and a matrix window')
+    ARGS.add_argument('--window', type=int, nargs=2, default=OUTPUT_WINDOW, metavar=('ROWS', 'COLUMNS'), help='matrix window size')
+    ARGS.add_argument('--window-from', nargs=2, default=None, metavar=('SRC', 'DST'), help="the matrix window's first source and destination SGT name or value")
     ARGS.add_argument('-s', '--sort', choices=['name', 'value',], default='name', help='SGT sort key')
+    ARGS.add_argument('--metrics', default=None, metavar='FILENAME', help='save per-phase and per-endpoint metrics as JSON and show a summary')
+    ARGS.add_argument('--profile', nargs='?', const='ise_trustsec_export_profile', default=None, metavar='PREFIX', help='profile the run to PREFIX.pstats and PREFIX.collapsed')
+    ARGS.add_argument('-r', '--retries', type=int, default=RETRY_ATTEMPTS, help='retries for transient ISE errors')
     ARGS.add_argument('-t', '--timer', action='store_true', default=False, help='show response timer')
     ARGS.add_argument('-v', '--verbose', action='store_true', default=False, help='Verbosity; multiple allowed')
     # ARGS.add_argument('--version', action='version', version=f'%(prog)s {VERSION}')
-    return ARGS.parse_args()
+    args = ARGS.parse_args()
+    try :
+        check_formats(args.formats)
+    except ValueError as e :
+        ARGS.error(str(e))
+    return args
 
 
 async def main ():
@@ -546,46 +852,57 @@ async def main ():
     global args     # promote to global scope for use in other functions
     args = await parse_cli_arguments()
     if args.verbose >= 3 : print(f'ⓘ Args: {args}')
-    if args.verbose : print(f'ⓘ TCP_CONNECTIONS: {TCP_CONNECTIONS}')
-    if args.verbose : print(f'ⓘ REST_PAGE_SIZE: {REST_PAGE_SIZE}')
     if args.timer :
         global start_time
         start_time = time.time()
 
-    # Load Environment Variables
-    global env
-    env = { k : v for (k, v) in os.environ.items() if k.startswith('ISE_') }
-
+    metrics = Metrics()
+    profiler = RunProfiler(args.profile, metrics=metrics) if args.profile else None
+    if profiler : profiler.start()
+    failed = 0
     try :
-        # Create HTTP session
-        ssl_verify = (False if env['ISE_VERIFY'][0:1].lower() in ['f','n'] else True)
-        tcp_conn = aiohttp.TCPConnector(limit=TCP_CONNECTIONS, limit_per_host=TCP_CONNECTIONS, ssl=ssl_verify)
-        auth = aiohttp.BasicAuth(login=env['ISE_REST_USERNAME'], password=env['ISE_REST_PASSWORD'])
-        base_url = f"https://{env['ISE_PPAN']}"
-        session = aiohttp.ClientSession(base_url, auth=auth, connector=tcp_conn, headers=JSON_HEADERS)
-
-        await ise_trustsec_export(session)
+        if args.deployments :
+            failed = await ise_trustsec_export_deployments(load_deployments(args.deployments), metrics)
+        else :
+            async with ISEERS.from_env(connections=args.connections, adaptive=args.adaptive, retries=args.retries, metrics=metrics, verbose=args.verbose) as ise :
+                if args.verbose : print(f'ⓘ TCP_CONNECTIONS: {ise.connections}')
+                if args.verbose : print(f'ⓘ REST_PAGE_SIZE: {ise.page_size}')
+                cache = SnapshotCache(ise.hostname, cache_dir=args.cache_dir, max_age=args.cache_max_age, max_hosts=args.cache_max_hosts,
+                                      evict_age=args.cache_evict_age, verbose=args.verbose)
+                if args.cache_clear : cache.clear()
+                await ise_trustsec_export(ise, cache=(cache if args.cache else None))
 
     except aiohttp.ContentTypeError as e :
         print(f"\n❌ Error: {e.message}\n\n💡Enable the ISE REST APIs\n")
+        failed += 1
     except aiohttp.ClientConnectorError as e :  # cannot connect to host
         print(f"\n❌ Host unreachable: {e}\n", file=sys.stderr)
+        failed += 1
     except aiohttp.ClientError as e :           # base aiohttp Exception
         print(f"\n❌ Exception: {e}\n", file=sys.stderr)
-    except:                                     # catch *all* exceptions
-        print(f"\n❌ Exception: {e}\n", file=sys.stderr)
-    finally:
-        await session.close()
-
+        failed += 1
+    except Exception as e :                     # catch *all* exceptions
+        print(f"\n❌ {type(e).__name__}: {e}\n", file=sys.stderr)
+        if args.verbose : traceback.print_exc()
+        failed += 1
+
+    if profiler :
+        profiler.stop()
+        print(profiler.summary(), file=sys.stderr)
     if args.timer :
         duration = time.time() - start_time
         print(f'\n 🕒 {duration} seconds\n', file=sys.stderr)
+    if args.metrics :
+        print(metrics.summary(), file=sys.stderr)
+        metrics.save(args.metrics)
+        print(f'ⓘ Metrics: {args.metrics}', file=sys.stderr)
+    return failed
 
 
 if __name__ == '__main__':
     """
     Entrypoint for local script.
     """
-    asyncio.run(main())
+    failed = asyncio.run(main())
 
-    sys.exit(0) # 0 is ok
+    sys.exit(1 if failed else 0) # 0 is ok
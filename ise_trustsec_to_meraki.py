@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+
+Sync the ISE TrustSec SGTs, SGACLs, and egress matrix to Meraki Adaptive Policy.
+
+The ISE SGTs, SGACLs, and egress matrix cells are mapped to Meraki Adaptive
+Policy groups, ACLs, and policies and compared with each organization so only
+the differences are created, updated, or deleted. Changes are submitted as
+Dashboard action batches instead of one request per object:
+
+  1. groups and ACLs are created and updated
+  2. policies are created, updated, and deleted with the new group and ACL ids
+  3. groups and ACLs no longer used by any policy are deleted
+
+The actions of each step are split into batches sized for the number of actions
+and up to 5 batches run at once per organization while their status is polled.
+Organizations are synced concurrently and each one's requests are paced by its
+own token bucket to stay within the Dashboard rate limit.
+
+ISE SGTs are matched to Meraki groups by SGT value, so a renamed SGT renames its
+group, and cells to policies by their source and destination SGT values. Reserved ISE SGTs and SGACLs and the Meraki
+default groups are never changed. A cell ending with the reserved 'Permit IP'
+or 'Deny IP' SGACL, or without SGACLs and a PERMIT_IP or DENY_IP default rule,
+becomes a policy with an `allow` or `deny` last entry rule. Disabled cells and
+the ANY-ANY default rule are not synced.
+
+Examples:
+    ise_trustsec_to_meraki.py --dry-run
+    ise_trustsec_to_meraki.py -v
+    ise_trustsec_to_meraki.py --orgs example_org other_org -t
+    ise_trustsec_to_meraki.py --batch-size 50 --batches 3
+
+Requires setting the these environment variables using the `export` command:
+  export ISE_PPAN='1.2.3.4'             # hostname or IP address of ISE PAN
+  export ISE_REST_USERNAME='admin'      # ISE ERS admin or operator username
+  export ISE_REST_PASSWORD='C1sco12345' # ISE ERS admin or operator password
+  export ISE_VERIFY=false               # validate the ISE certificate
+  export MERAKI_DASHBOARD_API_KEY='abcdef1234567890abcdef1234567890abcdef12'
+  export MERAKI_ORG_NAME=example_org    # optional default organization names, comma-separated
+
+You may add these export lines to a text file and load with `source`:
+  source ise.sh
+  source meraki.sh
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import aiohttp
+import asyncio
+import argparse
+import sys
+import time
+import traceback
+import meraki
+from ise_ers import ISEERS, RETRY_ATTEMPTS
+from excel_trustsec_matrix_to_ise import SGT_ANY, RESERVED_SGT_NAMES, RESERVED_SGACL_NAMES, RESULT_ICONS, diff_resources
+from meraki_dashboard import (ACTION_BATCH_CONCURRENCY, ACTION_BATCH_SIZE, MERAKI_CONCURRENCY, MERAKI_ORG_RATE, MERAKI_ORG_BURST,
+                              MERAKI_RETRIES, OrgRateLimiter, action, action_batches, dashboard_from_env, env_org_names,
+                              get_organizations)
+
+# ISE SGACL `ipVersion` to Meraki ACL `ipVersion`. ISE does not return the default IP_AGNOSTIC.
+SGACL_IP_VERSIONS = {'IPV4':'ipv4', 'IPV6':'ipv6', 'IP_AGNOSTIC':'any'}
+
+# ISE egress cell `defaultRule` to Meraki policy `lastEntryRule`
+CELL_LAST_ENTRY_RULES = {'NONE':'default', 'PERMIT_IP':'allow', 'DENY_IP':'deny'}
+
+# Reserved ISE SGACLs that become the last entry rule of a policy
+RESERVED_SGACL_RULES = {'Permit IP':'allow', 'Permit_IP_Log':'allow', 'Deny IP':'deny', 'Deny_IP_Log':'deny'}
+
+SGACL_PROTOCOLS = {'ip':'any', 'tcp':'tcp', 'udp':'udp', 'icmp':'icmp'}
+PORT_MAX = 65535
+
+# The Meraki ACL rule attributes to compare
+ACL_RULE_FIELDS = ['policy', 'protocol', 'srcPort', 'dstPort']
+
+
+def ace_ports (operator:str, values:list) -> str :
+    """
+    Returns the Meraki port of an ISE port match: '443', '1-1024', or '80,443'.
+    Raises ValueError for an unsupported operator or port.
+    @operator : 'eq', 'range', 'gt', or 'lt'
+    @values : the port numbers of the match
+    """
+    ports = [ int(value) for value in values ]
+    if operator == 'eq' and ports :
+        return ','.join(str(port) for port in ports)
+    if operator == 'range' and len(ports) == 2 :
+        return f"{ports[0]}-{ports[1]}"
+    if operator == 'gt' and len(ports) == 1 :
+        return f"{ports[0] + 1}-{PORT_MAX}"
+    if operator == 'lt' and len(ports) == 1 :
+        return f"1-{ports[0] - 1}"
+    raise ValueError(f"unsupported port match: {operator} {' '.join(values)}")
+
+
+def aclcontent_to_rules (aclcontent:str) -> tuple :
+    """
+    Returns the (rules, unsupported lines) of the Meraki ACL rules for the ISE SGACL `aclcontent`.
+    Lines like 'permit tcp src eq 80 dst range 1 1024 log' are supported; `log` is ignored.
+    @aclcontent : the ISE SGACL lines
+    """
+    (rules, unsupported) = ([], [])
+    for line in str(aclcontent).splitlines() :
+        words = [ word for word in line.lower().split() if word != 'log' ]
+        if not words or words[0].startswith(('!', 'remark')) :
+            continue
+        try :
+            if len(words) < 2 or words[0] not in ['permit', 'deny'] or words[1] not in SGACL_PROTOCOLS :
+                raise ValueError('unsupported action or protocol')
+            rule = {'policy':'allow' if words[0] == 'permit' else 'deny', 'protocol':SGACL_PROTOCOLS[words[1]], 'srcPort':'any', 'dstPort':'any'}
+            words = words[2:]
+            while words :
+                (keyword, operator) = (words[0], words[1] if len(words) > 1 else None)
+                if keyword not in ['src', 'dst'] or rule['protocol'] not in ['tcp', 'udp'] :
+                    raise ValueError(f"unsupported match: {keyword}")
+                values = []
+                for word in words[2:] :
+                    if not word.isdigit() : break
+                    values.append(word)
+                rule['srcPort' if keyword == 'src' else 'dstPort'] = ace_ports(operator, values)
+                words = words[2 + len(values):]
+            rules.append(rule)
+        except ValueError :
+            unsupported.append(line.strip())
+    return (rules, unsupported)
+
+
+def ise_trustsec_to_adaptive_policy (sgts:list, sgacls:list, cells:list) -> tuple :
+    """
+    Returns the Meraki Adaptive Policy (groups, acls, policies, warnings) for the ISE TrustSec details.
+    Groups and ACLs are keyed by name and policies by (source SGT, destination SGT) values
+    with their ACL names and last entry rule.
+    @sgts : the list of ISE SGT details
+    @sgacls : the list of ISE SGACL details
+    @cells : the list of ISE egress matrix cell details
+    """
+    warnings = []
+    groups = {
+        sgt['name'] : {'name':sgt['name'], 'sgt':int(sgt['value']), 'description':sgt.get('description') or ''}
+        for sgt in sgts if sgt['name'] not in RESERVED_SGT_NAMES
+    }
+    acls = {}
+    for sgacl in sgacls :
+        if sgacl['name'] in RESERVED_SGACL_NAMES : continue
+        (rules, unsupported) = aclcontent_to_rules(sgacl.get('aclcontent', ''))
+        if unsupported :
+            warnings.append(f"SGACL {sgacl['name']} lines not supported by Meraki: {unsupported}")
+        acls[sgacl['name']] = {'name':sgacl['name'], 'description':sgacl.get('description') or '', 'ipVersion':SGACL_IP_VERSIONS.get(sgacl.get('ipVersion', 'IP_AGNOSTIC'), 'any'), 'rules':rules}
+
+    sgt_values = { sgt['id'] : int(sgt['value']) for sgt in sgts }
+    sgacl_names = { sgacl['id'] : sgacl['name'] for sgacl in sgacls }
+    policies = {}
+    for cell in cells :
+        (src, dst) = (cell['sourceSgtId'], cell['destinationSgtId'])
+        if SGT_ANY['id'] in [src, dst] :    # the ANY-ANY default rule
+            continue
+        if src not in sgt_values or dst not in sgt_values :
+            warnings.append(f"Cell {cell.get('name')} has an unknown SGT")
+            continue
+        if cell.get('matrixCellStatus') == 'DISABLED' :
+            warnings.append(f"Cell {cell.get('name')} is disabled and not synced")
+            continue
+        names = [ sgacl_names.get(id, id) for id in cell.get('sgacls', []) ]
+        last_entry_rule = CELL_LAST_ENTRY_RULES.get(cell.get('defaultRule', 'NONE'), 'default')
+        if names and names[-1] in RESERVED_SGACL_RULES :
+            last_entry_rule = RESERVED_SGACL_RULES[names.pop()]
+        reserved = [ name for name in names if name in RESERVED_SGACL_NAMES ]
+        if reserved :
+            warnings.append(f"Cell {cell.get('name')} reserved SGACLs are only supported last: {reserved}")
+            names = [ name for name in names if name not in RESERVED_SGACL_NAMES ]
+        unknown = [ name for name in names if name not in acls ]
+        if unknown :
+            warnings.append(f"Cell {cell.get('name')} has unknown SGACLs: {unknown}")
+            continue
+        policies[(sgt_values[src], sgt_values[dst])] = {'acls':names, 'lastEntryRule':last_entry_rule}
+    return (groups, acls, policies, warnings)
+
+
+async def get_adaptive_policy_state (dashboard, limiter:OrgRateLimiter, org_id:str, kinds:list=['groups', 'acls', 'policies']) -> dict :
+    """
+    Returns the organization's current {'groups':[...], 'acls':[...], 'policies':[...]} fetched concurrently.
+    @dashboard : the AsyncDashboardAPI
+    @limiter : the OrgRateLimiter shared by every organization
+    @org_id : the organization id
+    @kinds : the Adaptive Policy object kinds to fetch
+    """
+    methods = {
+        'groups'   : dashboard.organizations.getOrganizationAdaptivePolicyGroups,
+        'acls'     : dashboard.organizations.getOrganizationAdaptivePolicyAcls,
+        'policies' : dashboard.organizations.getOrganizationAdaptivePolicyPolicies,
+    }
+    return dict(zip(kinds, await asyncio.gather(*[ limiter.call(org_id, methods[kind], org_id) for kind in kinds ])))
+
+
+def normalize_acl (acl:dict) -> dict :
+    """
+    Returns the comparable attributes of a Meraki ACL.
+    """
+    return {
+        'name'        : acl['name'],
+        'description' : acl.get('description') or '',
+        'ipVersion'   : acl.get('ipVersion', 'any'),
+        'rules'       : [ { k : str(rule.get(k, 'any')).lower() for k in ACL_RULE_FIELDS } for rule in acl.get('rules', []) ],
+        'id'          : acl.get('aclId'),
+    }
+
+
+def diff_groups (current:dict, desired:dict) -> tuple :
+    """
+    Returns the (creates, updates, deletes) to change the current Meraki groups into the desired groups.
+    Groups are matched by SGT value so a renamed ISE SGT updates its group instead of creating a second
+    group with the same SGT. A group whose SGT value changed under the same name is updated in place
+    instead of being created while the group to delete still has its name.
+    @current : a dict of {sgt : group} from Meraki, each with an `id`
+    @desired : a dict of {sgt : group} to configure
+    """
+    (creates, updates, deletes) = diff_resources(current, desired, ['name', 'description'])
+    deleted = { g['name'] : g for sgt, g in current.items() if sgt not in desired }
+    moved = [ g for g in creates if g['name'] in deleted ]
+    moved_ids = { deleted[g['name']]['id'] for g in moved }
+    return ([ g for g in creates if g['name'] not in deleted ],
+            updates + [ { **deleted[g['name']], **g } for g in moved ],
+            [ id for id in deletes if id not in moved_ids ])
+
+
+def show_batches (org_name:str, step:str, batches:list) -> int :
+    """
+    Show the action batch results of a sync step and return the number of failed actions.
+    @org_name : the organization name
+    @step : the sync step name
+    @batches : the (actions, batch or exception) tuples from `action_batches()`
+    """
+    failed = 0
+    counts = {}
+    for (chunk, batch) in batches :
+        if isinstance(batch, Exception) or batch['status']['failed'] :
+            failed += len(chunk)
+            print(f"❌ {org_name} {step}: {batch if isinstance(batch, Exception) else '; '.join(batch['status']['errors'])}", file=sys.stderr)
+            continue
+        for a in chunk :
+            counts[a['operation']] = counts.get(a['operation'], 0) + 1
+    for operation, count in counts.items() :
+        print(f"{RESULT_ICONS['delete' if operation == 'destroy' else operation]} {org_name} {step}: {count} {operation}")
+    return failed
+
+
+async def sync_ise_to_meraki (dashboard, limiter:OrgRateLimiter, org:dict, desired:tuple) -> int :
+    """
+    Create, update, or delete the Adaptive Policy groups, ACLs, and policies of the organization
+    that differ from the ISE TrustSec state with action batches and return the number of failed actions.
+    @dashboard : the AsyncDashboardAPI
+    @limiter : the OrgRateLimiter shared by every organization
+    @org : the organization details
+    @desired : the (groups, acls, policies) from `ise_trustsec_to_adaptive_policy()`
+    """
+    (org_id, org_name) = (org['id'], org['name'])
+    (want_groups, want_acls, want_policies) = desired
+    base = f"/organizations/{org_id}/adaptivePolicy"
+    run = lambda actions: action_batches(dashboard, limiter, org_id, actions, batch_size=args.batch_size, limit=args.batches, verbose=args.verbose)
+
+    current = await get_adaptive_policy_state(dashboard, limiter, org_id)
+    groups = { int(g['sgt']) : { **g, 'id':g['groupId'] } for g in current['groups'] }
+    default_groups = { sgt for sgt, g in groups.items() if g.get('isDefaultGroup') }
+    acls = { a['name'] : normalize_acl(a) for a in current['acls'] }
+
+    # Diff groups by SGT value and ACLs by name, never changing the default groups
+    (group_creates, group_updates, group_deletes) = diff_groups(
+        { k:v for k,v in groups.items() if k not in default_groups },
+        { g['sgt']:g for g in want_groups.values() if g['sgt'] not in default_groups })
+    (acl_creates, acl_updates, acl_deletes) = diff_resources(acls, want_acls, ['description', 'ipVersion', 'rules'])
+    print(f"ⓘ {org_name} Groups: {len(group_creates)} create, {len(group_updates)} update, {len(group_deletes)} delete")
+    print(f"ⓘ {org_name} ACLs: {len(acl_creates)} create, {len(acl_updates)} update, {len(acl_deletes)} delete")
+
+    fields = lambda r, keys: { k : r[k] for k in keys if k in r }
+    group_fields = ['name', 'sgt', 'description']
+    acl_fields = ['name', 'description', 'ipVersion', 'rules']
+    actions = [ action(f"{base}/groups", 'create', fields(g, group_fields)) for g in group_creates ] \
+            + [ action(f"{base}/groups/{g['groupId']}", 'update', fields(g, group_fields)) for g in group_updates ] \
+            + [ action(f"{base}/acls", 'create', fields(a, acl_fields)) for a in acl_creates ] \
+            + [ action(f"{base}/acls/{a['id']}", 'update', fields(a, acl_fields)) for a in acl_updates ]
+
+    failed = 0
+    if actions and not args.dry_run :
+        failed += show_batches(org_name, 'groups and ACLs', await run(actions))
+        # the new group and ACL ids are needed by the policies, whose keys change with a group's SGT value
+        current = await get_adaptive_policy_state(dashboard, limiter, org_id)
+
+    # Diff the policies by (source SGT, destination SGT) values
+    group_ids = { int(g['sgt']) : g['groupId'] for g in current['groups'] }
+    acl_ids = { a['name'] : a['aclId'] for a in current['acls'] }
+    policies = {
+        (int(p['sourceGroup']['sgt']), int(p['destinationGroup']['sgt'])) : p for p in current['policies']
+    }
+    creates, updates = [], []
+    for (key, policy) in want_policies.items() :
+        missing = [ f"SGT {sgt}" for sgt in key if sgt not in group_ids ] + [ name for name in policy['acls'] if name not in acl_ids ]
+        if missing and not args.dry_run :
+            print(f"❌ {org_name} policy {key[0]}-{key[1]}: unknown {missing}", file=sys.stderr)
+            failed += 1
+            continue
+        body = {
+            'sourceGroup'      : {'id':group_ids.get(key[0])},
+            'destinationGroup' : {'id':group_ids.get(key[1])},
+            'acls'             : [ {'id':acl_ids.get(name)} for name in policy['acls'] ],
+            'lastEntryRule'    : policy['lastEntryRule'],
+        }
+        if key not in policies :
+            creates.append(body)
+        elif ([ a['name'] for a in policies[key].get('acls', []) ], policies[key].get('lastEntryRule', 'default')) != (policy['acls'], policy['lastEntryRule']) :
+            updates.append((policies[key]['adaptivePolicyId'], body))
+    deletes = [ p['adaptivePolicyId'] for key, p in policies.items() if key not in want_policies ]
+    print(f"ⓘ {org_name} Policies: {len(creates)} create, {len(updates)} update, {len(deletes)} delete")
+    if args.dry_run :
+        return failed
+
+    actions = [ action(f"{base}/policies", 'create', body) for body in creates ] \
+            + [ action(f"{base}/policies/{id}", 'update', body) for (id, body) in updates ] \
+            + [ action(f"{base}/policies/{id}", 'destroy') for id in deletes ]
+    if actions :
+        failed += show_batches(org_name, 'policies', await run(actions))
+
+    # Delete groups and ACLs only after the policies that referenced them
+    actions = [ action(f"{base}/groups/{id}", 'destroy') for id in group_deletes ] \
+            + [ action(f"{base}/acls/{id}", 'destroy') for id in acl_deletes ]
+    if actions :
+        failed += show_batches(org_name, 'groups and ACLs', await run(actions))
+    return failed
+
+
+async def ise_trustsec_to_meraki (ise, dashboard, limiter:OrgRateLimiter, orgs:list) -> int :
+    """
+    Fetch the ISE TrustSec state and sync it to the organizations concurrently.
+    Returns the number of failed actions and organizations.
+    @ise : the ISEERS client
+    @dashboard : the AsyncDashboardAPI
+    @limiter : the OrgRateLimiter shared by every organization
+    @orgs : the organization details
+    """
+    with ise.metrics.phase('fetch') :
+        (sgts, sgacls, cells) = await asyncio.gather(
+            ise.get_resource_details('sgt'),
+            ise.get_resource_details('sgacl'),
+            ise.get_resource_details('egressmatrixcell'),
+        )
+    (groups, acls, policies, warnings) = ise_trustsec_to_adaptive_policy(sgts, sgacls, cells)
+    for warning in warnings :
+        print(f"⚠ {warning}", file=sys.stderr)
+    print(f"ⓘ ISE: {len(groups)} groups, {len(acls)} ACLs, {len(policies)} policies")
+
+    with ise.metrics.phase('apply') :
+        results = await asyncio.gather(*[ sync_ise_to_meraki(dashboard, limiter, org, (groups, acls, policies)) for org in orgs ], return_exceptions=True)
+    failed = 0
+    for (org, result) in zip(orgs, results) :
+        if isinstance(result, Exception) :
+            print(f"\n❌ {org['name']}: {type(result).__name__}: {result}\n", file=sys.stderr)
+            if args.verbose : traceback.print_exception(result)
+            result = 1
+        failed += result
+    return failed
+
+
+async def parse_cli_arguments () :
+    """
+    Parse the command line arguments
+    """
+    ARGS = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ARGS.add_argument('-o', '--orgs', nargs='+', default=env_org_names(), help='organization names. Default: MERAKI_ORG_NAME or all')
+    ARGS.add_argument('-n', '--dry-run', action='store_true', default=False, help='only show the changes')
+    ARGS.add_argument('-b', '--batch-size', type=int, default=None, help=f'maximum actions per action batch up to {ACTION_BATCH_SIZE}. Default: sized for the changes')
+    ARGS.add_argument('--batches', type=int, default=ACTION_BATCH_CONCURRENCY, help='maximum running action batches per organization')
+    ARGS.add_argument('-c', '--concurrency', type=int, default=MERAKI_CONCURRENCY, help='maximum concurrent Dashboard requests')
+    ARGS.add_argument('--rate', type=float, default=MERAKI_ORG_RATE, help='Dashboard requests per second per organization')
+    ARGS.add_argument('--burst', type=int, default=MERAKI_ORG_BURST, help='requests an idle organization may send at once')
+    ARGS.add_argument('-r', '--retries', type=int, default=RETRY_ATTEMPTS, help='retries for transient ISE errors')
+    ARGS.add_argument('-t', '--timer', action='store_true', default=False, help='show response timer')
+    ARGS.add_argument('-v', '--verbose', action='count', default=0, help='Verbosity; multiple allowed')
+    return ARGS.parse_args()
+
+
+async def main ():
+    """
+    Entrypoint for packaged script.
+    """
+
+    global args     # promote to global scope for use in other functions
+    args = await parse_cli_arguments()
+    if args.verbose >= 3 : print(f'ⓘ Args: {args}')
+    if args.timer :
+        global start_time
+        start_time = time.time()
+
+    failed = 0
+    try :
+        async with ISEERS.from_env(retries=args.retries, verbose=args.verbose) as ise, \
+                   dashboard_from_env(maximum_concurrent_requests=args.concurrency, maximum_retries=MERAKI_RETRIES) as dashboard :
+            orgs = await get_organizations(dashboard, args.orgs)
+            if args.verbose : print(f"ⓘ Organizations: {[ org['name'] for org in orgs ]}")
+            limiter = OrgRateLimiter(args.rate, args.burst)
+            failed = await ise_trustsec_to_meraki(ise, dashboard, limiter, orgs)
+            if args.verbose : print(f"ⓘ Dashboard calls: {limiter.calls}, rate limit waits: { {org['name'] : round(limiter.bucket(org['id']).waited, 3) for org in orgs} } seconds")
+
+    except aiohttp.ContentTypeError as e :
+        print(f"\n❌ Error: {e.message}\n\n💡Enable the ISE REST APIs\n")
+        failed += 1
+    except aiohttp.ClientConnectorError as e :  # cannot connect to host
+        print(f"\n❌ Host unreachable: {e}\n", file=sys.stderr)
+        failed += 1
+    except meraki.exceptions.AsyncAPIError as e :
+        print(f"\n❌ Meraki API Error: {e}\n", file=sys.stderr)
+        failed += 1
+    except Exception as e :                     # catch *all* exceptions
+        print(f"\n❌ {type(e).__name__}: {e}\n", file=sys.stderr)
+        if args.verbose : traceback.print_exc()
+        failed += 1
+
+    if args.timer :
+        duration = time.time() - start_time
+        print(f'\n 🕒 {duration} seconds\n', file=sys.stderr)
+    return failed
+
+
+if __name__ == '__main__':
+    """
+    Entrypoint for local script.
+    """
+    failed = asyncio.run(main())
+
+    sys.exit(1 if failed else 0) # 0 is ok
@@ -1,17 +1,26 @@
 #!/usr/bin/env python3
 """
 
-Show ISE TrustSec data.
+Show the Meraki organizations with their API status, networks, and devices
+and which devices support Adaptive Policy.
+
+Every organization is swept concurrently with the asyncio Dashboard client:
+its networks and devices are fetched together, each with paged requests
+instead of one request per network. Every request and every page takes a token
+from its organization's token bucket so large estates stay within the Dashboard
+rate limit.
+Organizations without API access are shown and skipped.
 
 Examples:
-    meraki_api_enabled.py 
+    meraki_api_enabled.py
     meraki_api_enabled.py --timer
     meraki_api_enabled.py --format pretty
+    meraki_api_enabled.py --orgs example_org other_org
+    meraki_api_enabled.py --per-network --rate 5
 
 Requires setting the these environment variables using the `export` command:
     export MERAKI_DASHBOARD_API_KEY='abcdef1234567890abcdef1234567890abcdef12'
-    export MERAKI_ORG_NAME=example_org
-    export MERAKI_NET_NAME=example_net
+    export MERAKI_ORG_NAME=example_org    # optional default organization names, comma-separated. Default: all
 
 You may add these export lines to a text file and load with `source`:
   source meraki.sh
@@ -22,56 +31,143 @@ __email__ = "thomas@cisco.com"
 __license__ = "MIT - https://mit-license.org/"
 
 import argparse
+import asyncio
 import meraki
-import os
 import pandas as pd
 import sys
-from tabulate import tabulate
 import time
+import traceback
+from meraki_dashboard import (MERAKI_CONCURRENCY, MERAKI_ORG_RATE, MERAKI_ORG_BURST, OrgRateLimiter,
+                              dashboard_from_env, env_org_names, get_organizations)
+
+# Model prefixes of the devices supporting Adaptive Policy with current firmware
+# See https://documentation.meraki.com/General_Administration/Cross-Platform_Content/Adaptive_Policy/Adaptive_Policy_Overview
+ADAPTIVE_POLICY_MODELS = [
+    'MS390', 'C9300', 'C9200',                                  # switches
+    'MR28', 'MR36', 'MR44', 'MR46', 'MR56', 'MR57', 'MR76', 'MR78', 'MR86', 'CW91',   # Wi-Fi 6 and 6E access points
+    'MX67', 'MX68', 'MX75', 'MX85', 'MX95', 'MX105', 'MX250', 'MX450', 'Z4',          # security appliances and teleworker gateways
+]
 
+ORG_DROP_COLUMNS = ['id','url','licensing','cloud']
+NETWORK_DROP_COLUMNS = ['id','organizationId','enrollmentString','notes','productTypes','timeZone','url']
+DEVICE_DROP_COLUMNS = ['serial','networkId','organizationId','mac','lanIp','tags','lat','lng','address','url','floorPlanId','switchProfileId','details']
 
-MERAKI_DASHBOARD_BASE_URI = 'https://api.meraki.com/api/v1'
 
-def meraki_api_enabled (org_id:str=None,format:str='simple') :
+def adaptive_policy_capable (model:str) -> bool :
     """
-    Get and show the ISE TrustSec SGTs, SGACLs, and Matrix.
+    Returns True when the device model supports Adaptive Policy.
     """
+    return str(model).upper().startswith(tuple(ADAPTIVE_POLICY_MODELS))
 
-    # 💡 MERAKI_DASHBOARD_API_KEY environment variable is used automatically!
-    dashboard = meraki.DashboardAPI(output_log=False, print_console=False)
-    org_id = dashboard.organizations.getOrganizations()[0]['id']
 
-    orgs = dashboard.organizations.getOrganizations()
+async def org_inventory (dashboard, limiter:OrgRateLimiter, org:dict, per_network:bool=False) -> tuple :
+    """
+    Returns the (networks, devices) of the organization fetched concurrently.
+    @dashboard : the AsyncDashboardAPI
+    @limiter : the OrgRateLimiter shared by every organization
+    @org : the organization details
+    @per_network : list the devices of each network instead of the organization
+    """
+    org_id = org['id']
+    get_networks = limiter.pages(org_id, dashboard.organizations.getOrganizationNetworks, org_id)
+    if not per_network :
+        return await asyncio.gather(
+            get_networks,
+            limiter.pages(org_id, dashboard.organizations.getOrganizationDevices, org_id, key='serial'),
+        )
+    networks = await get_networks
+    devices = await asyncio.gather(*[ limiter.call(org_id, dashboard.networks.getNetworkDevices, network['id']) for network in networks ])
+    return (networks, [ device for network_devices in devices for device in network_devices ])
+
+
+async def meraki_api_enabled (dashboard, limiter:OrgRateLimiter, orgs:list, format:str='simple', per_network:bool=False) -> int :
+    """
+    Sweep the networks and devices of every organization concurrently and show them.
+    Returns the number of organizations that failed.
+    @dashboard : the AsyncDashboardAPI
+    @limiter : the OrgRateLimiter shared by every organization
+    @orgs : the organization details
+    @format : the table format
+    @per_network : list the devices of each network instead of the organization
+    """
+    enabled = [ org for org in orgs if org.get('api', {}).get('enabled', True) ]
+    results = await asyncio.gather(*[ org_inventory(dashboard, limiter, org, per_network) for org in enabled ], return_exceptions=True)
+
+    failed = 0
+    (networks, devices) = ([], [])
+    org_names = { org['id'] : org['name'] for org in orgs }
+    for (org, result) in zip(enabled, results) :
+        if isinstance(result, Exception) :
+            failed += 1
+            print(f"❌ {org['name']}: {type(result).__name__}: {result}", file=sys.stderr)
+            if args.verbose : traceback.print_exception(result)
+            continue
+        networks.extend({ 'organization':org['name'], **network } for network in result[0])
+        devices.extend({ 'organization':org['name'], **device } for device in result[1])
+
     df_orgs = pd.DataFrame(orgs)
-    print(f"\nⓘ Organizations ({len(df_orgs)})\n")
-    print(f"{df_orgs.drop(['id','url','licensing','cloud'], axis='columns').to_markdown(index=False, tablefmt=format)}")
+    print(f"\nⓘ Organizations ({len(df_orgs)}, {len(enabled)} API enabled)\n")
+    print(f"{df_orgs.drop(ORG_DROP_COLUMNS, axis='columns', errors='ignore').to_markdown(index=False, tablefmt=format)}")
 
-    networks = dashboard.organizations.getOrganizationNetworks(org_id, total_pages='all')
     df_networks = pd.DataFrame(networks)
     print(f"\nⓘ Networks ({len(df_networks)})\n")
-    print(f"{df_networks.drop(['id','organizationId','enrollmentString','notes','productTypes','timeZone','url'], axis='columns').to_markdown(index=False, tablefmt=format)}")
+    if len(df_networks) :
+        print(f"{df_networks.drop(NETWORK_DROP_COLUMNS, axis='columns', errors='ignore').to_markdown(index=False, tablefmt=format)}")
 
-    devices = dashboard.networks.getNetworkDevices(networks[0]['id'])
     df_devices = pd.DataFrame(devices)
-    print(f"\nⓘ Devices ({len(df_devices)})\n")
-    print(df_devices.drop(['serial','networkId','mac','lanIp','tags','lat','lng','address','url','floorPlanId','switchProfileId'], axis='columns').to_markdown(index=False, tablefmt=format))
-
-
-if __name__ == '__main__':
+    if len(df_devices) :
+        network_names = { network['id'] : network['name'] for network in networks }
+        df_devices.insert(1, 'network', df_devices['networkId'].map(network_names).fillna(''))
+        df_devices['adaptivePolicy'] = df_devices['model'].map(adaptive_policy_capable)
+        df_devices = df_devices.sort_values(['organization', 'network', 'name'], ignore_index=True)
+    capable = int(df_devices['adaptivePolicy'].sum()) if len(df_devices) else 0
+    print(f"\nⓘ Devices ({len(df_devices)}, {capable} Adaptive Policy capable)\n")
+    if len(df_devices) :
+        print(df_devices.drop(DEVICE_DROP_COLUMNS, axis='columns', errors='ignore').to_markdown(index=False, tablefmt=format))
+    if args.verbose : print(f"\nⓘ Dashboard calls: {limiter.calls}, rate limit waits: { {org_names[id] : round(bucket.waited, 3) for id, bucket in limiter.buckets.items()} } seconds")
+    return failed
+
+
+async def main () :
     """
-    Entrypoint for local script.
+    Entrypoint for packaged script.
     """
+    global args     # promote to global scope for use in other functions
     argp = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter) # keep my format
     argp.add_argument('-f', '--format', choices=['plain','simple','grid','simple_grid','pretty','presto'], default='simple_grid', help='table format' )
+    argp.add_argument('-o', '--orgs', nargs='+', default=env_org_names(), help='organization names. Default: MERAKI_ORG_NAME or all')
+    argp.add_argument('-n', '--per-network', action='store_true', default=False, help='list the devices of each network instead of each organization')
+    argp.add_argument('-c', '--concurrency', type=int, default=MERAKI_CONCURRENCY, help='maximum concurrent Dashboard requests')
+    argp.add_argument('--rate', type=float, default=MERAKI_ORG_RATE, help='Dashboard requests per second per organization')
+    argp.add_argument('--burst', type=int, default=MERAKI_ORG_BURST, help='requests an idle organization may send at once')
     argp.add_argument('-t', '--timer', action='store_true', default=False, help='show response timer' )
-    argp.add_argument('-v', '--verbose', action='store_true', default=False, help='Verbosity; multiple allowed')
+    argp.add_argument('-v', '--verbose', action='count', default=0, help='Verbosity; multiple allowed')
     args = argp.parse_args()
 
     if args.timer: start_time = time.time()
 
-    env = {k:v for (k,v) in os.environ.items() if k.startswith('MERAKI_')} # Load environment variables
-    if env.get('MERAKI_DASHBOARD_API_KEY', None) == None:
-        sys.exit("Missing MERAKI_DASHBOARD_API_KEY environment variable!")
-    meraki_api_enabled(format=args.format)
+    failed = 0
+    try :
+        async with dashboard_from_env(maximum_concurrent_requests=args.concurrency) as dashboard :
+            orgs = await get_organizations(dashboard, args.orgs)
+            limiter = OrgRateLimiter(args.rate, args.burst)
+            failed = await meraki_api_enabled(dashboard, limiter, orgs, format=args.format, per_network=args.per_network)
+    except meraki.exceptions.AsyncAPIError as e :
+        print(f"\n❌ Meraki API Error: {e}\n", file=sys.stderr)
+        failed += 1
+    except Exception as e :                     # catch *all* exceptions
+        print(f"\n❌ {type(e).__name__}: {e}\n", file=sys.stderr)
+        if args.verbose : traceback.print_exc()
+        failed += 1
 
     if args.timer : print(f"\n 🕒 {time.time() - start_time} seconds\n", file=sys.stderr)
+    return failed
+
+
+if __name__ == '__main__':
+    """
+    Entrypoint for local script.
+    """
+    failed = asyncio.run(main())
+
+    sys.exit(1 if failed else 0) # 0 is ok
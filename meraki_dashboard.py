@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+
+Asynchronous Meraki Dashboard API helpers shared by the Meraki scripts.
+
+The Dashboard allows 10 requests per second per organization and returns `429`
+with a `Retry-After` header above it. Every call through an OrgRateLimiter takes
+a token from its organization's token bucket first, so concurrent calls across
+many organizations and networks stay within each organization's rate limit
+while the SDK still retries any `429` it gets.
+
+Examples:
+    async with dashboard_from_env() as dashboard :
+        limiter = OrgRateLimiter()
+        orgs = await get_organizations(dashboard, ['example_org'])
+        groups = await limiter.call(orgs[0]['id'], dashboard.organizations.getOrganizationAdaptivePolicyGroups, orgs[0]['id'])
+        networks = await limiter.pages(orgs[0]['id'], dashboard.organizations.getOrganizationNetworks, orgs[0]['id'])
+        actions = [ action(f"/organizations/{orgs[0]['id']}/adaptivePolicy/groups", 'create', {'name':'Employees', 'sgt':4}) ]
+        batches = await action_batches(dashboard, limiter, orgs[0]['id'], actions)
+
+Requires setting the these environment variables using the `export` command:
+  export MERAKI_DASHBOARD_API_KEY='abcdef1234567890abcdef1234567890abcdef12'
+  export MERAKI_ORG_NAME=example_org    # optional default organization names, comma-separated
+  export MERAKI_BASE_URL=http://127.0.0.1:9080/api/v1   # optional, e.g. a local mock Dashboard
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import asyncio
+import inspect
+import math
+import os
+import time
+import meraki.aio
+
+MERAKI_DASHBOARD_BASE_URI = 'https://api.meraki.com/api/v1'
+MERAKI_ORG_RATE = 10            # Dashboard requests per second per organization
+MERAKI_ORG_BURST = 10           # requests an idle organization may send at once
+MERAKI_CONCURRENCY = 20         # maximum concurrent Dashboard requests
+MERAKI_RETRIES = 5              # SDK retries for 429 and 5xx responses
+MERAKI_PER_PAGE = 1000          # items per page of a paged Dashboard call
+
+# Action batch options
+# A batch runs its actions in order and is rolled back if any action fails. Asynchronous
+# batches are polled with `GET /organizations/{organizationId}/actionBatches/{id}` until done.
+ACTION_BATCH_OPERATIONS = ['create', 'update', 'destroy']
+ACTION_BATCH_SIZE = 100         # maximum actions in an asynchronous batch
+ACTION_BATCH_SYNC_SIZE = 20     # maximum actions in a synchronous batch
+ACTION_BATCH_CONCURRENCY = 5    # maximum running batches per organization
+ACTION_BATCH_POLL_INTERVAL = 0.5    # seconds before the first status poll
+ACTION_BATCH_POLL_INTERVAL_MAX = 10 # seconds between status polls with backoff
+ACTION_BATCH_TIMEOUT = 3600     # seconds to wait for a batch to complete
+
+
+def dashboard_from_env (env:dict=None, **kwargs) -> meraki.aio.AsyncDashboardAPI :
+    """
+    Returns an AsyncDashboardAPI from the `MERAKI_DASHBOARD_API_KEY` (or `MERAKI_KEY`) and optional
+    `MERAKI_BASE_URL` environment variables without SDK log files or console output.
+    @env : a dict of environment variables. Default: os.environ
+    @kwargs : AsyncDashboardAPI options
+    """
+    env = os.environ if env is None else env
+    api_key = env.get('MERAKI_DASHBOARD_API_KEY') or env.get('MERAKI_KEY')
+    if not api_key :
+        raise ValueError("Missing MERAKI_DASHBOARD_API_KEY environment variable!")
+    kwargs.setdefault('base_url', env.get('MERAKI_BASE_URL') or MERAKI_DASHBOARD_BASE_URI)
+    kwargs.setdefault('maximum_concurrent_requests', MERAKI_CONCURRENCY)
+    kwargs.setdefault('maximum_retries', MERAKI_RETRIES)
+    kwargs.setdefault('wait_on_rate_limit', True)
+    kwargs.setdefault('output_log', False)
+    kwargs.setdefault('print_console', False)
+    kwargs.setdefault('suppress_logging', True)
+    if 'smart_flow_enabled' in inspect.signature(meraki.aio.AsyncDashboardAPI).parameters :
+        kwargs.setdefault('smart_flow_enabled', False)  # the OrgRateLimiter paces each organization
+    return meraki.aio.AsyncDashboardAPI(api_key, **kwargs)
+
+
+class TokenBucket :
+    """
+    An asyncio token bucket allowing `rate` acquisitions per second with bursts of up to `burst`.
+    """
+
+    def __init__ (self, rate:float=MERAKI_ORG_RATE, burst:int=MERAKI_ORG_BURST) :
+        """
+        @rate : the tokens added per second
+        @burst : the maximum tokens
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.waited = 0.0           # total seconds callers waited for a token
+
+
+    async def acquire (self) :
+        """
+        Wait for and take a token. Waiters are served in arrival order.
+        """
+        async with self.lock :
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1 :
+                delay = (1 - self.tokens) / self.rate
+                self.waited += delay
+                await asyncio.sleep(delay)
+                self.tokens = 1.0
+                self.updated = time.monotonic()
+            self.tokens -= 1
+
+
+class OrgRateLimiter :
+    """
+    A token bucket per organization shared by every Dashboard call for that organization.
+    """
+
+    def __init__ (self, rate:float=MERAKI_ORG_RATE, burst:int=MERAKI_ORG_BURST) :
+        """
+        @rate : the requests per second per organization
+        @burst : the requests an idle organization may send at once
+        """
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}           # {organization id : TokenBucket}
+        self.calls = 0
+
+
+    def bucket (self, org_id:str) -> TokenBucket :
+        """
+        Returns the token bucket of the organization.
+        """
+        if org_id not in self.buckets :
+            self.buckets[org_id] = TokenBucket(self.rate, self.burst)
+        return self.buckets[org_id]
+
+
+    async def call (self, org_id:str, func, *args, **kwargs) :
+        """
+        Returns the result of a Dashboard call after taking a token from the organization's bucket.
+        A `total_pages='all'` call still takes a single token; use `pages()` to pace every page.
+        @org_id : the organization id the call counts against
+        @func : the AsyncDashboardAPI method
+        """
+        await self.bucket(org_id).acquire()
+        self.calls += 1
+        return await func(*args, **kwargs)
+
+
+    async def pages (self, org_id:str, func, *args, key:str='id', per_page:int=MERAKI_PER_PAGE, **kwargs) -> list :
+        """
+        Returns the items of every page of a paged Dashboard call, taking a token for each page.
+        Each page is requested with `startingAfter` set to the `key` of the last item of the previous page.
+        @org_id : the organization id the call counts against
+        @func : the paged AsyncDashboardAPI method
+        @key : the item attribute the Dashboard pages by, for example 'id' or 'serial'
+        @per_page : the items per page
+        """
+        items = []
+        while True :
+            starting_after = { 'startingAfter':items[-1][key] } if items else {}
+            page = await self.call(org_id, func, *args, total_pages=1, perPage=per_page, **starting_after, **kwargs)
+            items.extend(page)
+            if len(page) < per_page :
+                return items
+
+
+async def get_organizations (dashboard, names:list=None) -> list :
+    """
+    Returns the organizations with the names or all organizations.
+    @dashboard : the AsyncDashboardAPI
+    @names : the organization names. Default: all organizations
+    """
+    orgs = await dashboard.organizations.getOrganizations(total_pages='all')
+    if not names :
+        return orgs
+    missing = set(names) - { org['name'] for org in orgs }
+    if missing :
+        raise ValueError(f"Unknown Meraki organizations: {sorted(missing)}")
+    return [ org for org in orgs if org['name'] in names ]
+
+
+def env_org_names (env:dict=None) -> list :
+    """
+    Returns the organization names from the comma-separated `MERAKI_ORG_NAME` environment variable.
+    """
+    env = os.environ if env is None else env
+    return [ name.strip() for name in env.get('MERAKI_ORG_NAME', '').split(',') if name.strip() ]
+
+
+def action (resource:str, operation:str, body:dict=None) -> dict :
+    """
+    Returns an action batch action.
+    @resource : the resource path, for example `/organizations/{organizationId}/adaptivePolicy/groups/{id}`
+    @operation : one of ACTION_BATCH_OPERATIONS
+    @body : the resource attributes for `create` and `update`
+    """
+    if operation not in ACTION_BATCH_OPERATIONS :
+        raise ValueError(f"Invalid action batch operation: {operation}")
+    return { 'resource':resource, 'operation':operation, **({'body':body} if body is not None else {}) }
+
+
+def action_batch_size (count:int, limit:int=ACTION_BATCH_CONCURRENCY) -> int :
+    """
+    Returns the actions per batch to spread `count` actions over `limit` concurrent batches.
+    Up to ACTION_BATCH_SYNC_SIZE actions are sent as a single synchronous batch.
+    @count : the number of actions
+    @limit : the maximum concurrent batches
+    """
+    if count <= ACTION_BATCH_SYNC_SIZE :
+        return max(count, 1)
+    return min(ACTION_BATCH_SIZE, max(ACTION_BATCH_SYNC_SIZE, math.ceil(count / limit)))
+
+
+async def action_batch_wait (dashboard, limiter:OrgRateLimiter, org_id:str, batch:dict, timeout:float=ACTION_BATCH_TIMEOUT, verbose:int=0) -> dict :
+    """
+    Poll an action batch with exponential backoff until it completed or failed and return the final batch.
+    @dashboard : the AsyncDashboardAPI
+    @limiter : the OrgRateLimiter for the polls
+    @org_id : the organization id
+    @batch : the action batch from `createOrganizationActionBatch()`
+    @timeout : the maximum seconds to wait
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    interval = ACTION_BATCH_POLL_INTERVAL
+    while not (batch['status']['completed'] or batch['status']['failed']) :
+        if loop.time() + interval > deadline :
+            raise asyncio.TimeoutError(f"Action batch {batch['id']} not done after {timeout} seconds")
+        await asyncio.sleep(interval)
+        batch = await limiter.call(org_id, dashboard.organizations.getOrganizationActionBatch, org_id, batch['id'])
+        if verbose >= 3 : print(f"ⓘ action batch {batch['id']} {batch['status']}")
+        interval = min(interval * 2, ACTION_BATCH_POLL_INTERVAL_MAX)
+    return batch
+
+
+async def action_batch (dashboard, limiter:OrgRateLimiter, org_id:str, actions:list, verbose:int=0) -> dict :
+    """
+    Submit a confirmed action batch, synchronous if it fits, and return it when done.
+    @dashboard : the AsyncDashboardAPI
+    @limiter : the OrgRateLimiter for the submit and the polls
+    @org_id : the organization id
+    @actions : the actions from `action()`
+    """
+    synchronous = len(actions) <= ACTION_BATCH_SYNC_SIZE
+    batch = await limiter.call(org_id, dashboard.organizations.createOrganizationActionBatch, org_id, actions,
+                               confirmed=True, synchronous=synchronous)
+    return await action_batch_wait(dashboard, limiter, org_id, batch, verbose=verbose)
+
+
+async def action_batches (dashboard, limiter:OrgRateLimiter, org_id:str, actions:list, batch_size:int=None,
+                          limit:int=ACTION_BATCH_CONCURRENCY, verbose:int=0) -> list :
+    """
+    Run many actions as action batches executed concurrently and return an (actions, batch or exception)
+    tuple per batch, in order.
+    Actions in different batches may run in any order so they must not depend on each other.
+    @dashboard : the AsyncDashboardAPI
+    @limiter : the OrgRateLimiter for the submits and the polls
+    @org_id : the organization id
+    @actions : the actions from `action()`
+    @batch_size : the maximum actions per batch. Default: `action_batch_size()`
+    @limit : the maximum batches running at once
+    """
+    if not actions :
+        return []
+    batch_size = min(batch_size or action_batch_size(len(actions), limit), ACTION_BATCH_SIZE)
+    chunks = [ actions[i:i+batch_size] for i in range(0, len(actions), batch_size) ]
+    if verbose >= 2 : print(f"ⓘ {len(actions)} actions in {len(chunks)} batches of up to {batch_size}")
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run (chunk) :
+        async with semaphore :
+            return await action_batch(dashboard, limiter, org_id, chunk, verbose=verbose)
+
+    return list(zip(chunks, await asyncio.gather(*[ run(chunk) for chunk in chunks ], return_exceptions=True)))
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+
+Export Meraki Adaptive Policy groups, ACLs, and policies as TrustSec data.
+
+The Adaptive Policy groups, ACLs, and policies of every organization are fetched
+concurrently with the asyncio Dashboard client. Each organization's requests take
+a token from its own token bucket so they stay within the Dashboard rate limit.
+Groups, ACLs, and policies are converted to ISE SGTs, SGACLs, and egress matrix
+cells and written with the same `Matrix`, `SGACLs`, and `SGTs` workbook and CSV
+layout as `ise_trustsec_export.py`, one set of files per organization.
+
+Examples:
+    meraki_trustsec_export.py
+    meraki_trustsec_export.py -v
+    meraki_trustsec_export.py --orgs example_org other_org
+    meraki_trustsec_export.py -t -f 20250101_meraki_backup
+    meraki_trustsec_export.py --rate 5 --constant-memory
+    meraki_trustsec_export.py --formats parquet jsonl
+    meraki_trustsec_export.py --output summary
+
+Requires setting the these environment variables using the `export` command:
+  export MERAKI_DASHBOARD_API_KEY='abcdef1234567890abcdef1234567890abcdef12'
+  export MERAKI_ORG_NAME=example_org    # optional default organization names, comma-separated. Default: all
+
+You may add these export lines to a text file and load with `source`:
+  source meraki.sh
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import asyncio
+import argparse
+import re
+import sys
+import time
+import traceback
+import meraki
+from ise_trustsec_export import (EXCEL_CONSTANT_MEMORY_SGTS, OUTPUT_FORMATS, OUTPUT_FORMATS_DEFAULT, OUTPUT_MODES, OUTPUT_FULL_SGTS, OUTPUT_WINDOW,
+                                 trustsec_export)
+from trustsec_formats import check_formats
+from meraki_dashboard import (MERAKI_CONCURRENCY, MERAKI_ORG_RATE, MERAKI_ORG_BURST, MERAKI_RETRIES, OrgRateLimiter,
+                              dashboard_from_env, env_org_names, get_organizations)
+
+# Globals
+DATA_DIR = './'
+TRUSTSEC_BASE_FILENAME = 'meraki_trustsec'
+
+# Meraki ACL `ipVersion` to ISE SGACL `ipVersion`. ISE does not return the default IP_AGNOSTIC.
+ACL_IP_VERSIONS = {'ipv4':'IPV4', 'ipv6':'IPV6', 'any':None}
+
+# Meraki policy `lastEntryRule` to ISE egress cell `defaultRule`
+POLICY_DEFAULT_RULES = {'default':'NONE', 'allow':'PERMIT_IP', 'deny':'DENY_IP'}
+
+
+def rule_ports (keyword:str, ports:str) -> list :
+    """
+    Returns the ISE port matches of a Meraki rule port: '' for 'any', 'dst eq 443' for a port,
+    'dst range 1 1024' for a range, and one match per port of a comma-separated list.
+    @keyword : 'src' or 'dst'
+    @ports : the Meraki `srcPort` or `dstPort`
+    """
+    ports = str(ports or 'any').strip().lower()
+    if ports == 'any' :
+        return ['']
+    matches = []
+    for port in ports.split(',') :
+        (low, _, high) = port.strip().partition('-')
+        matches.append(f"{keyword} range {low} {high}" if high else f"{keyword} eq {low}")
+    return matches
+
+
+def acl_to_aclcontent (rules:list) -> str :
+    """
+    Returns the ISE SGACL `aclcontent` lines of the Meraki ACL rules, for example 'permit tcp dst eq 443'.
+    @rules : the Meraki ACL rules with `policy`, `protocol`, `srcPort`, and `dstPort`
+    """
+    lines = []
+    for rule in rules :
+        action = 'permit' if rule.get('policy') == 'allow' else 'deny'
+        protocol = rule.get('protocol', 'any').lower()
+        if protocol not in ['tcp', 'udp'] :     # ports only apply to TCP and UDP
+            lines.append(f"{action} {'ip' if protocol == 'any' else protocol}")
+            continue
+        for src in rule_ports('src', rule.get('srcPort')) :
+            for dst in rule_ports('dst', rule.get('dstPort')) :
+                lines.append(' '.join(word for word in [action, protocol, src, dst] if word))
+    return '\n'.join(lines)
+
+
+def group_to_sgt (group:dict) -> dict :
+    """
+    Returns the ISE SGT details of a Meraki Adaptive Policy group.
+    """
+    return {'id':group['groupId'], 'name':group['name'], 'description':group.get('description') or '',
+            'value':int(group['sgt']), 'generationId':0, 'propogateToApic':False}
+
+
+def acl_to_sgacl (acl:dict) -> dict :
+    """
+    Returns the ISE SGACL details of a Meraki Adaptive Policy ACL.
+    """
+    sgacl = {'id':acl['aclId'], 'name':acl['name'], 'description':acl.get('description') or '', 'generationId':0,
+             'aclcontent':acl_to_aclcontent(acl.get('rules', []))}
+    ip_version = ACL_IP_VERSIONS.get(str(acl.get('ipVersion', 'any')).lower())
+    if ip_version :
+        sgacl['ipVersion'] = ip_version
+    return sgacl
+
+
+def policy_to_cell (policy:dict) -> dict :
+    """
+    Returns the ISE egress matrix cell details of a Meraki Adaptive Policy policy.
+    """
+    (src, dst) = (policy['sourceGroup'], policy['destinationGroup'])
+    return {
+        'id': policy['adaptivePolicyId'],
+        'name': f"{src['name']}-{dst['name']}",
+        'description': '',
+        'sourceSgtId': src['id'],
+        'destinationSgtId': dst['id'],
+        'matrixCellStatus': 'ENABLED',
+        'defaultRule': POLICY_DEFAULT_RULES.get(policy.get('lastEntryRule', 'default'), 'NONE'),
+        'sgacls': [ acl['id'] for acl in policy.get('acls', []) ],
+    }
+
+
+def org_filename (name:str) -> str :
+    """
+    Returns the organization name as a filename-safe string.
+    """
+    return re.sub(r'[^\w.-]+', '_', name).strip('_') or 'org'
+
+
+async def get_adaptive_policy (dashboard, limiter:OrgRateLimiter, org:dict) -> tuple :
+    """
+    Returns the (groups, acls, policies) of the organization fetched concurrently.
+    @dashboard : the AsyncDashboardAPI
+    @limiter : the OrgRateLimiter shared by every organization
+    @org : the organization details
+    """
+    org_id = org['id']
+    return await asyncio.gather(
+        limiter.call(org_id, dashboard.organizations.getOrganizationAdaptivePolicyGroups, org_id),
+        limiter.call(org_id, dashboard.organizations.getOrganizationAdaptivePolicyAcls, org_id),
+        limiter.call(org_id, dashboard.organizations.getOrganizationAdaptivePolicyPolicies, org_id),
+    )
+
+
+async def meraki_trustsec_export (dashboard, limiter:OrgRateLimiter, orgs:list) -> int :
+    """
+    Fetch the Adaptive Policy of the organizations concurrently and export each one as it arrives.
+    Returns the number of organizations that failed.
+    @dashboard : the AsyncDashboardAPI
+    @limiter : the OrgRateLimiter shared by every organization
+    @orgs : the organization details
+    """
+    async def fetch (org) :
+        try :
+            return (org, await get_adaptive_policy(dashboard, limiter, org), None)
+        except Exception as e :
+            return (org, None, e)
+
+    failed = 0
+    for future in asyncio.as_completed([ fetch(org) for org in orgs ]) :
+        (org, adaptive_policy, error) = await future
+        if error :
+            failed += 1
+            print(f"\n❌ {org['name']}: {type(error).__name__}: {error}\n", file=sys.stderr)
+            if args.verbose : traceback.print_exception(error)
+            continue
+        (groups, acls, policies) = adaptive_policy
+        print(f"\nⓘ Organization: {org['name']} ({len(groups)} groups, {len(acls)} ACLs, {len(policies)} policies)")
+        if args.verbose >= 2 : print(f"ⓘ Raw Adaptive Policy:\n{groups}\n{acls}\n{policies}")
+        try :
+            trustsec_export([ group_to_sgt(g) for g in groups ],
+                            [ acl_to_sgacl(a) for a in acls ],
+                            [ policy_to_cell(p) for p in policies ],
+                            DATA_DIR+f"{args.filename}_{org_filename(org['name'])}", sort=args.sort,
+                            constant_memory=args.constant_memory, verbose=args.verbose, formats=args.formats,
+                            output=args.output, window=args.window, window_from=args.window_from)
+        except Exception as e :
+            failed += 1
+            print(f"\n❌ {org['name']}: {type(e).__name__}: {e}\n", file=sys.stderr)
+            if args.verbose : traceback.print_exc()
+    return failed
+
+
+async def parse_cli_arguments () :
+    """
+    Parse the command line arguments
+    """
+    ARGS = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ARGS.add_argument('-o', '--orgs', nargs='+', default=env_org_names(), help='organization names. Default: MERAKI_ORG_NAME or all')
+    ARGS.add_argument('-f', '--filename', required=False, help='filename prefix for `{prefix}_{org}`', default=TRUSTSEC_BASE_FILENAME)
+    ARGS.add_argument('-m', '--constant-memory', action='store_true', default=False, help=f'write Excel row by row in constant memory. Default: above {EXCEL_CONSTANT_MEMORY_SGTS} SGTs')
+    ARGS.add_argument('-F', '--formats', nargs='+', choices=OUTPUT_FORMATS, default=OUTPUT_FORMATS_DEFAULT, help='output file formats. Parquet and Arrow IPC require pyarrow')
+    ARGS.add_argument('--output', choices=OUTPUT_MODES, default='auto', help=f'terminal output. Default: full up to {OUTPUT_FULL_SGTS} SGTs, else a summary and a matrix window')
+    ARGS.add_argument('--window', type=int, nargs=2, default=OUTPUT_WINDOW, metavar=('ROWS', 'COLUMNS'), help='matrix window size')
+    ARGS.add_argument('--window-from', nargs=2, default=None, metavar=('SRC', 'DST'), help="the matrix window's first source and destination SGT name or value")
+    ARGS.add_argument('-s', '--sort', choices=['name', 'value',], default='name', help='SGT sort key')
+    ARGS.add_argument('-c', '--concurrency', type=int, default=MERAKI_CONCURRENCY, help='maximum concurrent Dashboard requests')
+    ARGS.add_argument('--rate', type=float, default=MERAKI_ORG_RATE, help='Dashboard requests per second per organization')
+    ARGS.add_argument('--burst', type=int, default=MERAKI_ORG_BURST, help='requests an idle organization may send at once')
+    ARGS.add_argument('-r', '--retries', type=int, default=MERAKI_RETRIES, help='retries for 429 and 5xx Dashboard errors')
+    ARGS.add_argument('-t', '--timer', action='store_true', default=False, help='show response timer')
+    ARGS.add_argument('-v', '--verbose', action='count', default=0, help='Verbosity; multiple allowed')
+    args = ARGS.parse_args()
+    try :
+        check_formats(args.formats)
+    except ValueError as e :
+        ARGS.error(str(e))
+    return args
+
+
+async def main ():
+    """
+    Entrypoint for packaged script.
+    """
+
+    global args     # promote to global scope for use in other functions
+    args = await parse_cli_arguments()
+    if args.verbose >= 3 : print(f'ⓘ Args: {args}')
+    if args.timer :
+        global start_time
+        start_time = time.time()
+
+    failed = 0
+    try :
+        async with dashboard_from_env(maximum_concurrent_requests=args.concurrency, maximum_retries=args.retries) as dashboard :
+            orgs = await get_organizations(dashboard, args.orgs)
+            if args.verbose : print(f"ⓘ Organizations: {[ org['name'] for org in orgs ]}")
+            limiter = OrgRateLimiter(args.rate, args.burst)
+            failed = await meraki_trustsec_export(dashboard, limiter, orgs)
+            if args.verbose : print(f"ⓘ Rate limit waits: { {org['name'] : round(limiter.bucket(org['id']).waited, 3) for org in orgs} } seconds")
+
+    except meraki.exceptions.AsyncAPIError as e :
+        print(f"\n❌ Meraki API Error: {e}\n", file=sys.stderr)
+        failed += 1
+    except Exception as e :                     # catch *all* exceptions
+        print(f"\n❌ {type(e).__name__}: {e}\n", file=sys.stderr)
+        if args.verbose : traceback.print_exc()
+        failed += 1
+
+    if args.timer :
+        duration = time.time() - start_time
+        print(f'\n 🕒 {duration} seconds\n', file=sys.stderr)
+    return failed
+
+
+if __name__ == '__main__':
+    """
+    Entrypoint for local script.
+    """
+    failed = asyncio.run(main())
+
+    sys.exit(1 if failed else 0) # 0 is ok
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+
+Write the TrustSec SGTs, SGACLs, egress policies, and matrix as JSON Lines,
+Parquet, or Arrow IPC files for analytics and diff jobs that would otherwise
+reparse the CSVs on every run.
+
+Every table has a fixed set of columns and dtypes in TABLE_SCHEMAS so snapshots
+from different runs, deployments, or an empty deployment always load the same way.
+The matrix is written in its long layout, a row per cell with a policy, so its
+columns do not depend on the SGTs. JSON Lines are written one record at a time
+and the matrix records are streamed directly from the sparse matrix.
+Parquet and Arrow IPC require the optional `pyarrow` package. Arrow IPC files
+are uncompressed so they may be memory-mapped and read without copies.
+
+Writes `{filename}_{table}.{format}` for the tables `sgts`, `sgacls`, `policies`, and `matrix`.
+
+Examples:
+    write_trustsec_tables('ise_trustsec', ['jsonl', 'parquet'], df_sgts, df_sgacls, df_policies, matrix)
+    df_sgts = pd.read_parquet('ise_trustsec_sgts.parquet')
+    df_cells = pd.read_json('ise_trustsec_matrix.jsonl', lines=True)
+    cells = pyarrow.ipc.open_file(pyarrow.memory_map('ise_trustsec_matrix.arrow')).read_all()
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import json
+import pandas as pd
+from trustsec_metrics import Metrics
+
+try :
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError :        # optional for Parquet and Arrow IPC
+    pa = None
+
+TABLE_FORMATS = ['jsonl', 'parquet', 'arrow']
+TABLE_FORMATS_PYARROW = ['parquet', 'arrow']
+
+# The columns and dtypes of each table
+TABLE_SCHEMAS = {
+    'sgts'     : {'id':'string', 'name':'string', 'description':'string', 'value':'int32', 'generationId':'int32', 'propogateToApic':'bool'},
+    'sgacls'   : {'id':'string', 'name':'string', 'description':'string', 'generationId':'int32', 'ipVersion':'string', 'aclcontent':'string'},
+    'policies' : {'ID':'string', 'Name':'string', 'Description':'string', 'Status':'string', 'SrcSGT':'string', 'DstSGT':'string',
+                  'SGACLs':'list<string>', 'DefaultRule':'string'},
+    'matrix'   : {'SrcSGT':'string', 'SrcValue':'int32', 'DstSGT':'string', 'DstValue':'int32', 'Cell':'string'},
+}
+
+# Values for missing or empty columns. ISE does not return the `ipVersion` of IP_AGNOSTIC SGACLs.
+TABLE_DEFAULTS = {'ipVersion':'IP_AGNOSTIC', 'generationId':0, 'propogateToApic':False}
+
+
+def check_formats (formats:list) :
+    """
+    Raise a ValueError if a format requires `pyarrow` and it is not installed.
+    @formats : the output formats
+    """
+    missing = [ format for format in formats if format in TABLE_FORMATS_PYARROW ]
+    if missing and pa is None :
+        raise ValueError(f"{missing} output requires pyarrow: pip install pyarrow")
+
+
+def arrow_schema (schema:dict) :
+    """
+    Returns the pyarrow schema for a table schema from TABLE_SCHEMAS.
+    """
+    types = {'string':pa.string(), 'int32':pa.int32(), 'bool':pa.bool_(), 'list<string>':pa.list_(pa.string())}
+    return pa.schema([ (column, types[dtype]) for (column, dtype) in schema.items() ])
+
+
+def typed_frame (df:pd.DataFrame, schema:dict) -> pd.DataFrame :
+    """
+    Returns a dataframe with only the schema columns, in order, with their dtypes.
+    Missing columns and empty values are set from TABLE_DEFAULTS or ''.
+    @df : the dataframe
+    @schema : a table schema from TABLE_SCHEMAS
+    """
+    columns = {}
+    for (column, dtype) in schema.items() :
+        default = TABLE_DEFAULTS.get(column, '')
+        values = df[column] if column in df.columns else pd.Series(default, index=df.index, dtype=object)
+        if dtype == 'list<string>' :
+            columns[column] = pd.Series([ [ str(s) for s in v ] if isinstance(v, (list, tuple)) else [] for v in values ], index=values.index, dtype=object)
+            continue
+        values = values.where(values.notna() & (values.astype(str) != ''), default)
+        columns[column] = values.astype(str).astype('string') if dtype == 'string' else values.astype(dtype)
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(df)))
+
+
+def iter_records (df:pd.DataFrame) :
+    """
+    Yields a dict per dataframe row with Python values.
+    """
+    columns = list(df.columns)
+    for values in df.itertuples(index=False, name=None) :
+        yield dict(zip(columns, values))
+
+
+def iter_matrix_records (matrix) :
+    """
+    Yields a `matrix` table record per cell with a policy directly from the sparse matrix.
+    @matrix : the TrustSecMatrix
+    """
+    names = matrix.sgts['name'].to_dict()
+    for (src, dst, cell) in matrix.cells() :
+        yield {'SrcSGT':names[src], 'SrcValue':src, 'DstSGT':names[dst], 'DstValue':dst, 'Cell':cell}
+
+
+def write_jsonl (filename:str, records) -> int :
+    """
+    Write the records to a JSON Lines file one record at a time and return the number of records.
+    @filename : the JSON Lines filename
+    @records : an iterable of dicts
+    """
+    count = 0
+    with open(filename, 'w', encoding='utf-8') as fh :
+        for record in records :
+            fh.write(json.dumps(record, ensure_ascii=False))
+            fh.write('\n')
+            count += 1
+    return count
+
+
+def write_parquet (filename:str, df:pd.DataFrame, schema:dict) :
+    """
+    Write the typed dataframe to a Parquet file with the table schema.
+    @filename : the Parquet filename
+    @df : a dataframe from `typed_frame()`
+    @schema : a table schema from TABLE_SCHEMAS
+    """
+    pq.write_table(pa.Table.from_pandas(df, schema=arrow_schema(schema), preserve_index=False), filename)
+
+
+def write_arrow (filename:str, df:pd.DataFrame, schema:dict) :
+    """
+    Write the typed dataframe to an uncompressed Arrow IPC file with the table schema.
+    @filename : the Arrow IPC filename
+    @df : a dataframe from `typed_frame()`
+    @schema : a table schema from TABLE_SCHEMAS
+    """
+    table = pa.Table.from_pandas(df, schema=arrow_schema(schema), preserve_index=False)
+    with pa.OSFile(filename, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer :
+        writer.write_table(table)
+
+
+def write_trustsec_tables (filename:str, formats:list, df_sgts:pd.DataFrame, df_sgacls:pd.DataFrame, df_policies:pd.DataFrame, matrix, metrics:Metrics=None) -> list :
+    """
+    Write the `sgts`, `sgacls`, `policies`, and `matrix` tables in each format to `{filename}_{table}.{format}`
+    and return the filenames. Formats other than TABLE_FORMATS are ignored.
+    @filename : the output filename prefix
+    @formats : the output formats
+    @df_sgts : the SGTs dataframe indexed by id; the hidden 'ANY' SGT is not written
+    @df_sgacls : the SGACLs dataframe indexed by id
+    @df_policies : the egress policies by name with a list of SGACL names per policy
+    @matrix : the TrustSecMatrix
+    @metrics : the Metrics to time each format in
+    """
+    formats = [ format for format in formats if format in TABLE_FORMATS ]
+    check_formats(formats)
+    metrics = metrics or Metrics()
+    tables = {
+        'sgts'     : lambda: df_sgts[df_sgts['name'] != 'ANY'].reset_index(),
+        'sgacls'   : lambda: df_sgacls.reset_index(),
+        'policies' : lambda: df_policies,
+        'matrix'   : matrix.to_frame,
+    }
+    typed = {}          # typed dataframes shared by the formats
+    filenames = []
+    for format in formats :
+        with metrics.phase(format) :
+            for (table, frame) in tables.items() :
+                schema = TABLE_SCHEMAS[table]
+                table_filename = f"{filename}_{table}.{format}"
+                if format == 'jsonl' :
+                    write_jsonl(table_filename, iter_matrix_records(matrix) if table == 'matrix' else iter_records(typed_frame(frame(), schema)))
+                else :
+                    if table not in typed : typed[table] = typed_frame(frame(), schema)
+                    (write_parquet if format == 'parquet' else write_arrow)(table_filename, typed[table], schema)
+                filenames.append(table_filename)
+    return filenames
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+
+A sparse TrustSec egress matrix indexed by integer SGT values.
+
+Only cells with an egress policy are stored, as sorted coordinate arrays of
+(source SGT value, destination SGT value, SGACL code), so memory grows with
+the number of policies instead of SGTs². SGACL references are int-coded into
+`sgacls`, a vocabulary of cell values where code 0 is the empty default cell.
+Conversion to and from the dense `SGT × SGT` Excel layout happens only at the edges.
+
+Examples:
+    matrix = TrustSecMatrix.from_policies(df_sgts, df_policies)
+    matrix = TrustSecMatrix.from_dense(pd.read_excel('ise_trustsec_matrix.xlsx', sheet_name='Matrix').fillna(''))
+    matrix = TrustSecMatrix.from_rows(iter_matrix_rows('ise_trustsec_matrix.xlsx'))
+    matrix.get(4, 6)            # 'Deny IP'
+    matrix.row(4)               # {3: 'Permit IP', 6: 'Deny IP', ...}
+    for (src, dst, sgacls) in matrix.cells() : ...
+    df_matrix = matrix.to_dense(sort='name')
+    df_window = matrix.window(20, 8, row=40, column=40)
+    df_cells = matrix.to_frame()
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import numpy as np
+import pandas as pd
+
+SGT_VALUE_BITS = 16     # SGT values are 0-65535
+MATRIX_COLUMNS = ['SGT', 'Value', 'Description']    # the leading columns of the dense layout
+
+
+def sgt_values (names:pd.Series, values_by_name:pd.Series) -> np.ndarray :
+    """
+    Returns the SGT value for each SGT name as a float array with NaN for unknown names.
+    Each distinct name is looked up once instead of once per cell.
+    @names : the SGT names
+    @values_by_name : the SGT values indexed by SGT name
+    """
+    (codes, uniques) = pd.factorize(names)
+    lookup = np.append(values_by_name.reindex(uniques).to_numpy(dtype=float), np.nan)  # code -1 (missing name) is NaN
+    return lookup[codes]
+
+
+class TrustSecMatrix :
+    """
+    A sparse TrustSec egress matrix of SGACL references indexed by integer SGT values.
+    """
+
+    def __init__ (self, sgts:pd.DataFrame, src:np.ndarray, dst:np.ndarray, codes:np.ndarray, sgacls:list) :
+        """
+        Use the `from_*` class methods to create a matrix.
+        @sgts : a dataframe of the SGTs indexed by `value` with `name` and `description` columns
+        @src : the source SGT value of each cell
+        @dst : the destination SGT value of each cell
+        @codes : the SGACL code of each cell
+        @sgacls : the cell value for each SGACL code
+        """
+        self.sgts = sgts
+        self.sgacls = sgacls
+        keys = (src.astype(np.int64) << SGT_VALUE_BITS) | dst.astype(np.int64)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]         # sorted (src, dst) keys for row slicing and lookups
+        self.codes = codes.astype(np.int32)[order]
+        self._column_order = None       # cell order by (dst, src) for column slicing, built on first use
+
+
+    @classmethod
+    def from_cells (cls, sgts:pd.DataFrame, src, dst, values) :
+        """
+        Returns a matrix from arrays of source SGT values, destination SGT values, and cell values.
+        Empty values are dropped and the last value wins for a repeated (source, destination).
+        @sgts : a dataframe of the SGTs indexed by `value` with `name` and `description` columns
+        @src : the source SGT values
+        @dst : the destination SGT values
+        @values : the cell values: comma-separated SGACL names or a default rule
+        """
+        # factorize before converting to str: only the distinct values are converted, and missing values become ''
+        (codes, uniques) = pd.factorize(pd.Series(values))
+        (relabel, uniques) = pd.factorize(np.array([''] + [str(u) for u in uniques.tolist()], dtype=object))  # '' is always code 0
+        (src, dst, codes) = (np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64), relabel[codes + 1])
+        keep = codes != 0
+        keys = pd.Series((src[keep] << SGT_VALUE_BITS) | dst[keep])
+        last = ~keys.duplicated(keep='last').to_numpy()
+        return cls(sgts, src[keep][last], dst[keep][last], codes[keep][last], list(uniques))
+
+
+    @classmethod
+    def from_policies (cls, df_sgts:pd.DataFrame, df_policies:pd.DataFrame) :
+        """
+        Returns a matrix from the egress policies by name.
+        Cells with the hidden 'ANY' SGT or unknown SGT names are not included.
+        @df_sgts : the SGTs dataframe with `name`, `value`, and `description` columns
+        @df_policies : the egress policies by name from `create_trustsec_egress_policies_by_name()`
+        """
+        df_sgts = df_sgts[df_sgts['name'] != 'ANY']
+        sgts = df_sgts[['value', 'name', 'description']].astype({'value':int}).set_index('value')
+        values_by_name = pd.Series(sgts.index, index=sgts['name'])
+
+        # cell values: SGACL names, else the default rule, else empty
+        sgacls = df_policies['SGACLs']
+        if len(sgacls) and not isinstance(sgacls.iloc[0], str) :
+            sgacls = sgacls.map(','.join)   # SGACL name lists
+        default_rule = df_policies['DefaultRule'].fillna('NONE')
+        values = sgacls.where(sgacls != '', default_rule.where(default_rule != 'NONE', ''))
+
+        src = sgt_values(df_policies['SrcSGT'], values_by_name)
+        dst = sgt_values(df_policies['DstSGT'], values_by_name)
+        known = ~np.isnan(src) & ~np.isnan(dst)
+        return cls.from_cells(sgts, src[known].astype(int), dst[known].astype(int), values[known])
+
+
+    @classmethod
+    def from_dense (cls, df_matrix:pd.DataFrame) :
+        """
+        Returns a matrix from the dense Excel layout with the columns ['SGT', 'Value', 'Description']
+        followed by a column per destination SGT name.
+        @df_matrix : the dense matrix dataframe with empty cells as ''
+        """
+        sgts = df_matrix[MATRIX_COLUMNS].rename(columns={'SGT':'name', 'Value':'value', 'Description':'description'})
+        sgts = sgts.astype({'value':int}).set_index('value')
+        values_by_name = pd.Series(sgts.index, index=sgts['name'])
+
+        cells = df_matrix.drop(columns=['SGT', 'Description']).set_index('Value')
+        cells.index = cells.index.astype(int)
+        cells.columns = cells.columns.map(values_by_name)   # destination SGT names to values
+        cells = cells.loc[:, cells.columns.notna()].stack()
+        cells = cells[cells.astype(str).str.strip() != '']
+        return cls.from_cells(sgts, cells.index.get_level_values(0), cells.index.get_level_values(1).astype(int), cells.to_numpy())
+
+
+    @classmethod
+    def from_rows (cls, rows) :
+        """
+        Returns a matrix from streamed dense rows without building the dense layout.
+        Cells with an unknown destination SGT name are not included.
+        @rows : an iterable of ({'name', 'value', 'description'}, [(destination SGT name, cell value), ...])
+        """
+        (sgts, src, dst, values) = ([], [], [], [])
+        for (sgt, cells) in rows :
+            sgts.append(sgt)
+            for (name, value) in cells :
+                src.append(sgt['value'])
+                dst.append(name)
+                values.append(value)
+        sgts = pd.DataFrame(sgts, columns=['name', 'value', 'description']).astype({'value':int}).set_index('value')
+        dst = pd.Series(dst, dtype=object).map(pd.Series(sgts.index, index=sgts['name']))
+        known = dst.notna().to_numpy()
+        return cls.from_cells(sgts, np.asarray(src, dtype=np.int64)[known], dst[known].astype(int), np.asarray(values, dtype=object)[known])
+
+
+    def __len__ (self) -> int :
+        """
+        Returns the number of cells with an egress policy.
+        """
+        return len(self.keys)
+
+
+    def name (self, value:int) -> str :
+        """
+        Returns the SGT name for the SGT value.
+        """
+        return self.sgts.at[value, 'name']
+
+
+    def get (self, src:int, dst:int, default:str='') -> str :
+        """
+        Returns the cell value for the source and destination SGT values or the default.
+        """
+        key = (src << SGT_VALUE_BITS) | dst
+        i = np.searchsorted(self.keys, key)
+        return self.sgacls[self.codes[i]] if i < len(self.keys) and self.keys[i] == key else default
+
+
+    def row (self, src:int) -> dict :
+        """
+        Returns the {destination SGT value : cell value} of the non-default cells for a source SGT value.
+        """
+        (start, end) = np.searchsorted(self.keys, [src << SGT_VALUE_BITS, (src + 1) << SGT_VALUE_BITS])
+        mask = (1 << SGT_VALUE_BITS) - 1
+        return { int(key & mask) : self.sgacls[code] for key, code in zip(self.keys[start:end], self.codes[start:end]) }
+
+
+    def column (self, dst:int) -> dict :
+        """
+        Returns the {source SGT value : cell value} of the non-default cells for a destination SGT value.
+        """
+        if self._column_order is None :
+            mask = (1 << SGT_VALUE_BITS) - 1
+            column_keys = ((self.keys & mask) << SGT_VALUE_BITS) | (self.keys >> SGT_VALUE_BITS)
+            self._column_order = np.argsort(column_keys, kind='stable')
+            self._column_keys = column_keys[self._column_order]
+        (start, end) = np.searchsorted(self._column_keys, [dst << SGT_VALUE_BITS, (dst + 1) << SGT_VALUE_BITS])
+        rows = self.keys[self._column_order[start:end]] >> SGT_VALUE_BITS
+        return { int(src) : self.sgacls[code] for src, code in zip(rows, self.codes[self._column_order[start:end]]) }
+
+
+    def cells (self) :
+        """
+        Yields (source SGT value, destination SGT value, cell value) for every non-default cell in row order.
+        """
+        mask = (1 << SGT_VALUE_BITS) - 1
+        for key, code in zip(self.keys.tolist(), self.codes.tolist()) :
+            yield (key >> SGT_VALUE_BITS, key & mask, self.sgacls[code])
+
+
+    def sorted_sgts (self, sort:str='name') -> pd.DataFrame :
+        """
+        Returns the SGTs with `value`, `name`, and `description` columns in the matrix row and column order.
+        @sort : the SGT sort key: 'name' or 'value'
+        """
+        return self.sgts.reset_index().sort_values(sort).reset_index(drop=True)
+
+
+    def iter_rows (self, sort:str='name') :
+        """
+        Yields (SGT name, SGT value, SGT description, [(column, cell value), ...]) for every
+        source SGT in the dense row order, with only the non-default cells in column order.
+        Columns are 0-based positions among the destination SGT columns.
+        @sort : the SGT sort key: 'name' or 'value'
+        """
+        sgts = self.sorted_sgts(sort)
+        mask = (1 << SGT_VALUE_BITS) - 1
+        positions = pd.Index(sgts['value']).get_indexer(self.keys & mask)
+        starts = np.searchsorted(self.keys, sgts['value'].to_numpy(dtype=np.int64) << SGT_VALUE_BITS)
+        ends = np.searchsorted(self.keys, (sgts['value'].to_numpy(dtype=np.int64) + 1) << SGT_VALUE_BITS)
+        for (sgt, start, end) in zip(sgts.itertuples(index=False), starts, ends) :
+            order = np.argsort(positions[start:end], kind='stable')
+            cells = [ (int(positions[start + i]), self.sgacls[self.codes[start + i]]) for i in order ]
+            yield (sgt.name, int(sgt.value), sgt.description, cells)
+
+
+    def to_dense (self, sort:str='name') -> pd.DataFrame :
+        """
+        Returns the dense Excel layout with the columns ['SGT', 'Value', 'Description'] followed by
+        a column for each destination SGT and a row for each source SGT.
+        @sort : the SGT sort key: 'name' or 'value'
+        """
+        return self.window(len(self.sgts), len(self.sgts), sort=sort)
+
+
+    def window (self, rows:int, columns:int, row:int=0, column:int=0, sort:str='name') -> pd.DataFrame :
+        """
+        Returns a window of the dense layout with `rows` source SGTs from the `row` position and
+        `columns` destination SGTs from the `column` position without creating the whole dense matrix.
+        @rows : the number of source SGT rows
+        @columns : the number of destination SGT columns
+        @row : the 0-based position of the first source SGT in the sort order
+        @column : the 0-based position of the first destination SGT in the sort order
+        @sort : the SGT sort key: 'name' or 'value'
+        """
+        sgts = self.sorted_sgts(sort)
+        (row_sgts, column_sgts) = (sgts.iloc[row:row+rows], sgts.iloc[column:column+columns])
+        rows = pd.Index(row_sgts['value']).get_indexer(self.keys >> SGT_VALUE_BITS)
+        cols = pd.Index(column_sgts['value']).get_indexer(self.keys & ((1 << SGT_VALUE_BITS) - 1))
+        keep = (rows >= 0) & (cols >= 0)
+        cells = np.full((len(row_sgts), len(column_sgts)), '', dtype=object)
+        cells[rows[keep], cols[keep]] = np.asarray(self.sgacls, dtype=object)[self.codes[keep]]
+
+        df_matrix = row_sgts[['name', 'value', 'description']].rename(columns={'name':'SGT','value':'Value','description':'Description'})
+        df_cells = pd.DataFrame(cells, columns=column_sgts['name'].tolist(), dtype=object)   # no per-column str inference
+        return pd.concat([df_matrix.reset_index(drop=True), df_cells], axis='columns')
+
+
+    def value_counts (self) -> pd.Series :
+        """
+        Returns the number of cells for each cell value, most common first.
+        """
+        counts = np.bincount(self.codes, minlength=len(self.sgacls))
+        return pd.Series(counts, index=self.sgacls).drop('', errors='ignore').sort_values(ascending=False, kind='stable')
+
+
+    def to_frame (self) -> pd.DataFrame :
+        """
+        Returns the long layout with a row per non-default cell in row order and the columns
+        ['SrcSGT', 'SrcValue', 'DstSGT', 'DstValue', 'Cell'] so the columns do not depend on the SGTs.
+        """
+        (src, dst) = (self.keys >> SGT_VALUE_BITS, self.keys & ((1 << SGT_VALUE_BITS) - 1))
+        names = self.sgts['name']
+        return pd.DataFrame({
+            'SrcSGT'   : names.reindex(src).to_numpy(),
+            'SrcValue' : src.astype(np.int32),
+            'DstSGT'   : names.reindex(dst).to_numpy(),
+            'DstValue' : dst.astype(np.int32),
+            'Cell'     : np.asarray(self.sgacls, dtype=object)[self.codes],
+        })
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+
+Per-phase and per-endpoint run metrics for the TrustSec scripts.
+
+Requests are recorded per endpoint, the HTTP method and the URL path with ids
+replaced by `{id}`, with their count, statuses, errors, retries, latency
+percentiles and histogram, bytes sent and received, and the high-water mark of
+concurrent requests. Phases like fetch, resolve, pivot, CSV and Excel are
+timed with their wall-clock and CPU seconds; phases may repeat or overlap.
+
+Examples:
+    metrics = Metrics()
+    with metrics.phase('pivot') :
+        df_matrix = matrix.to_dense()
+    metrics.request_started('GET /ers/config/sgt')
+    metrics.request_finished('GET /ers/config/sgt', 200, 0.042, 0, 5321)
+    print(metrics.summary(), file=sys.stderr)
+    metrics.save('ise_trustsec_metrics.json')
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import bisect
+import collections
+import contextlib
+import datetime
+import json
+import math
+import re
+import threading
+import time
+import urllib.parse
+from tabulate import tabulate
+
+METRICS_PERCENTILES = [50, 95, 99]
+METRICS_HISTOGRAM_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]  # latency bucket upper bounds
+METRICS_ID_PATTERN = re.compile(r'^[0-9a-fA-F-]{8,}$')  # UUIDs and bulk ids in URL paths
+
+
+def percentile (values:list, p:float) -> float :
+    """
+    Returns the nearest-rank percentile of the sorted values or None when empty.
+    @values : the sorted values
+    @p : the percentile from 0 to 100
+    """
+    if not values :
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+
+class EndpointMetrics :
+    """
+    The request metrics of one endpoint.
+    """
+
+    def __init__ (self) :
+        self.requests = 0
+        self.errors = 0             # connection errors and non-2xx responses
+        self.retries = 0
+        self.statuses = collections.Counter()
+        self.latencies = []         # seconds
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.in_flight = 0
+        self.high_water = 0
+
+
+    def report (self) -> dict :
+        """
+        Returns the endpoint metrics as a JSON-serializable dict with latencies in milliseconds.
+        """
+        latencies = sorted(self.latencies)
+        ms = lambda seconds: None if seconds is None else round(seconds * 1000, 3)
+        histogram = collections.Counter(bisect.bisect_left(METRICS_HISTOGRAM_MS, s * 1000) for s in latencies)
+        return {
+            'requests'       : self.requests,
+            'errors'         : self.errors,
+            'retries'        : self.retries,
+            'statuses'       : { str(k) : v for k,v in sorted(self.statuses.items(), key=lambda kv: str(kv[0])) },
+            'latency_ms'     : {
+                **{ f"p{p}" : ms(percentile(latencies, p)) for p in METRICS_PERCENTILES },
+                'mean' : ms(sum(latencies) / len(latencies)) if latencies else None,
+                'max'  : ms(latencies[-1]) if latencies else None,
+            },
+            'histogram_ms'   : { (f"<={METRICS_HISTOGRAM_MS[i]}" if i < len(METRICS_HISTOGRAM_MS) else f">{METRICS_HISTOGRAM_MS[-1]}") : histogram[i]
+                                 for i in range(len(METRICS_HISTOGRAM_MS) + 1) if histogram[i] },
+            'bytes_sent'     : self.bytes_sent,
+            'bytes_received' : self.bytes_received,
+            'high_water'     : self.high_water,
+        }
+
+
+class Metrics :
+    """
+    Per-phase and per-endpoint metrics of a run.
+    """
+
+    def __init__ (self) :
+        self.started = time.time()
+        self.perf_start = time.perf_counter()
+        self.endpoints = collections.defaultdict(EndpointMetrics)  # {endpoint : EndpointMetrics}
+        self.phases = {}            # {phase : {'calls', 'seconds', 'cpu_seconds'}} in first-start order
+        self.active = []            # (phase, thread id) of the running phases, most recently started last
+        self.in_flight = 0
+        self.high_water = 0         # maximum concurrent requests across all endpoints
+
+
+    @staticmethod
+    def endpoint (method:str, url:str) -> str :
+        """
+        Returns the endpoint name of a request: the method and URL path without the query and with ids as `{id}`.
+        @method : the HTTP method
+        @url : the request URL or URL path
+        """
+        path = urllib.parse.urlsplit(url).path
+        return f"{method} " + '/'.join('{id}' if METRICS_ID_PATTERN.match(segment) else segment for segment in path.split('/'))
+
+
+    def request_started (self, endpoint:str) :
+        """
+        Count a request as in flight for the concurrency high-water marks.
+        """
+        metrics = self.endpoints[endpoint]
+        metrics.in_flight += 1
+        metrics.high_water = max(metrics.high_water, metrics.in_flight)
+        self.in_flight += 1
+        self.high_water = max(self.high_water, self.in_flight)
+
+
+    def request_finished (self, endpoint:str, status:int, seconds:float, bytes_sent:int=0, bytes_received:int=0) :
+        """
+        Record a finished request attempt.
+        @endpoint : the endpoint name from `endpoint()`
+        @status : the HTTP status or None for a connection error or timeout
+        @seconds : the request latency
+        @bytes_sent : the request body size
+        @bytes_received : the response body size
+        """
+        metrics = self.endpoints[endpoint]
+        metrics.in_flight -= 1
+        self.in_flight -= 1
+        metrics.requests += 1
+        metrics.statuses[status if status is not None else 'error'] += 1
+        if status is None or not 200 <= status < 300 :
+            metrics.errors += 1
+        metrics.latencies.append(seconds)
+        metrics.bytes_sent += bytes_sent
+        metrics.bytes_received += bytes_received
+
+
+    def retry (self, endpoint:str) :
+        """
+        Count a retry of a request to the endpoint.
+        """
+        self.endpoints[endpoint].retries += 1
+
+
+    @contextlib.contextmanager
+    def phase (self, name:str) :
+        """
+        Time a phase with its wall-clock and CPU seconds. Repeated phases are added together.
+        @name : the phase name, for example 'fetch', 'resolve', 'pivot', 'csv', or 'excel'
+        """
+        phase = self.phases.setdefault(name, {'calls':0, 'seconds':0.0, 'cpu_seconds':0.0})
+        (start, cpu_start) = (time.perf_counter(), time.process_time())
+        self.active.append((name, threading.get_ident()))
+        try :
+            yield phase
+        finally :
+            self.active.remove((name, threading.get_ident()))
+            phase['calls'] += 1
+            phase['seconds'] += time.perf_counter() - start
+            phase['cpu_seconds'] += time.process_time() - cpu_start
+
+
+    def report (self) -> dict :
+        """
+        Returns the metrics as a JSON-serializable dict.
+        """
+        endpoints = { endpoint : metrics.report() for endpoint, metrics in sorted(self.endpoints.items()) }
+        return {
+            'started'  : datetime.datetime.fromtimestamp(self.started, datetime.timezone.utc).isoformat(timespec='seconds'),
+            'seconds'  : round(time.perf_counter() - self.perf_start, 6),
+            'phases'   : { name : { k : round(v, 6) if isinstance(v, float) else v for k,v in phase.items() } for name, phase in self.phases.items() },
+            'requests' : {
+                'requests'       : sum(e['requests'] for e in endpoints.values()),
+                'errors'         : sum(e['errors'] for e in endpoints.values()),
+                'retries'        : sum(e['retries'] for e in endpoints.values()),
+                'bytes_sent'     : sum(e['bytes_sent'] for e in endpoints.values()),
+                'bytes_received' : sum(e['bytes_received'] for e in endpoints.values()),
+                'high_water'     : self.high_water,
+            },
+            'endpoints' : endpoints,
+        }
+
+
+    def summary (self) -> str :
+        """
+        Returns the phase and endpoint tables for the terminal.
+        """
+        report = self.report()
+        phases = [ {'phase':name, 'calls':p['calls'], 'seconds':p['seconds'], 'cpu seconds':p['cpu_seconds'],
+                    'cpu %':100 * p['cpu_seconds'] / p['seconds'] if p['seconds'] else 0} for name, p in report['phases'].items() ]
+        endpoints = [ {'endpoint':endpoint, 'requests':e['requests'], 'errors':e['errors'], 'retries':e['retries'],
+                       **{ f"p{p} ms" : e['latency_ms'][f"p{p}"] for p in METRICS_PERCENTILES },
+                       'KB sent':e['bytes_sent'] / 1024, 'KB received':e['bytes_received'] / 1024, 'high water':e['high_water']}
+                      for endpoint, e in report['endpoints'].items() ]
+        totals = report['requests']
+        lines = [f"\nⓘ Metrics: {report['seconds']:.3f} seconds, {totals['requests']} requests, {totals['errors']} errors, "
+                 f"{totals['retries']} retries, {totals['bytes_received'] / 1024:.1f} KB received, {totals['high_water']} concurrent"]
+        if phases :
+            lines.append(tabulate(phases, headers='keys', tablefmt='simple_grid', floatfmt='.3f'))
+        if endpoints :
+            lines.append(tabulate(endpoints, headers='keys', tablefmt='simple_grid', floatfmt='.1f'))
+        return '\n'.join(lines)
+
+
+    def save (self, filename:str) :
+        """
+        Write the metrics report to a JSON file.
+        """
+        with open(filename, 'w') as fh :
+            json.dump(self.report(), fh, indent=2)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+
+Profile a TrustSec script run to see whether the time goes to ISE, pandas, or XlsxWriter.
+
+The run is profiled with cProfile and sampled every `interval` seconds from a
+background thread. The time the event loop waits in the selector for network
+I/O is separated from the CPU time spent running Python in the event loop.
+Samples are labelled with the running Metrics phase so the hot functions of the
+fetch, pivot, or Excel phases are easy to find.
+
+Writes:
+  - {prefix}.pstats : the cProfile stats for `python -m pstats` or snakeviz
+  - {prefix}.collapsed : sampled stacks as `phase;frame;...;frame count` lines for
+    flamegraph.pl, speedscope, or inferno
+
+Examples:
+    profiler = RunProfiler('ise_trustsec_export_profile', metrics=ise.metrics)
+    profiler.start()
+    ...
+    profiler.stop()
+    print(profiler.summary(), file=sys.stderr)
+
+"""
+__author__ = "Thomas Howard"
+__email__ = "thomas@cisco.com"
+__license__ = "MIT - https://mit-license.org/"
+
+import collections
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from tabulate import tabulate
+
+PROFILE_INTERVAL = 0.005    # seconds between stack samples
+PROFILE_TOP = 15            # functions shown in the summary
+PROFILE_PHASE_TOP = 3       # hot functions shown per phase
+PROFILE_NO_PHASE = 'other'  # the label of samples outside of any phase
+PROFILE_IO_WAIT = ['select.', 'GetQueuedCompletionStatus']  # builtin selector calls where the event loop waits for I/O
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def is_io_wait (function:tuple) -> bool :
+    """
+    Returns True for a builtin selector function in which the event loop waits for I/O.
+    @function : a pstats (filename, line, name) function key
+    """
+    return function[0] == '~' and any(name in function[2] for name in PROFILE_IO_WAIT)
+
+
+def frame_name (code) -> str :
+    """
+    Returns the `module:function` name of a code object for a collapsed stack.
+    """
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}".replace(';', ':').replace(' ', '_')
+
+
+class RunProfiler :
+    """
+    A cProfile and stack sampling profiler of one run with phase labels from a Metrics.
+    """
+
+    def __init__ (self, prefix:str, metrics=None, interval:float=PROFILE_INTERVAL) :
+        """
+        @prefix : the output filename prefix for `{prefix}.pstats` and `{prefix}.collapsed`
+        @metrics : the Metrics with the running phases to label the samples
+        @interval : the seconds between stack samples
+        """
+        self.prefix = prefix
+        self.metrics = metrics
+        self.interval = interval
+        self.profile = cProfile.Profile()
+        self.stacks = collections.Counter()     # {collapsed stack : samples}
+        self.phase_samples = collections.Counter()  # {phase : samples}
+        self.phase_leaves = collections.defaultdict(collections.Counter)  # {phase : {leaf frame : samples}}
+        self.stopping = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, name='profiler', daemon=True)
+        self.main_thread = threading.main_thread().ident
+
+
+    def start (self) :
+        """
+        Start profiling the current thread and sampling all threads.
+        """
+        (self.started, self.cpu_started) = (time.perf_counter(), time.process_time())
+        self.sampler.start()
+        self.profile.enable()
+
+
+    def stop (self) :
+        """
+        Stop profiling and write the pstats and collapsed stack files.
+        """
+        self.profile.disable()
+        self.stopping.set()
+        self.sampler.join()
+        (self.seconds, self.cpu_seconds) = (time.perf_counter() - self.started, time.process_time() - self.cpu_started)
+        self.stats = pstats.Stats(self.profile)
+        self.profile.dump_stats(self.prefix+'.pstats')
+        with open(self.prefix+'.collapsed', 'w') as fh :
+            for (stack, samples) in sorted(self.stacks.items()) :
+                fh.write(f"{stack} {samples}\n")
+
+
+    def sample (self) :
+        """
+        Sample the stacks of the main thread and of the threads running repository code until stopped.
+        """
+        sampler = threading.get_ident()
+        names = { thread.ident : thread.name for thread in threading.enumerate() }
+        while not self.stopping.wait(self.interval) :
+            active = list(self.metrics.active) if self.metrics else []
+            for (thread_id, frame) in sys._current_frames().items() :
+                if thread_id == sampler : continue
+                phase = self.phase(active, thread_id)
+                (stack, repo_code) = ([], False)
+                while frame is not None :
+                    stack.append(frame_name(frame.f_code))
+                    repo_code = repo_code or frame.f_code.co_filename.startswith(REPO_DIR)
+                    frame = frame.f_back
+                if thread_id != self.main_thread :
+                    if not repo_code : continue     # idle pool and library threads
+                    if thread_id not in names : names = { thread.ident : thread.name for thread in threading.enumerate() }
+                    stack.append(f"thread:{names.get(thread_id, thread_id)}".replace(' ', '_'))
+                stack.append(phase)
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.phase_samples[phase] += 1
+                self.phase_leaves[phase][stack[0]] += 1
+
+
+    @staticmethod
+    def phase (active:list, thread_id:int) -> str :
+        """
+        Returns the label of the phase most recently started in the thread, else of any running phase.
+        @active : the (phase, thread id) of the running phases
+        @thread_id : the sampled thread id
+        """
+        phases = [ name for (name, id) in active if id == thread_id ] or [ name for (name, id) in active ]
+        return (phases[-1] if phases else PROFILE_NO_PHASE).replace(' ', '_')
+
+
+    def io_wait (self) -> float :
+        """
+        Returns the seconds the event loop waited in the selector for network I/O.
+        """
+        return sum(stat[2] for (function, stat) in self.stats.stats.items() if is_io_wait(function))
+
+
+    def summary (self) -> str :
+        """
+        Returns the I/O wait and CPU split, the samples and hot functions per phase, and the top functions.
+        """
+        io_wait = self.io_wait()
+        lines = [
+            f"\nⓘ Profile: {self.seconds:.3f} seconds, {io_wait:.3f} waiting for I/O ({100 * io_wait / self.seconds:.0f}%), "
+            f"{max(0, self.seconds - io_wait):.3f} running in the event loop, {self.cpu_seconds:.3f} CPU seconds in all threads",
+        ]
+
+        total = sum(self.phase_samples.values()) or 1
+        phases = [ {'phase':phase, 'samples':samples, '%':100 * samples / total,
+                    'hot functions':', '.join(f"{leaf} ({n})" for leaf, n in self.phase_leaves[phase].most_common(PROFILE_PHASE_TOP))}
+                   for (phase, samples) in self.phase_samples.most_common() ]
+        if phases :
+            lines.append(tabulate(phases, headers='keys', tablefmt='simple_grid', floatfmt='.1f'))
+
+        top = sorted(((function, stat) for function, stat in self.stats.stats.items() if not is_io_wait(function)), key=lambda fs: fs[1][2], reverse=True)[:PROFILE_TOP]
+        functions = [ {'function':pstats.func_std_string((os.path.basename(function[0]),) + function[1:]), 'calls':stat[1], 'tottime':stat[2], 'cumtime':stat[3]}
+                      for (function, stat) in top ]
+        lines.append(tabulate(functions, headers='keys', tablefmt='simple_grid', floatfmt='.3f'))
+        lines.append(f"ⓘ Profile: {self.prefix}.pstats {self.prefix}.collapsed")
+        return '\n'.join(lines)